@@ -1,43 +1,93 @@
-from flask import request, jsonify
-from services import prompt_service, journal_service, conversation_service, persona_entry, utils
+from flask import request, jsonify, Response, stream_with_context, g
+from services import prompt_service, journal_service, conversation_service, persona_entry, utils, context_service, bulk_ingest, summary_queue, metrics
 
 
 from services.journal_service import analyze_store_and_embed_journal
 
 from services.persona_entry import store_persona_entry,get_persona_by_user_id
-from services.hybrid_search import hybrid_search
-from services.create_embedding import get_embedding
-from services.metadata_extraction import extract_metadata
+from services.hybrid_search import search_journals, search_journals_batch
+from services.create_embedding import get_embedding, get_embeddings
+from services.query_metadata import extract_query_metadata
 from datetime import datetime
+import logging
+import time
+import json
+import config
 
+logger = logging.getLogger(__name__)
 
 
 def register_routes(app):
 
+    # ------------------- Request metrics -------------------
+    @app.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get("request_start")
+        if start is not None:
+            # Route templates, not raw paths, so label values stay bounded
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, method=request.method, route=route, status=response.status_code
+            )
+        return response
+
     # ------------------- Store Journal -------------------
     @app.route("/store_journal", methods=["POST"])
     def store_journal_api():
         try:
             data = request.get_json()
-            status = analyze_store_and_embed_journal(data)
+            # Retries carry the same Idempotency-Key header (or body idempotency_key);
+            # without one the journal text itself deduplicates
+            status = analyze_store_and_embed_journal(data, idempotency_key=request.headers.get("Idempotency-Key"))
             if status[1] == 200:
-                return jsonify({"status": "success", "message": "Journal saved successfully"}), 200
+                return jsonify({
+                    "status": "success",
+                    "message": "Journal saved successfully",
+                    "journal_id": status[0]["journal_id"],
+                    "duplicate": status[0]["duplicate"]
+                }), 200
             else:
                 return jsonify({"status": "error", "message": status[0].get('error')}), status[1]
 
         except ValueError as ve:
             return jsonify({"status": "error", "message": str(ve)}), 400
         except Exception as e:
-            print(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
 
+    # ------------------- Bulk Store Journals (NDJSON) -------------------
+    @app.route("/store_journals_bulk", methods=["POST"])
+    def store_journals_bulk_api():
+        """
+        Body: one JSON journal per line ({"user_id", "journal_text", "created_at"?}).
+        Optional ?user_id= applies to lines without one.
+        Streams one NDJSON status line per entry, then a summary line.
+        """
+        default_user_id = request.args.get("user_id")
+
+        def generate():
+            try:
+                for status in bulk_ingest.ingest_journals(request.stream, default_user_id=default_user_id):
+                    yield json.dumps(status) + "\n"
+            except Exception as e:
+                logger.exception("Internal server error: %s", e)
+                yield json.dumps({"status": "error", "message": "Internal server error"}) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
     # ------------------- Therapist Chat -------------------
     @app.route("/therapist", methods=["POST"])
     def therapist_api():
+        if request.args.get("stream") in ("1", "true"):
+            return therapist_stream_api()
         try:
             data = request.get_json()
-            print("DEBUG: Incoming JSON:", data)  # 👈 Add debug
 
             user_id = data.get("user_id")
             query = data.get("query")
@@ -46,55 +96,107 @@ def register_routes(app):
             if not user_id or not query:
                 return jsonify({"status": "error", "message": "user_id and query are required"}), 400
 
-            # --- Fetch user context (persona + journal summaries) ---
-            conversation_summaries = conversation_service.get_latest_n_summaries(user_id, n=3)
-
-            print("DEBUG: fetched conversation summaries: ", conversation_summaries)
-
-            persona = get_persona_by_user_id(user_id)
-
-
-
-            # Step 1: Convert query to embedding
-            query_embedding = get_embedding(query)
-
-            # Step 2: Extract metadata from query
-            metadata_filters = extract_metadata(query)
-
-            # Step 3: Hybrid search
-            journal_ids = hybrid_search(
-                user_id=user_id,
-                query_embedding=query_embedding,
-                metadata_filters=metadata_filters,
-                top_k=top_k
-            )
-
-            journal_summaries = journal_service.fetch_summaries_and_metadata(user_id, journal_ids)
-
-            print("DEBUG: journal summaries: ", journal_summaries)
-
-            # --- Construct prompt ---
-            prompt = prompt_service.construct_prompt(query, persona, journal_summaries, conversation_summaries)
-
-            print("prompt provided to gemini: ",prompt)
+            # --- Fetch user context (persona + journal summaries), independent calls run concurrently ---
+            context = context_service.gather_therapist_context(user_id, query, top_k=top_k, n_summaries=3)
+            persona = context["persona"]
+            journal_summaries = context["journal_summaries"]
+            conversation_summaries = context["conversation_summaries"]
 
+            # --- Construct prompt (compact, token-budgeted; static prefix is cacheable) ---
+            combined = config.THERAPIST_COMBINED_SUMMARY
+            prompt = prompt_service.build_prompt(query, persona, journal_summaries, conversation_summaries,
+                                                 combined=combined)
+            # sizes only: queries, journals and prompts are never logged
+            logger.debug("therapist user=%s journals=%s conversations=%s prompt_tokens=%s",
+                         user_id, len(journal_summaries), len(conversation_summaries), prompt["tokens"]["total"])
 
             # --- Call Gemini 2.5 Flash ---
-            answer = prompt_service.call_gemini(prompt)
+            timings = context["timings"]
+            start = time.perf_counter()
+            if combined:
+                # reply + turn summary/metadata in one call: the turn is not sent to Gemini again
+                answer, turn_summary = prompt_service.call_gemini_turn(prompt["context"], prefix=prompt["prefix"])
+            else:
+                answer, turn_summary = prompt_service.call_gemini(prompt["context"], prefix=prompt["prefix"]), None
+            timings["gemini"] = round((time.perf_counter() - start) * 1000, 2)
 
             #summarize and store the response
-            summary_id = conversation_service.summarize_and_store_conversation(user_id, query, answer)
+            start = time.perf_counter()
+            summary_id = conversation_service.record_turn(user_id, query, answer, summary=turn_summary)
+            timings["conversation_summary"] = round((time.perf_counter() - start) * 1000, 2)
+            metrics.observe_stages("/therapist", timings)
 
             return jsonify({
                 "status": "success",
                 "response": answer,
-                "prompt_used": prompt
+                "prompt_used": prompt["text"],
+                "prompt_tokens": prompt["tokens"],
+                "timings_ms": timings
             }), 200
 
         except Exception as e:
-            print(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
+    # ------------------- AI Therapist (streaming, Server-Sent Events) -------------------
+    @app.route("/therapist/stream", methods=["POST"])
+    def therapist_stream_api():
+        """
+        Same input as /therapist; the reply is streamed as SSE:
+          event: token  data: {"text": "..."}   (one per Gemini chunk)
+          event: done   data: {"status": "success", "timings_ms": {..., "ttft": ...}, "prompt_tokens": {...}}
+          event: error  data: {"status": "error", "message": "..."}
+        The conversation turn is recorded after the final chunk.
+        """
+        request_start = time.perf_counter()
+        data = request.get_json()
+        user_id = data.get("user_id")
+        query = data.get("query")
+        top_k = data.get("top_k", 5)
+
+        if not user_id or not query:
+            return jsonify({"status": "error", "message": "user_id and query are required"}), 400
+
+        def sse(event, payload):
+            return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+        def generate():
+            try:
+                context = context_service.gather_therapist_context(user_id, query, top_k=top_k, n_summaries=3)
+                prompt = prompt_service.build_prompt(
+                    query, context["persona"], context["journal_summaries"], context["conversation_summaries"]
+                )
+                timings = context["timings"]
+
+                chunks = []
+                start = time.perf_counter()
+                for text in prompt_service.stream_gemini(prompt["context"], prefix=prompt["prefix"]):
+                    if not chunks:
+                        # time to first token: from the Gemini call and from the request arriving
+                        timings["gemini_ttft"] = round((time.perf_counter() - start) * 1000, 2)
+                        timings["ttft"] = round((time.perf_counter() - request_start) * 1000, 2)
+                    chunks.append(text)
+                    yield sse("token", {"text": text})
+                timings["gemini"] = round((time.perf_counter() - start) * 1000, 2)
+
+                start = time.perf_counter()
+                conversation_service.record_turn(user_id, query, "".join(chunks))
+                timings["conversation_summary"] = round((time.perf_counter() - start) * 1000, 2)
+                timings["request_total"] = round((time.perf_counter() - request_start) * 1000, 2)
+                metrics.observe_stages("/therapist/stream", timings)
+                logger.info("therapist stream timings for user %s: %s", user_id, timings)
+
+                yield sse("done", {"status": "success", "timings_ms": timings, "prompt_tokens": prompt["tokens"]})
+            except Exception as e:
+                logger.exception("Internal server error: %s", e)
+                yield sse("error", {"status": "error", "message": "Internal server error"})
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
     # ------------------- Query Journals -------------------
     # @app.route("/query_journals", methods=["POST"])
     # def query_journals_api():
@@ -117,7 +219,7 @@ def register_routes(app):
         except ValueError as ve:
             return jsonify({"status": "error", "message": str(ve)}), 400
         except Exception as e:
-            print(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
 # ------------------- Get Persona by User ID -------------------
@@ -138,7 +240,7 @@ def register_routes(app):
                 return jsonify({"status": "error", "message": "Persona not found"}), 404
 
         except Exception as e:
-            print(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
     # ------------------- Get Summary+Metadata by User ID and Journal IDs -------------------
@@ -163,9 +265,57 @@ def register_routes(app):
             return jsonify({"status": "success", "data": summary_data}), 200
 
         except Exception as e:
-            print(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
             
+    # ------------------- Timeline Listing (keyset pagination) -------------------
+    def _list_args() -> dict:
+        moods = request.args.get("mood")
+        return {
+            "limit": request.args.get("limit"),
+            "cursor": request.args.get("cursor"),
+            "start_date": request.args.get("start_date"),
+            "end_date": request.args.get("end_date"),
+            "moods": [m.strip() for m in moods.split(",")] if moods else None
+        }
+
+    @app.route("/list_journals", methods=["GET"])
+    def list_journals_api():
+        """
+        Query: user_id, limit?, cursor? (next_cursor of the previous page), start_date?, end_date?,
+        mood? (comma-separated). Newest first.
+        """
+        try:
+            user_id = request.args.get("user_id")
+            if not user_id:
+                return jsonify({"status": "error", "message": "user_id is required"}), 400
+
+            page = journal_service.list_journals(user_id, **_list_args())
+            return jsonify({"status": "success", "data": page["items"], "next_cursor": page["next_cursor"]}), 200
+
+        except ValueError as ve:
+            return jsonify({"status": "error", "message": str(ve)}), 400
+        except Exception as e:
+            logger.exception("Internal server error: %s", e)
+            return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+    @app.route("/list_conversations", methods=["GET"])
+    def list_conversations_api():
+        """Same parameters as /list_journals, over the stored conversation summaries."""
+        try:
+            user_id = request.args.get("user_id")
+            if not user_id:
+                return jsonify({"status": "error", "message": "user_id is required"}), 400
+
+            page = conversation_service.list_conversations(user_id, **_list_args())
+            return jsonify({"status": "success", "data": page["items"], "next_cursor": page["next_cursor"]}), 200
+
+        except ValueError as ve:
+            return jsonify({"status": "error", "message": str(ve)}), 400
+        except Exception as e:
+            logger.exception("Internal server error: %s", e)
+            return jsonify({"status": "error", "message": "Internal server error"}), 500
+
     # ------------------- Hybrid Search -------------------
     @app.route("/search_journal", methods=["POST"])
     def search_journal_api():
@@ -182,21 +332,105 @@ def register_routes(app):
             query_embedding = get_embedding(query)
 
             # Step 2: Extract metadata from query
-            metadata_filters = extract_metadata(query)
+            metadata_filters = extract_query_metadata(query, user_id)
 
-            # Step 3: Hybrid search
-            results = hybrid_search(
+            # Step 3: Hybrid search (single SQL query, fused scores)
+            matches = search_journals(
                 user_id=user_id,
                 query_embedding=query_embedding,
                 metadata_filters=metadata_filters,
-                top_k=top_k
+                top_k=top_k,
+                query=query
+            )
+
+            return jsonify({
+                "status": "success",
+                "results": [m["journal_id"] for m in matches],
+                "matches": [
+                    {"journal_id": m["journal_id"], "score": m["score"], "similarity": m["similarity"]}
+                    for m in matches
+                ]
+            }), 200
+
+        except Exception as e:
+            logger.exception("Internal server error: %s", e)
+            return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+    # ------------------- Batch Hybrid Search -------------------
+    @app.route("/search_journal_batch", methods=["POST"])
+    def search_journal_batch_api():
+        """
+        Body: {"user_id", "queries": [str, ...], "top_k"?}
+        All queries are embedded in one batch and searched in one SQL statement.
+        """
+        try:
+            data = request.get_json()
+            user_id = data.get("user_id")
+            queries = data.get("queries")
+            top_k = data.get("top_k", 5)
+
+            if not user_id or not queries or not isinstance(queries, list) \
+                    or not all(isinstance(q, str) and q.strip() for q in queries):
+                return jsonify({"status": "error", "message": "user_id and a list of non-empty queries are required"}), 400
+            if len(queries) > config.SEARCH_BATCH_MAX_QUERIES:
+                return jsonify({
+                    "status": "error",
+                    "message": f"At most {config.SEARCH_BATCH_MAX_QUERIES} queries per request"
+                }), 400
+
+            # Step 1: Embed every query in one batch (cached ones are skipped)
+            query_embeddings = get_embeddings(queries)
+
+            # Step 2: Extract metadata per query (local + cached; Gemini fallbacks run concurrently)
+            metadata_filters = list(context_service.executor.map(
+                lambda q: extract_query_metadata(q, user_id), queries
+            ))
+
+            # Step 3: One SQL statement for all queries
+            batches = search_journals_batch(
+                user_id=user_id,
+                query_embeddings=query_embeddings,
+                metadata_filters=metadata_filters,
+                top_k=top_k,
+                queries=queries
             )
 
             return jsonify({
                 "status": "success",
-                "results": results
+                "results": [
+                    {
+                        "query": query,
+                        "results": [m["journal_id"] for m in matches],
+                        "matches": [
+                            {"journal_id": m["journal_id"], "score": m["score"], "similarity": m["similarity"]}
+                            for m in matches
+                        ]
+                    }
+                    for query, matches in zip(queries, batches)
+                ]
             }), 200
 
         except Exception as e:
-            print(f"Internal server error: {str(e)}")
+            logger.exception("Internal server error: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+    # ------------------- Cache / Pool Stats -------------------
+    @app.route("/cache_stats", methods=["GET"])
+    def cache_stats_api():
+        from services import context_cache, embedding_cache, query_metadata, search_cache, user_vector_index
+        from services.db_connection import pool_stats
+        return jsonify({
+            "status": "success",
+            "context_cache": context_cache.stats(),
+            "embedding_cache": embedding_cache.stats(),
+            "query_metadata": query_metadata.cache_stats(),
+            "vector_index": user_vector_index.stats(),
+            "search_cache": search_cache.stats(),
+            "summary_queue": summary_queue.stats(),
+            "db_pool": pool_stats(),
+        }), 200
+
+    # ------------------- Prometheus Metrics -------------------
+    @app.route("/metrics", methods=["GET"])
+    def metrics_api():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,280 @@
+# asgi.py
+"""
+Async serving mode: the same API as main.py, served by an ASGI server.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8081
+
+The request paths that wait on the network (/therapist, /therapist/stream, /search_journal,
+/search_journal_batch, /get_persona) are native coroutines built on Firestore's AsyncClient,
+Vertex's generate_content_async / get_embeddings_async and asyncpg, so an instance holds
+hundreds of in-flight Gemini calls instead of one per gunicorn thread. Every other route is
+served by the Flask app from main.py, mounted below them (one worker thread per request), so
+both modes answer the same requests the same way.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+# Logging, summary workers and client warm-up are set up by main.py
+from main import app as flask_app
+from services import async_db, context_service, conversation_service, metrics, prompt_service
+from services.create_embedding import get_embedding_async, get_embeddings_async
+from services.hybrid_search import search_journals_async, search_journals_batch_async
+from services.persona_entry import get_persona_by_user_id_async
+from services.query_metadata import extract_query_metadata
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({"status": "error", "message": message}, status_code=status)
+
+
+def _internal_error(e: Exception) -> JSONResponse:
+    logger.exception("Internal server error: %s", e)
+    return _error("Internal server error", 500)
+
+
+def _timed_route(path: str, handler, methods: list) -> Route:
+    """Route whose latency is recorded like the Flask routes' (time to the response headers)."""
+    async def endpoint(request):
+        start = time.perf_counter()
+        response = await handler(request)
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=path, status=response.status_code
+        )
+        return response
+    return Route(path, endpoint, methods=methods)
+
+
+def _match(m: dict) -> dict:
+    return {"journal_id": m["journal_id"], "score": m["score"], "similarity": m["similarity"]}
+
+
+# ------------------- Therapist Chat -------------------
+async def therapist(request):
+    if request.query_params.get("stream") in ("1", "true"):
+        return await therapist_stream(request)
+    try:
+        data = await request.json()
+
+        user_id = data.get("user_id")
+        query = data.get("query")
+        top_k = data.get("top_k", 5)
+
+        if not user_id or not query:
+            return _error("user_id and query are required", 400)
+
+        context = await context_service.gather_therapist_context_async(user_id, query, top_k=top_k, n_summaries=3)
+        journal_summaries = context["journal_summaries"]
+        conversation_summaries = context["conversation_summaries"]
+
+        combined = config.THERAPIST_COMBINED_SUMMARY
+        prompt = prompt_service.build_prompt(query, context["persona"], journal_summaries, conversation_summaries,
+                                             combined=combined)
+        logger.debug("therapist user=%s journals=%s conversations=%s prompt_tokens=%s",
+                     user_id, len(journal_summaries), len(conversation_summaries), prompt["tokens"]["total"])
+
+        timings = context["timings"]
+        start = time.perf_counter()
+        if combined:
+            answer, turn_summary = await prompt_service.call_gemini_turn_async(prompt["context"], prefix=prompt["prefix"])
+        else:
+            answer, turn_summary = await prompt_service.call_gemini_async(prompt["context"], prefix=prompt["prefix"]), None
+        timings["gemini"] = round((time.perf_counter() - start) * 1000, 2)
+
+        start = time.perf_counter()
+        await asyncio.to_thread(conversation_service.record_turn, user_id, query, answer, turn_summary)
+        timings["conversation_summary"] = round((time.perf_counter() - start) * 1000, 2)
+        metrics.observe_stages("/therapist", timings)
+
+        return JSONResponse({
+            "status": "success",
+            "response": answer,
+            "prompt_used": prompt["text"],
+            "prompt_tokens": prompt["tokens"],
+            "timings_ms": timings
+        })
+
+    except Exception as e:
+        return _internal_error(e)
+
+
+async def therapist_stream(request):
+    """Same SSE events as apis.therapist_stream_api (token*, then done or error)."""
+    request_start = time.perf_counter()
+    data = await request.json()
+    user_id = data.get("user_id")
+    query = data.get("query")
+    top_k = data.get("top_k", 5)
+
+    if not user_id or not query:
+        return _error("user_id and query are required", 400)
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    async def generate():
+        try:
+            context = await context_service.gather_therapist_context_async(user_id, query, top_k=top_k, n_summaries=3)
+            prompt = prompt_service.build_prompt(
+                query, context["persona"], context["journal_summaries"], context["conversation_summaries"]
+            )
+            timings = context["timings"]
+
+            chunks = []
+            start = time.perf_counter()
+            async for text in prompt_service.stream_gemini_async(prompt["context"], prefix=prompt["prefix"]):
+                if not chunks:
+                    timings["gemini_ttft"] = round((time.perf_counter() - start) * 1000, 2)
+                    timings["ttft"] = round((time.perf_counter() - request_start) * 1000, 2)
+                chunks.append(text)
+                yield sse("token", {"text": text})
+            timings["gemini"] = round((time.perf_counter() - start) * 1000, 2)
+
+            start = time.perf_counter()
+            await asyncio.to_thread(conversation_service.record_turn, user_id, query, "".join(chunks))
+            timings["conversation_summary"] = round((time.perf_counter() - start) * 1000, 2)
+            timings["request_total"] = round((time.perf_counter() - request_start) * 1000, 2)
+            metrics.observe_stages("/therapist/stream", timings)
+            logger.info("therapist stream timings for user %s: %s", user_id, timings)
+
+            yield sse("done", {"status": "success", "timings_ms": timings, "prompt_tokens": prompt["tokens"]})
+        except Exception as e:
+            logger.exception("Internal server error: %s", e)
+            yield sse("error", {"status": "error", "message": "Internal server error"})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ------------------- Persona -------------------
+async def get_persona(request):
+    try:
+        user_id = request.query_params.get("user_id")
+        if not user_id:
+            return _error("user_id is required", 400)
+
+        persona_data = await get_persona_by_user_id_async(user_id)
+        if persona_data:
+            return JSONResponse({"status": "success", "data": persona_data})
+        return _error("Persona not found", 404)
+
+    except Exception as e:
+        return _internal_error(e)
+
+
+# ------------------- Hybrid Search -------------------
+async def search_journal(request):
+    try:
+        data = await request.json()
+        user_id = data.get("user_id")
+        query = data.get("query")
+        top_k = data.get("top_k", 5)
+
+        if not user_id or not query:
+            return _error("user_id and query are required", 400)
+
+        query_embedding, metadata_filters = await asyncio.gather(
+            get_embedding_async(query),
+            asyncio.to_thread(extract_query_metadata, query, user_id)
+        )
+        matches = await search_journals_async(user_id, query_embedding, metadata_filters, top_k=top_k,
+                                             query=query)
+
+        return JSONResponse({
+            "status": "success",
+            "results": [m["journal_id"] for m in matches],
+            "matches": [_match(m) for m in matches]
+        })
+
+    except Exception as e:
+        return _internal_error(e)
+
+
+async def search_journal_batch(request):
+    try:
+        data = await request.json()
+        user_id = data.get("user_id")
+        queries = data.get("queries")
+        top_k = data.get("top_k", 5)
+
+        if not user_id or not queries or not isinstance(queries, list) \
+                or not all(isinstance(q, str) and q.strip() for q in queries):
+            return _error("user_id and a list of non-empty queries are required", 400)
+        if len(queries) > config.SEARCH_BATCH_MAX_QUERIES:
+            return _error(f"At most {config.SEARCH_BATCH_MAX_QUERIES} queries per request", 400)
+
+        query_embeddings, metadata_filters = await asyncio.gather(
+            get_embeddings_async(queries),
+            asyncio.gather(*(asyncio.to_thread(extract_query_metadata, q, user_id) for q in queries))
+        )
+        batches = await search_journals_batch_async(user_id, query_embeddings, list(metadata_filters), top_k=top_k,
+                                                   queries=queries)
+
+        return JSONResponse({
+            "status": "success",
+            "results": [
+                {
+                    "query": query,
+                    "results": [m["journal_id"] for m in matches],
+                    "matches": [_match(m) for m in matches]
+                }
+                for query, matches in zip(queries, batches)
+            ]
+        })
+
+    except Exception as e:
+        return _internal_error(e)
+
+
+# ------------------- App -------------------
+async def _warm_up_pool():
+    try:
+        await async_db.pool()
+    except Exception as e:
+        logger.warning("Warm-up of async_db_pool failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # asyncio.to_thread (metadata extraction, vector index loads, turn recording) runs here
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=config.ASYNC_THREADPOOL_WORKERS, thread_name_prefix="asgi-sync")
+    )
+    if config.CLIENTS_WARMUP == "sync":
+        await _warm_up_pool()
+    elif config.CLIENTS_WARMUP == "background":
+        asyncio.ensure_future(_warm_up_pool())
+    yield
+    await async_db.close()
+
+
+app = Starlette(
+    routes=[
+        _timed_route("/therapist", therapist, ["POST"]),
+        _timed_route("/therapist/stream", therapist_stream, ["POST"]),
+        _timed_route("/get_persona", get_persona, ["GET"]),
+        _timed_route("/search_journal", search_journal, ["POST"]),
+        _timed_route("/search_journal_batch", search_journal_batch, ["POST"]),
+        # everything else: the Flask routes (apis.py)
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,204 @@
+"""
+Recall / latency benchmark for pgvector ANN indexes under the per-user filter.
+
+Loads synthetic clustered embeddings into scratch tables of different sizes,
+computes exact top-k per query in numpy, then for each index configuration
+reports recall@k and p50/p99 query latency for every ef_search / probes value.
+
+python -m benchmarks.ann_benchmark
+python -m benchmarks.ann_benchmark --sizes 10000 100000 --users 50 --queries 200 --k 5 \
+    --methods none hnsw ivfflat --ef-search 20 40 80 160 --probes 1 5 10 20 --json results.json
+
+Runs against the database in config (PG_*); scratch tables are dropped unless --keep.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from services.ann_index import create_index_sql, index_name, search_settings_sql, suggested_lists
+from services.db_connection import connection
+
+DIM = 768
+SCRATCH_PREFIX = "ann_bench_"
+
+
+def synthetic_vectors(rng, n: int, n_clusters: int = 64) -> np.ndarray:
+    """Unit vectors around random centroids; journal embeddings cluster by topic the same way."""
+    centroids = rng.standard_normal((n_clusters, DIM)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n)
+    vectors = centroids[labels] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def user_assignment(rng, n: int, n_users: int) -> np.ndarray:
+    """Zipf-like skew: a few heavy journalers own most of the rows."""
+    weights = 1.0 / np.arange(1, n_users + 1)
+    return rng.choice(n_users, size=n, p=weights / weights.sum())
+
+
+def load_table(table: str, vectors: np.ndarray, users: np.ndarray):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute(f"""
+                CREATE TABLE {table} (
+                    id SERIAL PRIMARY KEY,
+                    journal_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    embedding vector({DIM})
+                )
+            """)
+            rows = [(f"j{i}", f"u{users[i]}", vectors[i]) for i in range(len(vectors))]
+            for start in range(0, len(rows), 5000):
+                execute_values(cur, f"INSERT INTO {table} (journal_id, user_id, embedding) VALUES %s",
+                               rows[start:start + 5000])
+            cur.execute(f"CREATE INDEX ON {table} (user_id)")
+            cur.execute(f"ANALYZE {table}")
+        conn.commit()
+
+
+def build_index(table: str, method: str, args, n_rows: int) -> float:
+    if method == "none":
+        return 0.0
+    start = time.perf_counter()
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET maintenance_work_mem = '1GB'")
+            cur.execute(create_index_sql(table, method, m=args.m, ef_construction=args.ef_construction,
+                                         lists=args.lists or suggested_lists(n_rows), concurrently=False))
+            cur.execute(f"ANALYZE {table}")
+        conn.commit()
+    return time.perf_counter() - start
+
+
+def drop_indexes(table: str):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            for method in ("hnsw", "ivfflat"):
+                cur.execute(f"DROP INDEX IF EXISTS {index_name(table, method)}")
+        conn.commit()
+
+
+def exact_top_k(vectors: np.ndarray, users: np.ndarray, queries: list, k: int) -> list:
+    """Ground truth: cosine top-k within the query's user, computed in numpy."""
+    truth = []
+    for user, q in queries:
+        idx = np.flatnonzero(users == user)
+        sims = vectors[idx] @ q
+        top = idx[np.argsort(-sims)[:k]]
+        truth.append({f"j{i}" for i in top})
+    return truth
+
+
+def run_queries(table: str, queries: list, truth: list, k: int, settings: str, iterative_scan: str) -> dict:
+    sql = settings + f"""
+        SELECT journal_id FROM {table}
+        WHERE user_id = %s
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+    """
+    latencies = []
+    recalls = []
+    with connection() as conn:
+        with conn.cursor() as cur:
+            if iterative_scan:
+                cur.execute(search_settings_sql(iterative_scan=iterative_scan))
+            for (user, q), expected in zip(queries, truth):
+                literal = "[" + ",".join(repr(float(x)) for x in q) + "]"
+                start = time.perf_counter()
+                cur.execute(sql, (f"u{user}", literal, k))
+                found = {r[0] for r in cur.fetchall()}
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+        conn.rollback()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def benchmark(args) -> list:
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    for size in args.sizes:
+        table = f"{SCRATCH_PREFIX}{size}"
+        vectors = synthetic_vectors(rng, size)
+        users = user_assignment(rng, size, args.users)
+        print(f"Loading {size} rows into {table} ...")
+        load_table(table, vectors, users)
+
+        # Queries come from the users' own rows, perturbed, so heavy and light users are both sampled
+        owners = rng.choice(users, size=args.queries)
+        queries = []
+        for user in owners:
+            base = vectors[rng.choice(np.flatnonzero(users == user))]
+            q = base + 0.3 * rng.standard_normal(DIM).astype(np.float32)
+            queries.append((int(user), q / np.linalg.norm(q)))
+        truth = exact_top_k(vectors, users, queries, args.k)
+
+        try:
+            for method in args.methods:
+                drop_indexes(table)
+                build_s = build_index(table, method, args, size)
+                if method == "hnsw":
+                    sweep = [("ef_search", v, search_settings_sql(ef_search=v)) for v in args.ef_search]
+                elif method == "ivfflat":
+                    sweep = [("probes", v, search_settings_sql(probes=v)) for v in args.probes]
+                else:
+                    sweep = [(None, None, "")]
+
+                for knob, value, settings in sweep:
+                    stats = run_queries(table, queries, truth, args.k, settings,
+                                        args.iterative_scan if method != "none" else None)
+                    row = {"rows": size, "method": method, "knob": knob, "value": value,
+                           "build_s": round(build_s, 2), **stats}
+                    results.append(row)
+                    print(f"{size:>9} {method:>8} {knob or '-':>10} {value if value is not None else '-':>5} "
+                          f"recall@{args.k}={row['recall']:.4f} p50={row['p50_ms']:.2f}ms "
+                          f"p99={row['p99_ms']:.2f}ms build={row['build_s']}s")
+        finally:
+            if not args.keep:
+                with connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(f"DROP TABLE IF EXISTS {table}")
+                    conn.commit()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pgvector ANN recall/latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--methods", nargs="+", default=["none", "hnsw", "ivfflat"],
+                        choices=["none", "hnsw", "ivfflat"])
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[20, 40, 80, 160])
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--iterative-scan", default="relaxed_order",
+                        help="pgvector >= 0.8 iterative scan mode; pass '' for older versions")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Also write results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch tables")
+    args = parser.parse_args()
+
+    results = benchmark(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,730 @@
+"""
+Deterministic local stand-ins for Vertex AI, Firestore and Postgres.
+
+They expose exactly the calls the services make, so the real service code (prompt
+building, serialization, ranking, caches, the connection pool) runs unchanged:
+- HashEmbeddingModel: hashed bag-of-words vectors (texts sharing words are similar)
+- ScriptedGemini: canned replies chosen by prompt type, with configurable latency
+- FakeFirestore: in-memory documents, queries, projections, get_all and batches
+- MemoryVectorStore: journal/conversation embeddings kept in memory; searches run
+  through the in-process vector index tier (services/user_vector_index.py)
+- fake_postgres_driver(): psycopg2.connect replacement for ConnectionPool benchmarks
+Each also has the async calls used by asgi.py (get_embeddings_async, generate_content_async,
+FakeFirestore.async_view() for firestore.AsyncClient), sleeping with asyncio instead.
+
+install() wires the first four in through services.clients.override(). Every latency is
+a plain attribute, so a benchmark can seed data with zero latency and then turn it up.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import config
+from services import clients, embedding_store, user_vector_index
+
+DIM = 768
+
+PEOPLE = ["Priya", "Mom", "Dad", "Alex", "Jordan", "Sam", "Maya", "Leo"]
+MOODS = ["happy", "anxious", "calm", "sad", "hopeful", "frustrated"]
+EMOTIONS = ["joy", "stress", "gratitude", "worry", "relief", "anger", "pride", "loneliness"]
+TAGS = ["work", "presentation", "running", "family", "sleep", "friends", "reading", "travel", "cooking", "therapy"]
+STRESS = ["low", "medium", "high"]
+
+
+def _sleep_ms(ms: float):
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+async def _async_sleep_ms(ms: float):
+    if ms > 0:
+        await asyncio.sleep(ms / 1000)
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+def _pick(options: list, seed: int, n: int) -> list:
+    """n distinct items of options, chosen by seed."""
+    indexes = np.random.default_rng(seed).choice(len(options), size=min(n, len(options)), replace=False)
+    return [options[i] for i in sorted(indexes)]
+
+
+def _mentioned(text: str, options: list) -> list:
+    lowered = text.lower()
+    return [o for o in options if re.search(rf"\b{re.escape(o.lower())}\b", lowered)]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ---------------- VERTEX: EMBEDDINGS ----------------
+class _Embedding:
+    def __init__(self, values: list):
+        self.values = values
+
+
+class HashEmbeddingModel:
+    """
+    TextEmbeddingModel stand-in. Each word maps to a fixed pseudo-random unit vector
+    (seeded by its SHA-256); a text is the normalized sum of its words' vectors.
+    """
+
+    def __init__(self, dim: int = DIM, latency_ms: float = 0, per_text_ms: float = 0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.calls = 0
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def _word(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            vector = np.random.default_rng(_digest(word)).standard_normal(self.dim).astype(np.float32)
+            with self._lock:
+                self._words[word] = vector
+        return vector
+
+    def embed(self, text: str) -> list:
+        words = re.findall(r"[a-z0-9']+", text.lower()) or [""]
+        vector = np.sum([self._word(w) for w in words], axis=0)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def get_embeddings(self, texts: list) -> list:
+        with self._lock:
+            self.calls += 1
+        _sleep_ms(self.latency_ms + self.per_text_ms * len(texts))
+        return [_Embedding(self.embed(text)) for text in texts]
+
+    async def get_embeddings_async(self, texts: list) -> list:
+        with self._lock:
+            self.calls += 1
+        await _async_sleep_ms(self.latency_ms + self.per_text_ms * len(texts))
+        return [_Embedding(self.embed(text)) for text in texts]
+
+
+# ---------------- VERTEX: GEMINI ----------------
+class _Part:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Content:
+    def __init__(self, text: str):
+        self.parts = [_Part(text)] if text else []
+
+
+class _Candidate:
+    def __init__(self, text: str):
+        self.content = _Content(text)
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.cached_content_token_count = 0
+        self.candidates_token_count = output_tokens
+
+
+class FakeResponse:
+    """Shaped like a GenerationResponse: candidates[0].content.parts[0].text and usage_metadata."""
+
+    def __init__(self, text: str, usage: _Usage = None):
+        self.candidates = [_Candidate(text)]
+        self.usage_metadata = usage
+        self.text = text
+
+
+class ScriptedGemini:
+    """
+    GenerativeModel stand-in. The reply depends only on the prompt:
+    journal analysis -> analysis JSON, conversation summaries -> one object or an array of N,
+    query filters -> filters JSON, combined therapist turn -> reply + summary JSON,
+    anything else -> a therapist reply.
+
+    latency_ms is the time to the first token; per_chunk_ms is added for each streamed chunk
+    (a non-streamed call waits for all of them).
+    """
+
+    def __init__(self, latency_ms: float = 0, per_chunk_ms: float = 0, stream_chunks: int = 8):
+        self.latency_ms = latency_ms
+        self.per_chunk_ms = per_chunk_ms
+        self.stream_chunks = stream_chunks
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    # ---------------- SCRIPT ----------------
+    def reply(self, prompt: str) -> tuple:
+        """Returns (kind, text)."""
+        if "Extract search filters from this query" in prompt:
+            return "query_filters", json.dumps(self.query_filters(prompt.split("Query:", 1)[-1]))
+        if "You are analyzing a personal journal entry" in prompt:
+            text = prompt.split("Journal Entry:", 1)[-1].split("TASK:", 1)[0].strip()
+            return "journal_analysis", json.dumps(self.analyze_journal(text))
+        if "summarizing a single conversation turn" in prompt:
+            return "conversation_summary", json.dumps(self.summarize_turn(prompt))
+        match = re.search(r"summarizing (\d+) consecutive conversation turns", prompt)
+        if match:
+            turns = re.split(r"\nTurn \d+:\n", prompt)[1:]
+            return "conversation_summary", json.dumps([self.summarize_turn(t) for t in turns[:int(match.group(1))]])
+        if 'Return a JSON object with "reply"' in prompt:
+            # combined mode: reply + turn summary (prompt_service.COMBINED_TASK_INSTRUCTIONS)
+            query = prompt.split("User Query:", 1)[-1].split("TASK:", 1)[0].strip()
+            turn = self.summarize_turn(f'User: "{query}"')
+            return "therapist_turn", json.dumps(dict(turn, reply=self.therapist_reply(prompt)))
+        return "therapist", self.therapist_reply(prompt)
+
+    def analyze_journal(self, text: str) -> dict:
+        seed = _digest(text)
+        words = text.split()
+        people = (_mentioned(text, PEOPLE) or _pick(PEOPLE, seed, 1))[:3]
+        return {
+            "summary": " ".join(words[:max(8, int(len(words) * 0.6))]),
+            "metadata": {
+                "date": None,
+                "mood": MOODS[seed % len(MOODS)],
+                "people": people,
+                "tags": (_mentioned(text, TAGS) or _pick(TAGS, seed >> 4, 2))[:3],
+                "emotions": (_mentioned(text, EMOTIONS) or _pick(EMOTIONS, seed >> 12, 2))[:3],
+                "stress_level": STRESS[(seed >> 20) % len(STRESS)],
+            },
+        }
+
+    def query_filters(self, query: str) -> dict:
+        filters = {
+            "people": _mentioned(query, PEOPLE),
+            "tags": _mentioned(query, TAGS),
+            "emotions": _mentioned(query, EMOTIONS),
+        }
+        return {key: value for key, value in filters.items() if value}
+
+    def summarize_turn(self, turn_text: str) -> dict:
+        seed = _digest(turn_text)
+        user = re.search(r'User: "(.*?)"', turn_text, re.S)
+        words = (user.group(1) if user else turn_text).split()
+        return {
+            "summary": "User discussed " + " ".join(words[:30]),
+            "metadata": {
+                "mood": MOODS[seed % len(MOODS)],
+                "topics": (_mentioned(turn_text, TAGS) or _pick(TAGS, seed, 2))[:3],
+                "emotions": (_mentioned(turn_text, EMOTIONS) or _pick(EMOTIONS, seed >> 8, 2))[:3],
+                "stress_level": STRESS[(seed >> 16) % len(STRESS)],
+            },
+        }
+
+    def therapist_reply(self, prompt: str) -> str:
+        seed = _digest(prompt)
+        opener = ["That sounds like a lot to carry.", "Thank you for sharing this with me.",
+                  "It makes sense that you feel this way."][seed % 3]
+        return (
+            f"{opener} From what you have written before, small steps have helped you when things "
+            f"felt heavy, like taking a walk or talking to someone you trust. Could you try one of "
+            f"those today, even for ten minutes? It may also help to write down the one thing that "
+            f"worries you most about this and one thing you already know how to handle. "
+            f"What feels like the most manageable first step right now?"
+        )
+
+    # ---------------- GenerativeModel API ----------------
+    def _respond(self, contents) -> tuple:
+        prompt = contents if isinstance(contents, str) else json.dumps(contents, default=str)
+        kind, text = self.reply(prompt)
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        return text, _Usage(estimate_tokens(prompt), estimate_tokens(text))
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        text, usage = self._respond(contents)
+        if stream:
+            return self._stream(text, usage)
+        _sleep_ms(self.latency_ms + self.per_chunk_ms * self.stream_chunks)
+        return FakeResponse(text, usage)
+
+    async def generate_content_async(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        text, usage = self._respond(contents)
+        if stream:
+            return self._stream_async(text, usage)
+        await _async_sleep_ms(self.latency_ms + self.per_chunk_ms * self.stream_chunks)
+        return FakeResponse(text, usage)
+
+    def _chunks(self, text: str) -> list:
+        words = text.split(" ")
+        size = max(1, -(-len(words) // self.stream_chunks))
+        return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+                for i in range(0, len(words), size)]
+
+    def _stream(self, text: str, usage: _Usage):
+        chunks = self._chunks(text)
+        _sleep_ms(self.latency_ms)
+        for i, chunk in enumerate(chunks):
+            if i:
+                _sleep_ms(self.per_chunk_ms)
+            yield FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
+
+    async def _stream_async(self, text: str, usage: _Usage):
+        chunks = self._chunks(text)
+        await _async_sleep_ms(self.latency_ms)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await _async_sleep_ms(self.per_chunk_ms)
+            yield FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
+
+
+# ---------------- FIRESTORE ----------------
+def _get_field(data: dict, dotted: str):
+    value = data
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _project(data: dict, field_paths: list) -> dict:
+    """Keeps only field_paths (dotted paths select nested fields), like a Firestore projection."""
+    result = {}
+    for path in field_paths:
+        parts = path.split(".")
+        source = data
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+        if not isinstance(source, dict) or parts[-1] not in source:
+            continue
+        target = result
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy.deepcopy(source[parts[-1]])
+    return result
+
+
+def _merge(target: dict, updates: dict):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+    def get(self, field: str):
+        return _get_field(self._data or {}, field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path: tuple):
+        self._db = db
+        self._path = path
+        self.id = path[-1]
+        self.path = "/".join(path)
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self._db, self._path + (name,))
+
+    def set(self, data: dict, merge: bool = False):
+        self._db._rpc()
+        self._db._write(self._path, data, merge)
+
+    def get(self, field_paths: list = None):
+        self._db._rpc()
+        return self._db._snapshot(self._path, field_paths)
+
+
+class FakeQuery:
+    def __init__(self, db, path: tuple, orders: tuple = (), limit: int = None, fields: list = None,
+                 filters: tuple = (), after: dict = None):
+        self._db = db
+        self._path = path
+        self._orders = orders
+        self._limit = limit
+        self._fields = fields
+        self._filters = filters
+        self._after = after
+
+    def _with(self, **changes):
+        args = {"orders": self._orders, "limit": self._limit, "fields": self._fields, "filters": self._filters,
+                "after": self._after}
+        args.update(changes)
+        return FakeQuery(self._db, self._path, **args)
+
+    def order_by(self, field: str, direction: str = "ASCENDING"):
+        return self._with(orders=self._orders + ((field, direction),))
+
+    def limit(self, count: int):
+        return self._with(limit=count)
+
+    def select(self, field_paths: list):
+        return self._with(fields=list(field_paths))
+
+    def where(self, field: str, op: str, value):
+        return self._with(filters=self._filters + ((field, op, value),))
+
+    def start_after(self, values: dict):
+        """Cursor as a dict of the order_by fields' values ("__name__": document id)."""
+        return self._with(after=values)
+
+    def stream(self):
+        self._db._rpc()
+        yield from self._results()
+
+    def _results(self):
+        docs = self._db._list(self._path)
+        for field, op, value in self._filters:
+            docs = [(doc_id, data) for doc_id, data in docs if _compare(_doc_field(doc_id, data, field), op, value)]
+        # Firestore applies orderings left to right; sort by the last one first
+        for field, direction in reversed(self._orders):
+            docs.sort(key=lambda item: _order_key(_doc_field(item[0], item[1], field)),
+                      reverse=str(direction).upper().endswith("DESCENDING"))
+        if self._after is not None:
+            docs = [(doc_id, data) for doc_id, data in docs if self._is_after(doc_id, data)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            ref = FakeDocumentReference(self._db, self._path + (doc_id,))
+            yield FakeSnapshot(ref, _project(data, self._fields) if self._fields is not None else copy.deepcopy(data))
+
+    def _is_after(self, doc_id: str, data: dict) -> bool:
+        for field, direction in self._orders:
+            value, cursor = _order_key(_doc_field(doc_id, data, field)), _order_key(self._after[field])
+            if value != cursor:
+                return value < cursor if str(direction).upper().endswith("DESCENDING") else value > cursor
+        return False
+
+    def get(self):
+        return list(self.stream())
+
+
+def _doc_field(doc_id: str, data: dict, field: str):
+    return doc_id if field == "__name__" else _get_field(data, field)
+
+
+def _order_key(value):
+    # None sorts first, as in Firestore; other values compare among themselves
+    return (value is not None, value if value is not None else 0)
+
+
+def _compare(left, op: str, right) -> bool:
+    if op == "==":
+        return left == right
+    if op == "array_contains":
+        return isinstance(left, list) and right in left
+    if op == "in":
+        return left in right
+    if left is None:
+        return False
+    return {"<": left < right, "<=": left <= right, ">": left > right, ">=": left >= right}[op]
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, path: tuple):
+        super().__init__(db, path)
+        self.id = path[-1]
+
+    def document(self, document_id: str = None):
+        if document_id is None:
+            document_id = hashlib.sha1(f"{self._path}{time.time_ns()}".encode()).hexdigest()[:20]
+        return FakeDocumentReference(self._db, self._path + (document_id,))
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, data: dict, merge: bool = False):
+        self._writes.append((reference._path, copy.deepcopy(data), merge))
+
+    def commit(self):
+        self._db._rpc()
+        with self._db._lock:
+            for path, data, merge in self._writes:
+                self._db._write(path, data, merge)
+        self._writes = []
+
+
+class FakeFirestore:
+    """
+    firestore.Client stand-in holding documents in memory. Reads return deep copies, as a
+    real client deserializes fresh objects. latency_ms is added to every RPC (get, set,
+    stream, get_all, batch commit).
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.rpcs = 0
+        self._collections = {}  # collection path tuple -> {doc_id: data}
+        self._lock = threading.RLock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpcs += 1
+        _sleep_ms(self.latency_ms)
+
+    async def _rpc_async(self):
+        with self._lock:
+            self.rpcs += 1
+        await _async_sleep_ms(self.latency_ms)
+
+    def _write(self, path: tuple, data: dict, merge: bool):
+        with self._lock:
+            docs = self._collections.setdefault(path[:-1], {})
+            if merge and path[-1] in docs:
+                _merge(docs[path[-1]], data)
+            else:
+                docs[path[-1]] = copy.deepcopy(data)
+
+    def _snapshot(self, path: tuple, field_paths: list = None):
+        with self._lock:
+            data = self._collections.get(path[:-1], {}).get(path[-1])
+            if data is not None:
+                data = _project(data, field_paths) if field_paths is not None else copy.deepcopy(data)
+        return FakeSnapshot(FakeDocumentReference(self, path), data)
+
+    def _list(self, path: tuple) -> list:
+        with self._lock:
+            return list(self._collections.get(path, {}).items())
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self, (name,))
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths: list = None):
+        self._rpc()
+        for ref in references:
+            yield self._snapshot(ref._path, field_paths)
+
+    def count(self, collection_path: str) -> int:
+        """Documents in a collection, e.g. count("users/u1/journals") (for seeding checks)."""
+        return len(self._list(tuple(collection_path.split("/"))))
+
+    def async_view(self):
+        """firestore.AsyncClient stand-in over the same documents."""
+        return FakeAsyncFirestore(self)
+
+
+class _AsyncReference:
+    """Wraps a fake reference/query: builder calls stay sync, RPCs become coroutines."""
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in ("collection", "document", "order_by", "limit", "select", "where", "start_after"):
+            return lambda *args, **kwargs: _AsyncReference(attr(*args, **kwargs))
+        return attr
+
+    async def get(self, *args, **kwargs):
+        await self._target._db._rpc_async()
+        if isinstance(self._target, FakeDocumentReference):
+            return self._target._db._snapshot(self._target._path, *args, **kwargs)
+        return list(self._target._results())
+
+    async def set(self, data: dict, merge: bool = False):
+        await self._target._db._rpc_async()
+        self._target._db._write(self._target._path, data, merge)
+
+    async def stream(self):
+        await self._target._db._rpc_async()
+        for snapshot in self._target._results():
+            yield snapshot
+
+
+class FakeAsyncFirestore:
+    def __init__(self, db: FakeFirestore):
+        self._db = db
+
+    def collection(self, name: str):
+        return _AsyncReference(self._db.collection(name))
+
+
+# ---------------- POSTGRES: EMBEDDINGS ----------------
+class MemoryVectorStore:
+    """
+    journal_embeddings / conversation_embeddings held in memory with store_embeddings'
+    upsert semantics. install() replaces embedding_store.store_embeddings (and the copies
+    imported by name into other service modules) and user_vector_index's Postgres load,
+    and turns the in-process index on, so searches run through _search_local.
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.tables = {"journal_embeddings": {}, "conversation_embeddings": {}}
+        self._lock = threading.Lock()
+
+    def store_embeddings(self, rows: list, table: str = "journal_embeddings"):
+        if not rows:
+            return
+        for row in rows:
+            embedding_store._validate_embedding(row.get("embedding"))
+        rows = list({row["summary_id"]: row for row in rows}.values())
+
+        _sleep_ms(self.latency_ms)
+        with self._lock:
+            stored = self.tables[table]
+            for row in rows:
+                existing = stored.get(row["summary_id"])
+                if existing is None:
+                    stored[row["summary_id"]] = {
+                        "user_id": row["user_id"],
+                        "embedding": np.asarray(row["embedding"], dtype=np.float32),
+                        "summary": row.get("summary"),
+                        "metadata": row.get("metadata"),
+                        "created_at": user_vector_index._naive_utc(row.get("created_at")),
+                    }
+                    continue
+                existing["user_id"] = row["user_id"]
+                existing["embedding"] = np.asarray(row["embedding"], dtype=np.float32)
+                if row.get("summary") is not None:
+                    existing["summary"] = row["summary"]
+                if row.get("metadata") is not None:
+                    existing["metadata"] = row["metadata"]
+
+        if table == "journal_embeddings":
+            user_vector_index.apply_writes(rows)
+
+    def load_user(self, user_id: str):
+        """Replacement for user_vector_index._load."""
+        _sleep_ms(self.latency_ms)
+        with self._lock:
+            rows = [(journal_id, row) for journal_id, row in self.tables["journal_embeddings"].items()
+                    if row["user_id"] == user_id]
+        if len(rows) > config.VECTOR_INDEX_MAX_ROWS:
+            return None
+        if rows:
+            matrix = user_vector_index._normalize(np.vstack([row["embedding"] for _, row in rows]))
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        return user_vector_index.UserVectors(
+            ids=[journal_id for journal_id, _ in rows],
+            matrix=np.ascontiguousarray(matrix),
+            summaries=[row["summary"] for _, row in rows],
+            metadata=[row["metadata"] for _, row in rows],
+            created_at=[row["created_at"] for _, row in rows],
+        )
+
+    def install(self):
+        original = embedding_store.store_embeddings
+        for name, module in list(sys.modules.items()):
+            if name.startswith("services.") and getattr(module, "store_embeddings", None) is original:
+                module.store_embeddings = self.store_embeddings
+        user_vector_index._load = self.load_user
+        user_vector_index.invalidate()
+        config.VECTOR_INDEX_ENABLED = True
+
+
+# ---------------- POSTGRES: DRIVER ----------------
+class _FakeCursor:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        _sleep_ms(self._conn.query_ms)
+        self._conn.status = 2  # TRANSACTION_STATUS_INTRANS
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return []
+
+
+class FakePgConnection:
+    """Just enough of a psycopg2 connection for ConnectionPool (checkout, liveness check, return)."""
+
+    def __init__(self, query_ms: float = 0):
+        self.query_ms = query_ms
+        self.closed = 0
+        self.status = 0  # TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def commit(self):
+        self.status = 0
+
+    def rollback(self):
+        self.status = 0
+
+    def close(self):
+        self.closed = 1
+
+
+@contextmanager
+def fake_postgres_driver(connect_ms: float = 0, query_ms: float = 0):
+    """Makes services.db_connection open FakePgConnections (for benchmarking the pool itself)."""
+    from services import db_connection
+
+    class _Driver:
+        @staticmethod
+        def connect(**kwargs):
+            _sleep_ms(connect_ms)
+            return FakePgConnection(query_ms)
+
+    original = db_connection.psycopg2, db_connection.register_vector
+    db_connection.psycopg2 = _Driver
+    db_connection.register_vector = lambda conn: None
+    try:
+        yield
+    finally:
+        db_connection.psycopg2, db_connection.register_vector = original
+
+
+# ---------------- WIRING ----------------
+class Fakes:
+    def __init__(self, firestore, gemini, embedding_model, vector_store):
+        self.firestore = firestore
+        self.gemini = gemini
+        self.embedding_model = embedding_model
+        self.vector_store = vector_store
+
+
+def install(gemini_latency_ms: float = 0, gemini_chunk_ms: float = 0, firestore_latency_ms: float = 0,
+            embedding_latency_ms: float = 0, postgres: str = "memory") -> Fakes:
+    """
+    Points services.clients at fresh fakes. postgres="memory" also replaces the embeddings
+    tables with a MemoryVectorStore; postgres="local" leaves Postgres alone (PG_* settings).
+    Import the service modules before calling this, so their imported names get patched.
+    """
+    fakes = Fakes(
+        firestore=FakeFirestore(latency_ms=firestore_latency_ms),
+        gemini=ScriptedGemini(latency_ms=gemini_latency_ms, per_chunk_ms=gemini_chunk_ms),
+        embedding_model=HashEmbeddingModel(latency_ms=embedding_latency_ms),
+        vector_store=MemoryVectorStore() if postgres == "memory" else None,
+    )
+    clients.override(firestore=fakes.firestore, gemini=fakes.gemini, embedding_model=fakes.embedding_model,
+                     firestore_async=fakes.firestore.async_view())
+    if fakes.vector_store is not None:
+        fakes.vector_store.install()
+    return fakes
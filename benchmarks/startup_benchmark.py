@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark: time from interpreter start to the app's first response.
+
+Each run is a fresh Python process that imports main (and with it every service
+module), then serves one request through Flask's test client. Phases reported:
+- import: `import main`
+- first_response: the first request after import
+- total: process start -> first response
+
+python -m benchmarks.startup_benchmark
+python -m benchmarks.startup_benchmark --runs 10 --warmup off sync background --path /cache_stats
+python -m benchmarks.startup_benchmark --path "/get_persona?user_id=testuser-nitya"   # needs GCP credentials
+
+CLIENTS_WARMUP=sync creates every client during import, which is what the service did
+before clients became lazy; compare it with "off"/"background" for the improvement.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+client = main.app.test_client()
+response = client.get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({
+    "status": response.status_code,
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (done - imported) * 1000,
+    "total_ms": (done - start) * 1000,
+}))
+"""
+
+
+def run_once(path: str, warmup: str) -> dict:
+    env = dict(os.environ, CLIENTS_WARMUP=warmup)
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, path],
+        env=env, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-to-first-response startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", nargs="+", default=["sync", "off", "background"],
+                        choices=["sync", "off", "background"])
+    parser.add_argument("--path", default="/cache_stats", help="GET path for the first request")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.warmup:
+        runs = [run_once(args.path, mode) for _ in range(args.runs)]
+        results[mode] = {
+            "status": runs[-1]["status"],
+            **{
+                f"{phase}_median": round(statistics.median(r[phase] for r in runs), 1)
+                for phase in ("import_ms", "first_response_ms", "total_ms")
+            },
+            "total_ms_max": round(max(r["total_ms"] for r in runs), 1),
+        }
+        r = results[mode]
+        print(f"CLIENTS_WARMUP={mode:<10} import={r['import_ms_median']:>8.1f}ms "
+              f"first_response={r['first_response_ms_median']:>8.1f}ms total={r['total_ms_median']:>8.1f}ms "
+              f"(status {r['status']}, {args.runs} runs)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Offline benchmark suite: every endpoint in apis.py and the hot service functions,
+run against the deterministic stand-ins in benchmarks/fakes.py (no GCP needed).
+
+Seeds users with journals (one heavy user), personas and conversation summaries, then
+measures each stage and reports throughput and p50/p95/p99 latency. Stages:
+- service.*: prompt building, make_serializable, query metadata extraction, journal
+  search (single and batch), context gathering, embedding cache hits, summary queue
+  enqueue, connection pool checkout under contention (fake psycopg2 driver)
+- api.*: each route through Flask's test client, optionally from several threads
+
+python -m benchmarks.suite
+python -m benchmarks.suite --users 20 --journals 200 --heavy-journals 5000 --iterations 200 --concurrency 8
+python -m benchmarks.suite --profile realistic --only api.therapist        # network-like latencies
+python -m benchmarks.suite --save-baseline                                 # writes benchmarks/baseline.json
+python -m benchmarks.suite --baseline benchmarks/baseline.json --tolerance 0.25   # exit 1 on regression
+python -m benchmarks.suite --postgres local   # embeddings in the PG_* database (SQL search path)
+
+With --postgres memory (default) journal search runs through the in-process vector
+index tier (services/user_vector_index.py); the SQL path needs --postgres local.
+Compare baselines taken on the same machine with the same arguments.
+"""
+
+import os
+import tempfile
+
+# Read by config at import time: no client warm-up, quiet logs and a scratch summary queue
+os.environ.setdefault("CLIENTS_WARMUP", "off")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("SUMMARY_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="reflect_bench_"), "queue.db"))
+
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+import main
+from benchmarks import fakes
+from services import (context_service, create_embedding, db_connection, embedding_store, hybrid_search,
+                      prompt_service, query_metadata, summary_queue, utils)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# Per-call latencies of the fakes (ms). "zero" isolates our own code; "realistic" is
+# roughly what Cloud Run sees from Vertex / Firestore in the same region.
+PROFILES = {
+    "zero": {"gemini_latency_ms": 0, "gemini_chunk_ms": 0, "firestore_latency_ms": 0, "embedding_latency_ms": 0},
+    "realistic": {"gemini_latency_ms": 600, "gemini_chunk_ms": 30, "firestore_latency_ms": 8,
+                  "embedding_latency_ms": 40},
+}
+
+QUERIES = [
+    "I am stressed about my project presentation and thinking about Priya",
+    "How did running with Alex make me feel last week?",
+    "family dinner with Mom and Dad",
+    "I could not sleep again, same as last month",
+    "when did I feel gratitude at work",
+    "feeling lonely since Maya moved away",
+    "what helped with the worry before travel",
+    "reading and cooking on the weekend made me calm",
+    "angry after the meeting with Jordan yesterday",
+    "proud of finishing the therapy homework",
+]
+
+_SENTENCES = [
+    "Woke up feeling {emotion} about {tag}.",
+    "Spent the afternoon with {person} talking about {tag} and what comes next.",
+    "{person} called in the evening and it eased some of the {emotion}.",
+    "Work was busy and the {tag} kept me on edge most of the day.",
+    "Tried to fit in some {tag} before dinner, which helped more than I expected.",
+    "Noticed a lot of {emotion} when I thought about next week.",
+    "Wrote down three things I am grateful for, {person} was one of them.",
+    "Ended the day {mood} but tired, and went to bed early.",
+    "Had a long walk and kept replaying the conversation with {person}.",
+    "I want to remember that {tag} is something that grounds me.",
+]
+
+
+# ---------------- DATA ----------------
+def journal_text(rng) -> str:
+    sentences = rng.choice(len(_SENTENCES), size=int(rng.integers(6, 11)))
+    return " ".join(
+        _SENTENCES[i].format(
+            person=fakes.PEOPLE[rng.integers(len(fakes.PEOPLE))],
+            tag=fakes.TAGS[rng.integers(len(fakes.TAGS))],
+            emotion=fakes.EMOTIONS[rng.integers(len(fakes.EMOTIONS))],
+            mood=fakes.MOODS[rng.integers(len(fakes.MOODS))],
+        )
+        for i in sentences
+    )
+
+
+def load_persona() -> dict:
+    with open(os.path.join(ROOT, "persona.json")) as f:
+        return json.load(f)
+
+
+def seed(fake, args, rng) -> dict:
+    """
+    Writes journals (Firestore + embeddings), personas and conversation summaries straight to
+    the stores, bypassing Gemini. Returns {"users", "heavy_user", "journal_ids": {user: [ids]}}.
+    """
+    users = [f"bench-user-{i}" for i in range(args.users)]
+    heavy_user = "bench-user-heavy"
+    persona = load_persona()
+    now = datetime.utcnow()
+    journal_ids = {}
+
+    for user_id in users + [heavy_user]:
+        count = args.heavy_journals if user_id == heavy_user else args.journals
+        user_ref = fake.firestore.collection("users").document(user_id)
+        user_ref.collection("profile").document("persona").set({
+            "persona": persona["persona"], "persona_metadata": persona.get("persona_metadata"),
+            "created_at": now, "last_updated": now,
+        })
+
+        rows = []
+        journal_ids[user_id] = []
+        for _ in range(count):
+            text = journal_text(rng)
+            analysis = fake.gemini.analyze_journal(text)
+            journal_id = str(uuid.UUID(bytes=rng.bytes(16)))
+            created_at = now - timedelta(minutes=int(rng.integers(0, 365 * 24 * 60)))
+            user_ref.collection("journals").document(journal_id).set({
+                "journal_text": text, "summary": analysis["summary"],
+                "metadata": analysis["metadata"], "created_at": created_at,
+            })
+            rows.append({
+                "user_id": user_id, "summary_id": journal_id,
+                "embedding": fake.embedding_model.embed(analysis["summary"]),
+                "summary": analysis["summary"], "metadata": analysis["metadata"], "created_at": created_at,
+            })
+            journal_ids[user_id].append(journal_id)
+        for start in range(0, len(rows), 500):
+            embedding_store.store_embeddings(rows[start:start + 500], table="journal_embeddings")
+
+        for i in range(args.conversations):
+            text = QUERIES[int(rng.integers(len(QUERIES)))]
+            summary = fake.gemini.summarize_turn(f'User: "{text}"')
+            user_ref.collection("conversation_summary").document(f"conv-{i}").set({
+                "summary_text": summary["summary"], "metadata": summary["metadata"],
+                "user_message": text, "ai_response": fake.gemini.therapist_reply(text),
+                "created_at": now - timedelta(hours=i),
+            })
+
+    return {"users": users, "heavy_user": heavy_user, "journal_ids": journal_ids}
+
+
+def cleanup_postgres(users: list):
+    with db_connection.connection() as conn:
+        with conn.cursor() as cur:
+            for table in ("journal_embeddings", "conversation_embeddings"):
+                cur.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", (users,))
+        conn.commit()
+
+
+# ---------------- MEASUREMENT ----------------
+def measure(fn, iterations: int, concurrency: int = 1, warmup: int = 3) -> dict:
+    """Calls fn(i) `iterations` times from `concurrency` threads; latencies in ms."""
+    for i in range(warmup):
+        fn(i)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(run, range(iterations)))
+    else:
+        for i in range(iterations):
+            run(i)
+    wall = time.perf_counter() - start
+
+    values = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "n": iterations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+# ---------------- STAGES ----------------
+def service_stages(fake, data, args) -> list:
+    """(name, fn(i), iterations, concurrency) for the service functions."""
+    users = data["users"]
+    heavy = data["heavy_user"]
+    persona = load_persona()["persona"]
+    embeddings = [fake.embedding_model.embed(q) for q in QUERIES]
+    filters = [query_metadata.extract_local(q, heavy) for q in QUERIES]
+    journals = hybrid_search.hybrid_search(heavy, embeddings[0], filters[0], top_k=5, include_content=True)
+    conversations = [{"summary_text": fake.gemini.summarize_turn(f'User: "{q}"')["summary"], "metadata": {}}
+                     for q in QUERIES[:3]]
+    documents = [
+        {"journal_id": jid, "summary": "x" * 200, "metadata": {"people": ["Priya"], "tags": ["work"]},
+         "created_at": datetime.utcnow(), "nested": [{"at": datetime.utcnow()}]}
+        for jid in data["journal_ids"][heavy][:200]
+    ]
+    create_embedding.get_embedding(QUERIES[0])
+
+    pool = db_connection.ConnectionPool(
+        minconn=1, maxconn=args.pool_size, timeout=30, max_lifetime=3600, max_idle=300, check_after=30
+    )
+
+    def pool_checkout(i):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.commit()
+
+    n = args.iterations
+    return [
+        ("service.build_prompt",
+         lambda i: prompt_service.build_prompt(QUERIES[i % len(QUERIES)], persona, journals, conversations), n, 1),
+        ("service.make_serializable[200 docs]", lambda i: utils.make_serializable(documents), n, 1),
+        ("service.extract_local",
+         lambda i: query_metadata.extract_local(QUERIES[i % len(QUERIES)], heavy), n, 1),
+        (f"service.search_journals[{args.heavy_journals} rows]",
+         lambda i: hybrid_search.search_journals(heavy, embeddings[i % len(QUERIES)], filters[i % len(QUERIES)],
+                                                 top_k=5), n, 1),
+        (f"service.search_journals[{args.journals} rows]",
+         lambda i: hybrid_search.search_journals(users[i % len(users)], embeddings[i % len(QUERIES)],
+                                                 filters[i % len(QUERIES)], top_k=5), n, 1),
+        (f"service.search_journals_batch[{len(QUERIES)} queries]",
+         lambda i: hybrid_search.search_journals_batch(heavy, embeddings, filters, top_k=5), n, 1),
+        ("service.get_embedding[cached]", lambda i: create_embedding.get_embedding(QUERIES[0]), n, 1),
+        ("service.gather_therapist_context",
+         lambda i: context_service.gather_therapist_context(users[i % len(users)], QUERIES[i % len(QUERIES)]),
+         n, args.concurrency),
+        ("service.summary_queue.enqueue",
+         lambda i: summary_queue.enqueue(users[i % len(users)], QUERIES[i % len(QUERIES)], "ok"), n, 1),
+        (f"service.pool_checkout[{args.pool_size} conns, {args.pool_threads} threads]",
+         pool_checkout, n * 4, args.pool_threads),
+    ], pool
+
+
+def api_stages(data, args) -> list:
+    """(name, fn(i), iterations, concurrency) for every route in apis.py."""
+    users = data["users"]
+    heavy = data["heavy_user"]
+    local = threading.local()
+    rng_lock = threading.Lock()
+    rng = np.random.default_rng(args.seed + 1)
+    persona = load_persona()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = main.app.test_client()
+        return local.client
+
+    def text():
+        with rng_lock:
+            return journal_text(rng)
+
+    def query(i):
+        return QUERIES[i % len(QUERIES)]
+
+    def store_journal(i):
+        _ok(client().post("/store_journal", json={"user_id": f"bench-writer-{i % 4}", "journal_text": text()}))
+
+    def store_journals_bulk(i):
+        body = "\n".join(json.dumps({"user_id": f"bench-writer-{i % 4}", "journal_text": text()}) for _ in range(10))
+        response = _ok(client().post("/store_journals_bulk", data=body, content_type="application/x-ndjson"))
+        last = json.loads(response.get_data(as_text=True).strip().splitlines()[-1])
+        if last.get("status") == "error" or last.get("failed"):
+            raise RuntimeError(f"Bulk ingest reported failures: {last}")
+
+    def therapist(i):
+        _ok(client().post("/therapist", json={"user_id": users[i % len(users)], "query": query(i), "top_k": 5}))
+
+    def therapist_stream(i):
+        response = _ok(client().post("/therapist/stream",
+                                     json={"user_id": users[i % len(users)], "query": query(i), "top_k": 5}))
+        body = response.get_data(as_text=True)
+        if "event: done" not in body:
+            raise RuntimeError("Stream ended without a done event")
+
+    def get_journals_summary(i):
+        user_id = users[i % len(users)]
+        ids = data["journal_ids"][user_id][:5]
+        _ok(client().get("/get_journals_summary", query_string={"user_id": user_id, "journal_ids": ",".join(ids)}))
+
+    def list_pages(route: str, user_id: str, pages: int = 3):
+        """Follows next_cursor for a few pages, as the timeline screen scrolls."""
+        params = {"user_id": user_id, "limit": 20}
+        for _ in range(pages):
+            page = _ok(client().get(route, query_string=params)).get_json()
+            if not page["next_cursor"]:
+                break
+            params["cursor"] = page["next_cursor"]
+
+    n = args.iterations
+    c = args.concurrency
+    return [
+        ("api.store_journal", store_journal, n, c),
+        ("api.store_journals_bulk[10 entries]", store_journals_bulk, max(1, n // 5), c),
+        ("api.therapist", therapist, n, c),
+        ("api.therapist_stream", therapist_stream, n, c),
+        ("api.store_persona",
+         lambda i: _ok(client().post("/store_persona", json={**persona, "user_id": f"bench-writer-{i % 4}"})), n, c),
+        ("api.get_persona",
+         lambda i: _ok(client().get("/get_persona", query_string={"user_id": users[i % len(users)]})), n, c),
+        ("api.get_journals_summary", get_journals_summary, n, c),
+        ("api.list_journals[3 pages]", lambda i: list_pages("/list_journals", heavy), n, c),
+        ("api.list_conversations[3 pages]",
+         lambda i: list_pages("/list_conversations", users[i % len(users)]), n, c),
+        ("api.search_journal",
+         lambda i: _ok(client().post("/search_journal", json={"user_id": heavy, "query": query(i), "top_k": 5})),
+         n, c),
+        ("api.search_journal_batch[5 queries]",
+         lambda i: _ok(client().post("/search_journal_batch",
+                                     json={"user_id": heavy, "queries": [query(i + k) for k in range(5)]})), n, c),
+        ("api.cache_stats", lambda i: _ok(client().get("/cache_stats")), n, c),
+    ]
+
+
+# ---------------- REPORTING ----------------
+def print_row(name: str, r: dict):
+    print(f"{name:<48} {r['n']:>6} {r['concurrency']:>4} {r['throughput_rps']:>10.1f} "
+          f"{r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['errors']:>6}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Stages whose p95 or throughput got worse than the baseline by more than the tolerance."""
+    regressions = []
+    for name, base in baseline.get("stages", {}).items():
+        current = results["stages"].get(name)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) and current["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']}/s -> {current['throughput_rps']}/s")
+    return regressions
+
+
+def run(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    fake = fakes.install(postgres=args.postgres)
+    if args.postgres == "local":
+        from services import schema
+        schema.apply_migrations()
+
+    print(f"Seeding {args.users} users x {args.journals} journals + 1 user x {args.heavy_journals} ...")
+    start = time.perf_counter()
+    data = seed(fake, args, rng)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    # Latencies apply to the measured stages only
+    profile = PROFILES[args.profile]
+    fake.gemini.latency_ms = profile["gemini_latency_ms"]
+    fake.gemini.per_chunk_ms = profile["gemini_chunk_ms"]
+    fake.firestore.latency_ms = profile["firestore_latency_ms"]
+    fake.embedding_model.latency_ms = profile["embedding_latency_ms"]
+
+    results = {
+        "meta": {
+            "profile": args.profile, "postgres": args.postgres, "users": args.users, "journals": args.journals,
+            "heavy_journals": args.heavy_journals, "iterations": args.iterations, "concurrency": args.concurrency,
+            "python": platform.python_version(), "machine": platform.machine(),
+            "created_at": datetime.utcnow().isoformat(),
+        },
+        "stages": {},
+    }
+
+    print(f"\n{'stage':<48} {'n':>6} {'conc':>4} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6}")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        stages, pool = service_stages(fake, data, args)
+    stages += api_stages(data, args)
+    try:
+        for name, fn, iterations, concurrency in stages:
+            if args.only and not any(pattern in name for pattern in args.only):
+                continue
+            # Only the pool stage talks to the fake driver (route logs are kept out by LOG_LEVEL above)
+            driver = fakes.fake_postgres_driver(query_ms=args.pool_query_ms) \
+                if name.startswith("service.pool_checkout") else contextlib.nullcontext()
+            with driver:
+                result = measure(fn, iterations, concurrency, warmup=args.warmup)
+            results["stages"][name] = result
+            print_row(name, result)
+            if result["first_error"]:
+                print(f"    first error: {result['first_error']}")
+        results["pool_stats"] = pool.stats()
+    finally:
+        pool.closeall()
+        if args.postgres == "local":
+            cleanup_postgres(data["users"] + [data["heavy_user"]] + [f"bench-writer-{i}" for i in range(4)])
+
+    results["gemini_calls"] = dict(fake.gemini.calls)
+    results["firestore_rpcs"] = fake.firestore.rpcs
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite (fake Vertex / Firestore / Postgres)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--journals", type=int, default=200, help="Journals per user")
+    parser.add_argument("--heavy-journals", type=int, default=2000, help="Journals of the one heavy user")
+    parser.add_argument("--conversations", type=int, default=10, help="Stored conversation summaries per user")
+    parser.add_argument("--iterations", type=int, default=100, help="Calls per stage")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured calls per stage")
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads for the api.* stages")
+    parser.add_argument("--pool-size", type=int, default=config.PG_POOL_MAX)
+    parser.add_argument("--pool-threads", type=int, default=32)
+    parser.add_argument("--pool-query-ms", type=float, default=2.0, help="Simulated query time per checkout")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="zero")
+    parser.add_argument("--postgres", choices=["memory", "local"], default="memory")
+    parser.add_argument("--only", nargs="+", help="Run only stages whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Also write results to this file")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="Write results as the baseline")
+    parser.add_argument("--baseline", help="Compare with this baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore p95 differences smaller than this (noise on sub-millisecond stages)")
+    args = parser.parse_args()
+
+    results = run(args)
+    for path in filter(None, (args.json, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [f"{name}: {r['errors']} errors ({r['first_error']})" for name, r in results["stages"].items() if r["errors"]]
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("profile") != args.profile:
+            print(f"Warning: baseline was taken with profile {baseline.get('meta', {}).get('profile')}")
+        failed += compare(results, baseline, args.tolerance, args.min_delta_ms)
+
+    if failed:
+        print("\nFAILED:")
+        for line in failed:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main_cli()
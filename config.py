@@ -15,3 +15,119 @@ PG_DB = os.getenv("PG_DB", "reflect_db")
 PG_USER = os.getenv("PG_USER", "postgres")
 PG_PASSWORD = os.getenv("PG_PASSWORD", "Reflect@123")
 PG_PORT = int(os.getenv("PG_PORT", 5432))
+
+# Context assembly for /therapist (bounded thread pool shared by all requests)
+CONTEXT_MAX_WORKERS = int(os.getenv("CONTEXT_MAX_WORKERS", 16))
+
+# Query metadata extraction (local parser + LRU cache, Gemini only as fallback)
+QUERY_METADATA_CACHE_SIZE = int(os.getenv("QUERY_METADATA_CACHE_SIZE", 2048))
+QUERY_METADATA_LLM_FALLBACK = os.getenv("QUERY_METADATA_LLM_FALLBACK", "true").lower() == "true"
+QUERY_VOCAB_CACHE_SIZE = int(os.getenv("QUERY_VOCAB_CACHE_SIZE", 1024))
+QUERY_VOCAB_TTL = int(os.getenv("QUERY_VOCAB_TTL", 600))  # seconds
+QUERY_VOCAB_SAMPLE_SIZE = int(os.getenv("QUERY_VOCAB_SAMPLE_SIZE", 300))  # most recent journals scanned
+
+# Embedding cache (in-process LRU + optional Postgres table `embedding_cache`)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+
+# Embedding micro-batching (concurrent get_embedding calls share one Vertex request)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))  # text-embedding-005 accepts up to 250 inputs
+EMBEDDING_BATCH_LINGER_MS = float(os.getenv("EMBEDDING_BATCH_LINGER_MS", 5))
+EMBEDDING_BATCH_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_BATCH_MAX_IN_FLIGHT", 4))
+
+# Bulk journal ingestion (/store_journals_bulk)
+BULK_INGEST_CHUNK_SIZE = int(os.getenv("BULK_INGEST_CHUNK_SIZE", 25))
+BULK_INGEST_ANALYZE_CONCURRENCY = int(os.getenv("BULK_INGEST_ANALYZE_CONCURRENCY", 8))
+
+# Journal writes (/store_journal): how long a retry waits for the same journal's in-flight write
+JOURNAL_IN_FLIGHT_WAIT = float(os.getenv("JOURNAL_IN_FLIGHT_WAIT", 30))  # seconds, then it writes too
+
+# Embedding writes: batches at least this large use binary COPY instead of multi-row INSERT
+EMBEDDING_COPY_THRESHOLD = int(os.getenv("EMBEDDING_COPY_THRESHOLD", 50))
+
+# Postgres connection pool
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", 10))
+PG_POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", 10))  # seconds to wait for a free connection
+PG_POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", 1800))  # recycle connections after this many seconds
+PG_POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", 300))  # close idle connections above PG_POOL_MIN after this
+PG_POOL_CHECK_AFTER = float(os.getenv("PG_POOL_CHECK_AFTER", 30))  # liveness-check connections idle longer than this
+
+# Hybrid search fusion: "rrf" (reciprocal rank fusion) or "weighted" (similarity + metadata match bonus)
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+HYBRID_METADATA_WEIGHT = float(os.getenv("HYBRID_METADATA_WEIGHT", 1.0))
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", 4))  # candidates per list = top_k * this
+
+# ANN index search knobs (unset = server default); see services/ann_index.py
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", 0)) or None  # HNSW candidate list size
+ANN_PROBES = int(os.getenv("ANN_PROBES", 0)) or None  # IVFFlat lists probed
+# auto: relaxed_order on pgvector >= 0.8, else off; off | relaxed_order | strict_order to force one
+ANN_ITERATIVE_SCAN = os.getenv("ANN_ITERATIVE_SCAN", "auto")
+# Without iterative scans, users with at most this many rows are searched exactly (btree on user_id)
+# instead of post-filtering the ANN candidates, which can return fewer than top_k rows
+ANN_EXACT_SCAN_MAX_ROWS = int(os.getenv("ANN_EXACT_SCAN_MAX_ROWS", 50000))
+ANN_USER_ROWS_TTL = int(os.getenv("ANN_USER_ROWS_TTL", 600))  # seconds a user's cached row count is trusted
+ANN_MAINTENANCE_WORK_MEM = os.getenv("ANN_MAINTENANCE_WORK_MEM", "512MB")  # used while building indexes
+
+# In-process per-user journal vector index (optional tier in front of Postgres search)
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true"
+VECTOR_INDEX_MAX_BYTES = int(os.getenv("VECTOR_INDEX_MAX_BYTES", 256 * 1024 * 1024))
+VECTOR_INDEX_TTL = int(os.getenv("VECTOR_INDEX_TTL", 300))  # seconds; bounds staleness from other instances' writes
+VECTOR_INDEX_MAX_ROWS = int(os.getenv("VECTOR_INDEX_MAX_ROWS", 20000))  # larger users are searched in Postgres
+
+# /search_journal_batch
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", 50))
+
+# Write-behind conversation summaries (services/summary_queue.py)
+SUMMARY_WRITE_BEHIND = os.getenv("SUMMARY_WRITE_BEHIND", "true").lower() == "true"
+SUMMARY_QUEUE_PATH = os.getenv("SUMMARY_QUEUE_PATH", "/tmp/reflect_summary_queue.db")  # SQLite file
+SUMMARY_QUEUE_WORKERS = int(os.getenv("SUMMARY_QUEUE_WORKERS", 2))
+SUMMARY_QUEUE_BATCH_SIZE = int(os.getenv("SUMMARY_QUEUE_BATCH_SIZE", 5))  # turns of one user per Gemini call
+SUMMARY_QUEUE_MAX_ATTEMPTS = int(os.getenv("SUMMARY_QUEUE_MAX_ATTEMPTS", 6))
+SUMMARY_QUEUE_RETRY_BASE = float(os.getenv("SUMMARY_QUEUE_RETRY_BASE", 2))  # seconds, doubled per attempt
+SUMMARY_QUEUE_RETRY_MAX = float(os.getenv("SUMMARY_QUEUE_RETRY_MAX", 300))
+SUMMARY_QUEUE_CLAIM_TIMEOUT = float(os.getenv("SUMMARY_QUEUE_CLAIM_TIMEOUT", 300))  # reclaim turns of a crashed worker
+SUMMARY_QUEUE_POLL_INTERVAL = float(os.getenv("SUMMARY_QUEUE_POLL_INTERVAL", 1))
+
+# Therapist prompt (services/prompt_service.py)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))  # estimated input tokens; journals trimmed first
+PROMPT_EXPLICIT_CACHE = os.getenv("PROMPT_EXPLICIT_CACHE", "false").lower() == "true"  # Vertex context caching
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 2048))  # Vertex minimum cacheable size
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", 3600))  # seconds
+# /therapist reply + turn summary/metadata from one Gemini call (JSON response schema); streaming keeps two calls
+THERAPIST_COMBINED_SUMMARY = os.getenv("THERAPIST_COMBINED_SUMMARY", "true").lower() == "true"
+
+# Per-user context pack cache: persona + latest conversation summaries (services/context_cache.py)
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "memory")  # memory | redis
+CONTEXT_CACHE_REDIS_URL = os.getenv("CONTEXT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", 300))  # seconds; bounds staleness from other instances
+CONTEXT_CACHE_MAX_USERS = int(os.getenv("CONTEXT_CACHE_MAX_USERS", 10000))
+CONTEXT_CACHE_SUMMARIES = int(os.getenv("CONTEXT_CACHE_SUMMARIES", 3))  # latest conversation summaries kept per user
+
+# Client warm-up at startup (services/clients.py): background | sync | off
+CLIENTS_WARMUP = os.getenv("CLIENTS_WARMUP", "background")
+
+# Logging (services/logging_setup.py): queued, sampled, redacted
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))  # share of DEBUG/INFO records kept; warnings always
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records beyond this are dropped, not waited on
+LOG_REDACT = os.getenv("LOG_REDACT", "true").lower() == "true"
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", 2000))
+
+# Async serving mode (asgi.py, services/async_db.py)
+ASYNC_PG_POOL_MIN = int(os.getenv("ASYNC_PG_POOL_MIN", 1))
+ASYNC_PG_POOL_MAX = int(os.getenv("ASYNC_PG_POOL_MAX", 20))
+ASYNC_THREADPOOL_WORKERS = int(os.getenv("ASYNC_THREADPOOL_WORKERS", 32))  # for the sync-only steps (e.g. local metadata extraction)
+
+# Per-user hybrid search result cache (services/search_cache.py)
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 300))  # seconds; bounds staleness from other instances' writes
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", 0.97))  # reworded-query match (cosine); 0 disables
+SEARCH_CACHE_SIMILAR_CANDIDATES = int(os.getenv("SEARCH_CACHE_SIMILAR_CANDIDATES", 32))  # per user/top_k/filter set
+
+# Timeline listing (/list_journals, /list_conversations; services/timeline.py)
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 20))
+LIST_PAGE_MAX = int(os.getenv("LIST_PAGE_MAX", 100))
@@ -1,6 +1,12 @@
+# Queued, sampled, redacted logging before any module logs (services/logging_setup.py)
+from services import logging_setup
+logging_setup.configure()
+
 from flask import Flask
 from flask_cors import CORS
 from apis import register_routes
+from services import clients, summary_queue
+import config
 
 app = Flask(__name__)
 CORS(app)  # ✅ Enable CORS for frontend calls
@@ -8,5 +14,14 @@ CORS(app)  # ✅ Enable CORS for frontend calls
 # Register all API routes
 register_routes(app)
 
+# Background summarization workers (also drain turns queued before a restart)
+if config.SUMMARY_WRITE_BEHIND:
+    summary_queue.start()
+
+# Create the Firestore/Vertex clients and a first DB connection before they are needed;
+# in the background so the instance starts serving immediately
+if config.CLIENTS_WARMUP in ("background", "sync"):
+    clients.warm_up(background=config.CLIENTS_WARMUP == "background")
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=9090, debug=True)
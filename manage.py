@@ -0,0 +1,63 @@
+"""
+Management commands.
+
+python manage.py migrate
+python manage.py backfill-content [--table journal_embeddings|conversation_embeddings] [--batch-size 200]
+python manage.py ann-index create|rebuild|drop|status [--table ...] [--method hnsw|ivfflat]
+    [--m 16] [--ef-construction 64] [--lists N] [--no-concurrently]
+"""
+
+import argparse
+import json
+import logging
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reflect backend management commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate", help="Apply pending Postgres schema migrations")
+
+    backfill = sub.add_parser("backfill-content", help="Copy summary/metadata from Firestore into embeddings tables")
+    backfill.add_argument("--table", default="journal_embeddings",
+                          choices=["journal_embeddings", "conversation_embeddings"])
+    backfill.add_argument("--batch-size", type=int, default=200)
+
+    ann = sub.add_parser("ann-index", help="Create, rebuild, drop or inspect the pgvector ANN index")
+    ann.add_argument("action", choices=["create", "rebuild", "drop", "status"])
+    ann.add_argument("--table", default="journal_embeddings",
+                     choices=["journal_embeddings", "conversation_embeddings"])
+    ann.add_argument("--method", default="hnsw", choices=["hnsw", "ivfflat"])
+    ann.add_argument("--m", type=int, default=16, help="HNSW max connections per layer")
+    ann.add_argument("--ef-construction", type=int, default=64, help="HNSW build candidate list size")
+    ann.add_argument("--lists", type=int, default=None, help="IVFFlat lists (default: derived from row count)")
+    ann.add_argument("--no-concurrently", dest="concurrently", action="store_false",
+                     help="Build with a table lock instead of CONCURRENTLY (faster, blocks writes)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "migrate":
+        from services.schema import apply_migrations
+        applied = apply_migrations()
+        print(json.dumps({"applied": applied}))
+    elif args.command == "backfill-content":
+        from services.backfill import backfill_content
+        print(json.dumps(backfill_content(args.table, args.batch_size)))
+    elif args.command == "ann-index":
+        from services import ann_index
+        if args.action == "create":
+            name = ann_index.create_index(args.table, args.method, m=args.m, ef_construction=args.ef_construction,
+                                          lists=args.lists, concurrently=args.concurrently)
+            print(json.dumps({"created": name}))
+        elif args.action == "rebuild":
+            print(json.dumps({"rebuilt": ann_index.rebuild_index(args.table, args.method, args.concurrently)}))
+        elif args.action == "drop":
+            print(json.dumps({"dropped": ann_index.drop_index(args.table, args.method, args.concurrently)}))
+        else:
+            print(json.dumps({"table": args.table, "rows": ann_index.table_row_count(args.table),
+                              "indexes": ann_index.index_status(args.table)}))
+
+
+if __name__ == "__main__":
+    main()
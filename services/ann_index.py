@@ -0,0 +1,270 @@
+# services/ann_index.py
+"""
+ANN index lifecycle for the embeddings tables (pgvector HNSW / IVFFlat).
+
+Strategy with the user_id filter: every search is scoped to one user, so the
+tables keep a btree on user_id (see schema migration 004) for light users, where
+an exact scan of a few thousand rows is fastest, plus one ANN index on the
+embedding column for heavy users. An ANN scan alone post-filters its ef_search
+candidates by user_id, so a light user can get fewer than top_k rows, or none:
+- pgvector >= 0.8: iterative index scans (ANN_ITERATIVE_SCAN, "auto" = relaxed_order)
+  keep scanning until enough rows pass the filter
+- older pgvector: users with at most ANN_EXACT_SCAN_MAX_ROWS rows are searched exactly
+  (index scans off for the transaction, so the btree bitmap scan is used; ANN indexes
+  cannot serve bitmap scans)
+Search recall/latency is tuned per query with hnsw.ef_search / ivfflat.probes.
+"""
+
+import logging
+import re
+
+import config
+from services import async_db
+from services.cache import LRUCache
+from services.db_connection import connection
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("journal_embeddings", "conversation_embeddings")
+METHODS = ("hnsw", "ivfflat")
+
+
+def index_name(table: str, method: str) -> str:
+    return f"{table}_embedding_{method}_idx"
+
+
+def _check(table: str, method: str = None):
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table}")
+    if method is not None and method not in METHODS:
+        raise ValueError(f"Unknown index method {method}")
+
+
+def _run_autocommit(statements: list):
+    """CREATE/REINDEX ... CONCURRENTLY cannot run inside a transaction block."""
+    with connection() as conn:
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for sql in statements:
+                    logger.info("Running: %s", sql.strip())
+                    cur.execute(sql)
+        finally:
+            conn.autocommit = False
+
+
+def suggested_lists(row_count: int) -> int:
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) above that."""
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(row_count ** 0.5)
+
+
+def create_index(table: str = "journal_embeddings", method: str = "hnsw", m: int = 16,
+                 ef_construction: int = 64, lists: int = None, concurrently: bool = True) -> str:
+    """
+    Creates the ANN index (cosine distance, matching the <=> searches).
+    IVFFlat should be built after the table has data; lists defaults to suggested_lists().
+    """
+    _check(table, method)
+    if method == "ivfflat" and lists is None:
+        lists = suggested_lists(table_row_count(table))
+    _run_autocommit([
+        f"SET maintenance_work_mem = '{config.ANN_MAINTENANCE_WORK_MEM}'",
+        create_index_sql(table, method, m, ef_construction, lists, concurrently),
+    ])
+    return index_name(table, method)
+
+
+def create_index_sql(table: str, method: str, m: int = 16, ef_construction: int = 64,
+                     lists: int = 100, concurrently: bool = True) -> str:
+    """CREATE INDEX statement for `table` (also used by benchmarks/ann_benchmark.py on scratch tables)."""
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    if method == "hnsw":
+        options = f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+    else:
+        options = f"WITH (lists = {int(lists)})"
+    return (
+        f"CREATE INDEX {concurrent}IF NOT EXISTS {index_name(table, method)} ON {table} "
+        f"USING {method} (embedding vector_cosine_ops) {options}"
+    )
+
+
+def rebuild_index(table: str = "journal_embeddings", method: str = "hnsw", concurrently: bool = True) -> str:
+    """Rebuilds an existing index, e.g. after bulk imports skewed IVFFlat lists."""
+    _check(table, method)
+    name = index_name(table, method)
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    _run_autocommit([
+        f"SET maintenance_work_mem = '{config.ANN_MAINTENANCE_WORK_MEM}'",
+        f"REINDEX INDEX {concurrent}{name}",
+    ])
+    return name
+
+
+def drop_index(table: str = "journal_embeddings", method: str = "hnsw", concurrently: bool = True) -> str:
+    _check(table, method)
+    name = index_name(table, method)
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    _run_autocommit([f"DROP INDEX {concurrent}IF EXISTS {name}"])
+    return name
+
+
+def table_row_count(table: str) -> int:
+    _check(table)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {table}")
+            return cur.fetchone()[0]
+
+
+def index_status(table: str = "journal_embeddings") -> list:
+    """Lists indexes on the table with their definition, size and validity."""
+    _check(table)
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT i.relname, pg_get_indexdef(i.oid), pg_size_pretty(pg_relation_size(i.oid)), x.indisvalid
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                JOIN pg_class t ON t.oid = x.indrelid
+                WHERE t.relname = %s
+                ORDER BY i.relname
+                """,
+                (table,)
+            )
+            return [
+                {"name": r[0], "definition": r[1], "size": r[2], "valid": r[3]}
+                for r in cur.fetchall()
+            ]
+
+
+ITERATIVE_SCAN_MODES = ("off", "relaxed_order", "strict_order")
+
+PGVECTOR_VERSION_SQL = "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+USER_ROWS_SQL = "SELECT count(*) FROM journal_embeddings WHERE user_id = %(user_id)s"
+
+_detected_scan_mode = None  # ANN_ITERATIVE_SCAN=auto, resolved once per process
+_user_rows = LRUCache(max_entries=10000, ttl=config.ANN_USER_ROWS_TTL)
+
+
+def _version_tuple(version: str) -> tuple:
+    return tuple(int(part) for part in re.findall(r"\d+", version or "")[:3])
+
+
+def _scan_mode_for(version: str) -> str:
+    return "relaxed_order" if _version_tuple(version) >= (0, 8) else "off"
+
+
+def _configured_scan_mode() -> str:
+    mode = config.ANN_ITERATIVE_SCAN
+    if mode != "auto" and mode not in ITERATIVE_SCAN_MODES:
+        raise ValueError(f"Unknown iterative scan mode {mode}")
+    return mode
+
+
+def iterative_scan_mode() -> str:
+    """ANN_ITERATIVE_SCAN with "auto" resolved from the server's pgvector version."""
+    global _detected_scan_mode
+    mode = _configured_scan_mode()
+    if mode != "auto":
+        return mode
+    if _detected_scan_mode is None:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(PGVECTOR_VERSION_SQL)
+                row = cur.fetchone()
+        _detected_scan_mode = _scan_mode_for(row[0] if row else "")
+        logger.info("pgvector %s: iterative scan %s", row[0] if row else "missing", _detected_scan_mode)
+    return _detected_scan_mode
+
+
+async def iterative_scan_mode_async() -> str:
+    global _detected_scan_mode
+    mode = _configured_scan_mode()
+    if mode != "auto":
+        return mode
+    if _detected_scan_mode is None:
+        rows = await async_db.fetch(PGVECTOR_VERSION_SQL, operation="pgvector_version")
+        _detected_scan_mode = _scan_mode_for(rows[0][0] if rows else "")
+    return _detected_scan_mode
+
+
+def _needs_exact_scan(row_count: int) -> bool:
+    return row_count <= config.ANN_EXACT_SCAN_MAX_ROWS
+
+
+def exact_scan(user_id: str, iterative_scan: str) -> bool:
+    """True when the user's search should skip the ANN index (no iterative scans, light user)."""
+    if iterative_scan != "off":
+        return False
+    count = _user_rows.get(user_id)
+    if count is None:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(USER_ROWS_SQL, {"user_id": user_id})
+                count = cur.fetchone()[0]
+        _user_rows.put(user_id, count)
+    return _needs_exact_scan(count)
+
+
+async def exact_scan_async(user_id: str, iterative_scan: str) -> bool:
+    if iterative_scan != "off":
+        return False
+    count = _user_rows.get(user_id)
+    if count is None:
+        rows = await async_db.fetch(USER_ROWS_SQL, {"user_id": user_id}, operation="user_rows")
+        count = rows[0][0]
+        _user_rows.put(user_id, count)
+    return _needs_exact_scan(count)
+
+
+def user_search_settings_sql(user_id: str, ef_search: int = None, probes: int = None) -> str:
+    """search_settings_sql for one user's search: iterative scans, or an exact scan for light users."""
+    mode = iterative_scan_mode()
+    return search_settings_sql(ef_search, probes, iterative_scan=mode, exact=exact_scan(user_id, mode))
+
+
+async def user_search_settings_sql_async(user_id: str, ef_search: int = None, probes: int = None) -> str:
+    mode = await iterative_scan_mode_async()
+    exact = await exact_scan_async(user_id, mode)
+    return search_settings_sql(ef_search, probes, iterative_scan=mode, exact=exact)
+
+
+def search_settings_sql(ef_search: int = None, probes: int = None, iterative_scan: str = None,
+                        exact: bool = False) -> str:
+    """
+    Per-query ANN knobs as a statement prefix, scoped to the current transaction
+    (set_config(..., true) == SET LOCAL). Prepending it to the search query keeps it
+    to a single round trip. Arguments default to config; unset means keep the server setting.
+    iterative_scan "off" sets nothing (older pgvector rejects the setting); exact=True
+    turns index scans off so the search reads the user's rows through the btree.
+    """
+    ef_search = ef_search if ef_search is not None else config.ANN_EF_SEARCH
+    probes = probes if probes is not None else config.ANN_PROBES
+    if iterative_scan is None:
+        iterative_scan = _configured_scan_mode()
+        if iterative_scan == "auto":
+            iterative_scan = _detected_scan_mode or "off"
+
+    settings = []
+    if ef_search:
+        settings.append(("hnsw.ef_search", int(ef_search)))
+    if probes:
+        settings.append(("ivfflat.probes", int(probes)))
+    if iterative_scan and iterative_scan != "off":
+        if iterative_scan not in ITERATIVE_SCAN_MODES:
+            raise ValueError(f"Unknown iterative scan mode {iterative_scan}")
+        settings.append(("hnsw.iterative_scan", iterative_scan))
+        # IVFFlat only supports relaxed ordering
+        if iterative_scan != "strict_order":
+            settings.append(("ivfflat.iterative_scan", iterative_scan))
+    if exact:
+        settings.append(("enable_indexscan", "off"))
+
+    if not settings:
+        return ""
+    calls = ", ".join(f"set_config('{name}', '{value}', true)" for name, value in settings)
+    return f"SELECT {calls};"
@@ -0,0 +1,124 @@
+# services/async_db.py
+"""
+asyncpg pool for the async serving mode (asgi.py). The Flask app, the background
+workers and manage.py keep using the thread-safe pool in db_connection.py.
+
+- created on first use inside the running event loop, closed on shutdown (close())
+- per-connection codecs: pgvector values travel as text literals ('[0.1,0.2,...]', see
+  hybrid_search._format_embedding_for_pg) and jsonb decodes to dicts, as with psycopg2
+- fetch() runs the psycopg2-style statements (%(name)s placeholders) unchanged;
+  asyncpg prepares and caches each statement per connection
+"""
+
+import asyncio
+import json
+import re
+
+import config
+from services import metrics
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s")
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+def _parse_vector(text: str) -> list:
+    return [float(x) for x in text[1:-1].split(",")] if len(text) > 2 else []
+
+
+def _encode_json(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+async def _init_connection(conn):
+    await conn.set_type_codec("vector", schema="public", encoder=str, decoder=_parse_vector, format="text")
+    await conn.set_type_codec("jsonb", schema="pg_catalog", encoder=_encode_json, decoder=json.loads,
+                              format="text")
+
+
+async def pool():
+    """The process-wide asyncpg pool."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                import asyncpg
+                _pool = await asyncpg.create_pool(
+                    host=config.PG_HOST,
+                    database=config.PG_DB,
+                    user=config.PG_USER,
+                    password=config.PG_PASSWORD,
+                    port=config.PG_PORT,
+                    min_size=config.ASYNC_PG_POOL_MIN,
+                    max_size=config.ASYNC_PG_POOL_MAX,
+                    max_inactive_connection_lifetime=config.PG_POOL_MAX_IDLE,
+                    init=_init_connection,
+                )
+    return _pool
+
+
+async def close():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def _cast(value) -> str:
+    # Parameters of psycopg2 statements are typed by the value; asyncpg infers them from the
+    # statement, which fails for e.g. `%(weight)s / (%(k)s + rank)` without a cast
+    if isinstance(value, bool):
+        return "::boolean"
+    if isinstance(value, int):
+        return "::bigint"
+    if isinstance(value, float):
+        return "::float8"
+    if isinstance(value, str):
+        return "::text"
+    return ""
+
+
+def to_positional(statement: str, params: dict) -> tuple:
+    """Rewrites %(name)s placeholders to $1, $2, ...; returns (statement, args)."""
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        placeholder = f"${names.index(name) + 1}"
+        already_cast = match.string.startswith("::", match.end())
+        return placeholder if already_cast else placeholder + _cast(params[name])
+
+    return _PLACEHOLDER.sub(replace, statement), [params[name] for name in names]
+
+
+async def fetch(statement: str, params: dict = None, settings: str = "", operation: str = "query") -> list:
+    """
+    Runs one statement and returns its records. `settings` (ann_index.search_settings_sql)
+    is applied in the same transaction, like the prefix on the sync path.
+    """
+    query, args = to_positional(statement, params or {})
+    db = await pool()
+    with metrics.span("postgres", operation):
+        async with db.acquire(timeout=config.PG_POOL_TIMEOUT) as conn:
+            if not settings:
+                return await conn.fetch(query, *args)
+            async with conn.transaction():
+                await conn.execute(settings)
+                return await conn.fetch(query, *args)
+
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {"size": 0, "idle": 0, "in_use": 0}
+    size, idle = _pool.get_size(), _pool.get_idle_size()
+    return {"size": size, "idle": idle, "in_use": size - idle}
+
+
+metrics.register_gauge(
+    "reflect_async_db_pool_connections", "asyncpg pool connections by state (async serving mode).",
+    lambda: {(state,): value for state, value in pool_stats().items() if state in ("in_use", "idle")},
+    labels=("state",)
+)
@@ -0,0 +1,111 @@
+# services/backfill.py
+"""
+Backfills summary, metadata and created_at into the embeddings tables for rows
+written before those columns existed. Firestore stays the source of the content.
+"""
+
+import json
+import logging
+from datetime import timezone
+
+from psycopg2.extras import execute_values
+
+from services import clients
+from services.db_connection import connection
+
+logger = logging.getLogger(__name__)
+
+
+# table -> (id column, Firestore subcollection, Firestore summary field)
+TABLES = {
+    "journal_embeddings": ("journal_id", "journals", "summary"),
+    "conversation_embeddings": ("summary_id", "conversation_summary", "summary_text"),
+}
+
+
+def _naive_utc(value):
+    """Firestore timestamps are tz-aware; the embeddings tables use TIMESTAMP (UTC, no zone)."""
+    if value is not None and getattr(value, "tzinfo", None) is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _fetch_content(user_id: str, collection: str, summary_field: str, ids: list) -> dict:
+    """One batched, field-masked Firestore read for a user's documents."""
+    coll = clients.firestore().collection("users").document(user_id).collection(collection)
+    snapshots = clients.firestore().get_all(
+        [coll.document(item_id) for item_id in ids],
+        field_paths=[summary_field, "metadata", "created_at"]
+    )
+    return {snap.id: snap.to_dict() or {} for snap in snapshots if snap.exists}
+
+
+def backfill_content(table: str = "journal_embeddings", batch_size: int = 200) -> dict:
+    """
+    Walks rows with a NULL summary in primary-key order and fills them from Firestore.
+    Returns counts of updated rows and rows whose Firestore document is missing.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table {table}")
+    column_id, collection, summary_field = TABLES[table]
+
+    updated = missing = 0
+    last_id = 0
+    while True:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT id, {column_id}, user_id FROM {table}
+                    WHERE summary IS NULL AND id > %s
+                    ORDER BY id
+                    LIMIT %s
+                    """,
+                    (last_id, batch_size)
+                )
+                rows = cur.fetchall()
+            conn.commit()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        by_user = {}
+        for _, item_id, user_id in rows:
+            by_user.setdefault(user_id, []).append(item_id)
+
+        values = []
+        for user_id, ids in by_user.items():
+            docs = _fetch_content(user_id, collection, summary_field, ids)
+            for item_id in ids:
+                data = docs.get(item_id)
+                if not data or not data.get(summary_field):
+                    missing += 1
+                    continue
+                values.append((
+                    item_id,
+                    data[summary_field],
+                    json.dumps(data.get("metadata")) if data.get("metadata") is not None else None,
+                    _naive_utc(data.get("created_at"))
+                ))
+
+        if values:
+            with connection() as conn:
+                with conn.cursor() as cur:
+                    execute_values(
+                        cur,
+                        f"""
+                        UPDATE {table} AS t
+                        SET summary = v.summary,
+                            metadata = v.metadata::jsonb,
+                            created_at = COALESCE(v.created_at::timestamp, t.created_at)
+                        FROM (VALUES %s) AS v(item_id, summary, metadata, created_at)
+                        WHERE t.{column_id} = v.item_id
+                        """,
+                        values,
+                        page_size=len(values)
+                    )
+                conn.commit()
+            updated += len(values)
+        logger.info("Backfilled %d rows in %s (%d missing in Firestore)", updated, table, missing)
+
+    return {"table": table, "updated": updated, "missing": missing}
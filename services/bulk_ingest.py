@@ -0,0 +1,225 @@
+# services/bulk_ingest.py
+"""
+Bulk journal ingestion (NDJSON) as a bounded pipeline:
+analyze (Gemini, limited concurrency) -> embed (batched) -> store
+(Firestore batched write + multi-row pgvector insert).
+Entries are processed in chunks; the next chunk is already being analyzed
+while the current one is embedded and stored. A status dict is yielded per entry.
+Journal ids are deterministic (journal_service.journal_id_for), so entries already
+stored, e.g. by a retried upload, are reported as duplicates without being analyzed;
+a line repeated within the upload gets the status of its first copy.
+"""
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+from services import clients, metrics, search_cache, utils
+from services.create_embedding import get_embeddings
+from services.embedding_store import store_embeddings
+from services.journal_service import analyze_journal, existing_journals, journal_id_for
+from services.query_metadata import invalidate_user_vocabulary
+
+logger = logging.getLogger(__name__)
+
+# Shared across bulk requests so Gemini concurrency stays bounded per instance
+analyze_pool = ThreadPoolExecutor(max_workers=config.BULK_INGEST_ANALYZE_CONCURRENCY, thread_name_prefix="bulk-analyze")
+
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def _parse_entry(line_no: int, raw_line, default_user_id: str = None) -> dict:
+    """Parses one NDJSON line into an entry dict; validation errors are kept on the entry."""
+    entry = {"line": line_no}
+    try:
+        data = json.loads(raw_line)
+        if not isinstance(data, dict):
+            raise ValueError("each line must be a JSON object")
+        entry["user_id"] = data.get("user_id") or default_user_id
+        entry["journal_text"] = data.get("journal_text")
+        if not entry["user_id"] or not entry["journal_text"]:
+            raise ValueError("user_id and journal_text are required")
+        created_at = data.get("created_at")
+        entry["created_at"] = utils.parse_iso_datetime(created_at) if created_at else datetime.utcnow()
+        entry["journal_id"] = journal_id_for(entry["user_id"], entry["journal_text"], data.get("idempotency_key"),
+                                             day=entry["created_at"].date())
+    except (ValueError, TypeError) as e:
+        entry["error"] = f"Invalid entry: {e}"
+    return entry
+
+
+def _mark_duplicates(chunk: list, seen: dict):
+    """
+    Flags entries already stored (earlier upload/retry) or repeated within this upload,
+    so they are not analyzed again. One batched id lookup per user in the chunk.
+    A repeat keeps the status dict of its first copy (seen: journal id -> status dict),
+    which _store_chunk fills in before it resolves the repeat.
+    """
+    valid = [entry for entry in chunk if "error" not in entry]
+    by_user = {}
+    for entry in valid:
+        by_user.setdefault(entry["user_id"], []).append(entry["journal_id"])
+    stored = set()
+    for user_id, journal_ids in by_user.items():
+        try:
+            stored |= existing_journals(user_id, journal_ids)
+        except Exception as e:
+            # Storing again is still safe (same ids, upserts), only not free
+            logger.warning("Duplicate lookup for user %s failed: %s", user_id, e)
+    for entry in valid:
+        entry["status"] = {"line": entry["line"]}
+        entry["duplicate"] = entry["journal_id"] in stored
+        if not entry["duplicate"] and entry["journal_id"] in seen:
+            entry["original"] = seen[entry["journal_id"]]
+        else:
+            seen.setdefault(entry["journal_id"], entry["status"])
+
+
+def _submit_analysis(chunk: list, seen: dict) -> list:
+    _mark_duplicates(chunk, seen)
+    return [
+        (entry, analyze_pool.submit(analyze_journal, entry["journal_text"])
+         if "error" not in entry and not entry["duplicate"] and "original" not in entry else None)
+        for entry in chunk
+    ]
+
+
+def _store_chunk(pending: list) -> list:
+    """Waits for a chunk's analyses, then embeds and stores the successful ones."""
+    statuses = []
+    ready = []
+    repeats = []
+
+    def finish(entry, **status):
+        # Fills in the entry's status dict, which repeats of it in the upload also read
+        result = entry.setdefault("status", {"line": entry["line"]})
+        result.update(status)
+        statuses.append(result)
+
+    for entry, future in pending:
+        if future is None and "error" in entry:
+            finish(entry, status="error", message=entry["error"])
+            continue
+        if future is None and "original" in entry:
+            repeats.append(entry)
+            continue
+        if future is None:
+            finish(entry, status="success", journal_id=entry["journal_id"], duplicate=True)
+            continue
+        try:
+            result = future.result()
+            entry["summary"] = result["summary"]
+            entry["metadata"] = result["metadata"]
+            ready.append(entry)
+        except Exception as e:
+            finish(entry, status="error", message=f"Analysis failed: {e}")
+
+    if ready:
+        try:
+            # Embed before writing anything so a failed batch leaves no orphan documents
+            embeddings = get_embeddings([entry["summary"] for entry in ready])
+
+            # Vectors first: the Firestore documents mark the journals as stored, so
+            # re-sending a chunk that failed in between redoes (and upserts) both writes
+            store_embeddings(
+                [
+                    {
+                        "user_id": entry["user_id"],
+                        "summary_id": entry["journal_id"],
+                        "embedding": embedding,
+                        "summary": entry["summary"],
+                        "metadata": entry["metadata"],
+                        "created_at": entry["created_at"]
+                    }
+                    for entry, embedding in zip(ready, embeddings)
+                ],
+                table="journal_embeddings"
+            )
+
+            for i in range(0, len(ready), FIRESTORE_BATCH_LIMIT):
+                batch = clients.firestore().batch()
+                for entry in ready[i:i + FIRESTORE_BATCH_LIMIT]:
+                    ref = clients.firestore().collection("users").document(entry["user_id"])\
+                            .collection("journals").document(entry["journal_id"])
+                    batch.set(ref, {
+                        "journal_text": entry["journal_text"],
+                        "summary": entry["summary"],
+                        "metadata": entry["metadata"],
+                        "created_at": entry["created_at"]
+                    })
+                with metrics.span("firestore", "commit_journals"):
+                    batch.commit()
+
+            for user_id in {entry["user_id"] for entry in ready}:
+                invalidate_user_vocabulary(user_id)
+                search_cache.bump(user_id)
+
+            for entry in ready:
+                finish(entry, status="success", journal_id=entry["journal_id"], duplicate=False)
+        except Exception as e:
+            logger.error("Bulk ingest chunk failed: %s", e)
+            for entry in ready:
+                finish(entry, status="error", message=f"Storing failed: {e}")
+
+    # A first copy is in this chunk or an earlier one, so its status is final by now
+    for entry in repeats:
+        original = entry["original"]
+        if original["status"] == "success":
+            finish(entry, status="success", journal_id=entry["journal_id"], duplicate=True)
+        else:
+            finish(entry, status="error",
+                   message=f"Duplicate of line {original['line']}, which failed: {original['message']}")
+
+    return sorted(statuses, key=lambda s: s["line"])
+
+
+def ingest_journals(lines, default_user_id: str = None, chunk_size: int = None):
+    """
+    Ingests NDJSON journal lines. Each line is a JSON object with journal_text,
+    optional user_id (falls back to default_user_id), optional ISO created_at
+    ("Z" or an offset is converted to naive UTC) and optional idempotency_key.
+    Yields one status dict per entry, followed by a final summary dict.
+    """
+    chunk_size = chunk_size or config.BULK_INGEST_CHUNK_SIZE
+    succeeded = failed = 0
+    in_flight = None
+    chunk = []
+    seen = {}  # journal id -> status of its first line in this upload, so repeated lines are stored once
+
+    def drain(pending):
+        nonlocal succeeded, failed
+        for status in _store_chunk(pending):
+            if status["status"] == "success":
+                succeeded += 1
+            else:
+                failed += 1
+            yield status
+
+    line_no = 0
+    for raw_line in lines:
+        if isinstance(raw_line, bytes):
+            raw_line = raw_line.decode("utf-8")
+        if not raw_line.strip():
+            continue
+        line_no += 1
+        chunk.append(_parse_entry(line_no, raw_line, default_user_id))
+
+        if len(chunk) >= chunk_size:
+            # Start analyzing this chunk before storing the previous one
+            submitted = _submit_analysis(chunk, seen)
+            chunk = []
+            if in_flight:
+                yield from drain(in_flight)
+            in_flight = submitted
+
+    if chunk:
+        submitted = _submit_analysis(chunk, seen)
+        if in_flight:
+            yield from drain(in_flight)
+        in_flight = submitted
+    if in_flight:
+        yield from drain(in_flight)
+
+    yield {"status": "done", "total": succeeded + failed, "succeeded": succeeded, "failed": failed}
@@ -0,0 +1,137 @@
+# services/cache.py
+"""
+Small thread-safe LRU cache used by the in-process caching tiers.
+Entries can be bounded by count and/or by approximate size in bytes,
+and can optionally expire after a TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl: float = None, sizeof=None):
+        """
+        Parameters:
+        - max_entries: int - evict least recently used entries beyond this count (None = unbounded)
+        - max_bytes: int - evict least recently used entries beyond this total size (needs sizeof)
+        - ttl: float - seconds after which an entry is treated as missing (None = never expires)
+        - sizeof: callable(value) -> int - size estimate used for max_bytes (defaults to 1 per entry)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+
+        self._data = OrderedDict()  # key -> (value, size, stored_at)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, size, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_with_age(self, key):
+        """Returns (value, age_seconds) or (None, None) on a miss."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return None, None
+            value, size, stored_at = entry
+            age = time.monotonic() - stored_at
+            if self.ttl is not None and age > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value, age
+
+    def peek(self, key, default=None):
+        """Like get, without counting a lookup or refreshing the entry's recency."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, size, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                return default
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, time.monotonic())
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    # -- internal, caller holds the lock --
+    def _remove(self, key):
+        value, size, stored_at = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        while self._data and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
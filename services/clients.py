@@ -0,0 +1,151 @@
+# services/clients.py
+"""
+Shared, lazily created clients for the Google Cloud services.
+
+Nothing is imported or connected at import time: the first call creates the client
+(thread-safe, once per process) and every module shares it. This keeps cold starts
+short: one Firestore client, one vertexai.init, one handle per model. warm_up() creates
+them ahead of the first request, optionally in a background thread. override() swaps in
+local stand-ins (benchmarks/fakes.py) so the services run without GCP.
+firestore_async() is the AsyncClient used by the async serving mode (asgi.py); the Gemini and
+embedding handles serve both modes (generate_content_async / get_embeddings_async).
+"""
+
+import logging
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+_lock = threading.RLock()
+_firestore_client = None
+_firestore_async_client = None
+_vertex_initialized = False
+_generative_models = {}
+_gemini_override = None
+_embedding_model = None
+_warmup_timings = {}
+
+
+def firestore():
+    """The process-wide Firestore client."""
+    global _firestore_client
+    if _firestore_client is None:
+        with _lock:
+            if _firestore_client is None:
+                from google.cloud import firestore as firestore_lib
+                _firestore_client = firestore_lib.Client(project=config.PROJECT_ID)
+    return _firestore_client
+
+
+def firestore_async():
+    """The process-wide Firestore AsyncClient (bound to the event loop that first uses it)."""
+    global _firestore_async_client
+    if _firestore_async_client is None:
+        with _lock:
+            if _firestore_async_client is None:
+                from google.cloud import firestore as firestore_lib
+                _firestore_async_client = firestore_lib.AsyncClient(project=config.PROJECT_ID)
+    return _firestore_async_client
+
+
+def init_vertex():
+    """vertexai.init, once per process."""
+    global _vertex_initialized
+    if not _vertex_initialized:
+        with _lock:
+            if not _vertex_initialized:
+                import vertexai
+                vertexai.init(project=config.PROJECT_ID, location=config.REGION)
+                _vertex_initialized = True
+
+
+def gemini(model_name: str = GEMINI_MODEL):
+    """Shared GenerativeModel handle for model_name."""
+    if _gemini_override is not None:
+        return _gemini_override
+    model = _generative_models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _generative_models.get(model_name)
+            if model is None:
+                init_vertex()
+                from vertexai.generative_models import GenerativeModel
+                model = GenerativeModel(model_name)
+                _generative_models[model_name] = model
+    return model
+
+
+def embedding_model():
+    """Shared TextEmbeddingModel for config.EMBEDDING_MODEL."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _lock:
+            if _embedding_model is None:
+                init_vertex()
+                from vertexai.language_models import TextEmbeddingModel
+                _embedding_model = TextEmbeddingModel.from_pretrained(config.EMBEDDING_MODEL)
+    return _embedding_model
+
+
+def _open_db_pool():
+    from services.db_connection import connection
+    with connection():
+        pass
+
+
+def warm_up(background: bool = True):
+    """
+    Creates every client (and opens a first Postgres connection) before traffic needs them.
+    In the background it overlaps with the first requests instead of delaying startup;
+    failures are logged and the clients are created again on first use.
+    """
+    steps = (
+        ("firestore", firestore),
+        ("gemini", gemini),
+        ("embedding_model", embedding_model),
+        ("db_pool", _open_db_pool),
+    )
+
+    def run():
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.warning("Warm-up of %s failed: %s", name, e)
+                continue
+            _warmup_timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        logger.info("Clients warmed up (ms): %s", _warmup_timings)
+
+    if background:
+        threading.Thread(target=run, name="clients-warmup", daemon=True).start()
+    else:
+        run()
+
+
+def override(firestore=None, gemini=None, embedding_model=None, firestore_async=None):
+    """
+    Replaces the shared clients with stand-ins exposing the same calls (e.g. benchmarks/fakes.py).
+    `gemini` serves every model name. Clients not passed are left as they are.
+    """
+    global _firestore_client, _firestore_async_client, _embedding_model, _vertex_initialized, _gemini_override
+    with _lock:
+        if firestore is not None:
+            _firestore_client = firestore
+        if firestore_async is not None:
+            _firestore_async_client = firestore_async
+        if gemini is not None:
+            _gemini_override = gemini
+        if embedding_model is not None:
+            _embedding_model = embedding_model
+        if gemini is not None or embedding_model is not None:
+            _vertex_initialized = True
+
+
+def warmup_timings() -> dict:
+    return dict(_warmup_timings)
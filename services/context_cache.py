@@ -0,0 +1,237 @@
+# services/context_cache.py
+"""
+Per-user "context pack" cache: the persona and the latest conversation summaries that
+every /therapist turn needs, kept with a TTL and LRU eviction.
+
+Writers update it write-through (store_persona_entry, store_conversation_summaries), so a
+user sees their own changes immediately; the TTL bounds staleness for writes made by other
+instances. The storage backend is pluggable (config.CONTEXT_CACHE_BACKEND):
+- "memory": in-process LRU (default)
+- "redis": shared by all instances (needs the `redis` package and CONTEXT_CACHE_REDIS_URL)
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import config
+from services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("persona", "summaries")
+
+
+# ---------------- BACKENDS ----------------
+class InProcessBackend:
+    name = "memory"
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, key):
+        """Returns (found, value, age_seconds)."""
+        entry, age = self._cache.get_with_age(key)
+        if entry is None:
+            return False, None, None
+        return True, entry["value"], age
+
+    def set(self, key, value):
+        self._cache.put(key, {"value": value})
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        return {"entries": stats["entries"], "evictions": stats["evictions"]}
+
+
+class RedisBackend:
+    """Shared backend; values are stored as JSON with their write time so age can be reported."""
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float, prefix: str = "reflect:ctx:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CONTEXT_CACHE_BACKEND=redis requires the redis package")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._ttl = int(ttl)
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        if raw is None:
+            return False, None, None
+        entry = json.loads(raw)
+        return True, entry["value"], time.time() - entry["stored_at"]
+
+    def set(self, key, value):
+        payload = json.dumps({"value": value, "stored_at": time.time()}, default=str)
+        self._client.set(self._prefix + key, payload, ex=self._ttl)
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def stats(self) -> dict:
+        return {}
+
+
+def _create_backend():
+    if config.CONTEXT_CACHE_BACKEND == "redis":
+        return RedisBackend(config.CONTEXT_CACHE_REDIS_URL, config.CONTEXT_CACHE_TTL)
+    return InProcessBackend(max_entries=config.CONTEXT_CACHE_MAX_USERS * len(KINDS), ttl=config.CONTEXT_CACHE_TTL)
+
+
+_backend = _create_backend()
+
+_lock = threading.Lock()
+# Bumped on every write; a load that raced with a write is not cached
+_generation = {}
+_hits = {kind: 0 for kind in KINDS}
+_misses = {kind: 0 for kind in KINDS}
+_write_throughs = 0
+_invalidations = 0
+_backend_errors = 0
+_hit_ages = deque(maxlen=1024)
+
+
+def _key(kind: str, user_id: str) -> str:
+    if kind not in KINDS:
+        raise ValueError(f"Unknown context cache kind {kind}")
+    return f"{kind}:{user_id}"
+
+
+def _backend_call(fn, *args, default=None):
+    """The cache is an optimization: backend failures fall through to Firestore."""
+    global _backend_errors
+    try:
+        return fn(*args)
+    except Exception as e:
+        logger.warning("Context cache backend error: %s", e)
+        with _lock:
+            _backend_errors += 1
+        return default
+
+
+def _record_lookup(kind: str, key: str, found: bool, age) -> int:
+    """Counts a lookup; returns the key's generation, checked again before a loaded value is cached."""
+    with _lock:
+        if found:
+            _hits[kind] += 1
+            _hit_ages.append(age)
+        else:
+            _misses[kind] += 1
+        return _generation.get(key, 0)
+
+
+def _is_current(key: str, generation: int) -> bool:
+    with _lock:
+        return _generation.get(key, 0) == generation
+
+
+def get_or_load(kind: str, user_id: str, loader):
+    """Returns the cached value for (kind, user_id), or loader(user_id) which is then cached."""
+    key = _key(kind, user_id)
+    found, value, age = _backend_call(_backend.get, key, default=(False, None, None))
+    generation = _record_lookup(kind, key, found, age)
+    if found:
+        return value
+
+    value = loader(user_id)
+    if _is_current(key, generation):
+        _backend_call(_backend.set, key, value)
+    return value
+
+
+async def _backend_call_async(fn, *args, default=None):
+    if _backend.name == "memory":
+        return _backend_call(fn, *args, default=default)
+    # network backends block; keep them off the event loop
+    return await asyncio.to_thread(_backend_call, fn, *args, default=default)
+
+
+async def get_or_load_async(kind: str, user_id: str, loader):
+    """get_or_load for the async serving mode; loader is a coroutine function of user_id."""
+    key = _key(kind, user_id)
+    found, value, age = await _backend_call_async(_backend.get, key, default=(False, None, None))
+    generation = _record_lookup(kind, key, found, age)
+    if found:
+        return value
+
+    value = await loader(user_id)
+    if _is_current(key, generation):
+        await _backend_call_async(_backend.set, key, value)
+    return value
+
+
+def put(kind: str, user_id: str, value):
+    """Write-through: replaces the cached value after the source of truth was written."""
+    global _write_throughs
+    key = _key(kind, user_id)
+    with _lock:
+        _generation[key] = _generation.get(key, 0) + 1
+        _write_throughs += 1
+    _backend_call(_backend.set, key, value)
+
+
+def update(kind: str, user_id: str, fn):
+    """
+    Write-through for partial changes: stores fn(cached_value) if the value is cached.
+    Uncached values stay uncached (the next read loads them).
+    """
+    global _write_throughs
+    key = _key(kind, user_id)
+    with _lock:
+        _generation[key] = _generation.get(key, 0) + 1
+    found, value, _ = _backend_call(_backend.get, key, default=(False, None, None))
+    if not found:
+        return
+    _backend_call(_backend.set, key, fn(value))
+    with _lock:
+        _write_throughs += 1
+
+
+def invalidate(user_id: str, kind: str = None):
+    global _invalidations
+    for k in ([kind] if kind else KINDS):
+        key = _key(k, user_id)
+        with _lock:
+            _generation[key] = _generation.get(key, 0) + 1
+            _invalidations += 1
+        _backend_call(_backend.delete, key)
+
+
+def stats() -> dict:
+    with _lock:
+        ages = sorted(_hit_ages)
+        hits = sum(_hits.values())
+        lookups = hits + sum(_misses.values())
+        per_kind = {
+            kind: {
+                "hits": _hits[kind],
+                "misses": _misses[kind],
+                "hit_ratio": round(_hits[kind] / (_hits[kind] + _misses[kind]), 4)
+                if _hits[kind] + _misses[kind] else 0.0,
+            }
+            for kind in KINDS
+        }
+        result = {
+            "backend": _backend.name,
+            "ttl_seconds": config.CONTEXT_CACHE_TTL,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            **per_kind,
+            "write_throughs": _write_throughs,
+            "invalidations": _invalidations,
+            "backend_errors": _backend_errors,
+            # age of the entries served from cache: how stale a hit can be
+            "staleness_avg_s": round(sum(ages) / len(ages), 3) if ages else 0.0,
+            "staleness_p50_s": round(ages[len(ages) // 2], 3) if ages else 0.0,
+            "staleness_max_s": round(ages[-1], 3) if ages else 0.0,
+        }
+    result.update(_backend_call(_backend.stats, default={}) or {})
+    return result
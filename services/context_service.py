@@ -0,0 +1,145 @@
+# services/context_service.py
+"""
+Context assembly for the /therapist endpoint.
+The independent lookups (conversation summaries, persona, query embedding and
+metadata extraction) run concurrently on a bounded executor; only the hybrid
+search, which also returns the journal summaries, waits on their results.
+gather_therapist_context_async does the same as tasks on the event loop (asgi.py).
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from services import conversation_service
+from services.persona_entry import get_persona_by_user_id, get_persona_by_user_id_async
+from services.create_embedding import get_embedding, get_embedding_async
+from services.query_metadata import extract_query_metadata
+from services.hybrid_search import hybrid_search, hybrid_search_async
+
+logger = logging.getLogger(__name__)
+
+# Shared by every request, so the number of in-flight remote calls stays bounded
+executor = ThreadPoolExecutor(max_workers=config.CONTEXT_MAX_WORKERS, thread_name_prefix="context")
+
+
+def _timed(timings: dict, stage: str, fn, *args, **kwargs):
+    """Run fn and record its wall time (ms) under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def gather_therapist_context(user_id: str, query: str, top_k: int = 5, n_summaries: int = 3) -> dict:
+    """
+    Collects everything the therapist prompt needs for a single turn.
+    Returns a dict with persona, journal_summaries, conversation_summaries and
+    per-stage timings in milliseconds.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    futures = {
+        "conversation_summaries": executor.submit(
+            _timed, timings, "conversation_summaries",
+            conversation_service.get_latest_n_summaries, user_id, n=n_summaries
+        ),
+        "persona": executor.submit(_timed, timings, "persona", get_persona_by_user_id, user_id),
+        "embedding": executor.submit(_timed, timings, "embedding", get_embedding, query),
+        "metadata": executor.submit(_timed, timings, "metadata_extraction", extract_query_metadata, query, user_id),
+    }
+
+    try:
+        # The search only depends on the embedding + filters, so it can start
+        # while the Firestore reads for persona/summaries are still in flight.
+        query_embedding = futures["embedding"].result()
+        metadata_filters = futures["metadata"].result()
+
+        # Ranked journals come back with their summary/metadata from the embeddings table
+        journal_summaries = _timed(
+            timings, "hybrid_search", hybrid_search,
+            user_id=user_id,
+            query_embedding=query_embedding,
+            metadata_filters=metadata_filters,
+            top_k=top_k,
+            include_content=True,
+            query=query
+        )
+
+        conversation_summaries = futures["conversation_summaries"].result()
+        persona = futures["persona"].result()
+    except Exception:
+        for future in futures.values():
+            future.cancel()
+        raise
+
+    timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+    logger.info("therapist context for user %s assembled in %sms: %s", user_id, timings["total"], timings)
+
+    return {
+        "persona": persona,
+        "journal_summaries": journal_summaries,
+        "conversation_summaries": conversation_summaries,
+        "timings": timings,
+    }
+
+
+async def _timed_async(timings: dict, stage: str, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+
+async def gather_therapist_context_async(user_id: str, query: str, top_k: int = 5, n_summaries: int = 3) -> dict:
+    """
+    gather_therapist_context for the async serving mode: same result, same timings.
+    Metadata extraction is local and cached; it runs in a worker thread because its rare
+    Gemini fallback and vocabulary loads are blocking calls.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    tasks = {
+        "conversation_summaries": asyncio.ensure_future(_timed_async(
+            timings, "conversation_summaries",
+            conversation_service.get_latest_n_summaries_async(user_id, n=n_summaries)
+        )),
+        "persona": asyncio.ensure_future(_timed_async(timings, "persona", get_persona_by_user_id_async(user_id))),
+        "embedding": asyncio.ensure_future(_timed_async(timings, "embedding", get_embedding_async(query))),
+        "metadata": asyncio.ensure_future(_timed_async(
+            timings, "metadata_extraction", asyncio.to_thread(extract_query_metadata, query, user_id)
+        )),
+    }
+
+    try:
+        query_embedding = await tasks["embedding"]
+        metadata_filters = await tasks["metadata"]
+
+        journal_summaries = await _timed_async(
+            timings, "hybrid_search",
+            hybrid_search_async(user_id, query_embedding, metadata_filters, top_k=top_k, include_content=True,
+                                query=query)
+        )
+
+        conversation_summaries = await tasks["conversation_summaries"]
+        persona = await tasks["persona"]
+    except Exception:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+    logger.info("therapist context for user %s assembled in %sms: %s", user_id, timings["total"], timings)
+
+    return {
+        "persona": persona,
+        "journal_summaries": journal_summaries,
+        "conversation_summaries": conversation_summaries,
+        "timings": timings,
+    }
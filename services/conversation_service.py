@@ -1,28 +1,31 @@
+import asyncio
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import json
-from google.cloud import firestore
-from vertexai.generative_models import GenerativeModel
-from services.create_embedding import get_embedding
-from services.embedding_store import store_embedding
-from google.protobuf.timestamp_pb2 import Timestamp
-from config import PROJECT_ID, REGION
-from services import utils
+from services.create_embedding import get_embeddings
+from services.embedding_store import store_embeddings
+import config
+from services import clients, context_cache, metrics, summary_queue, timeline, utils
 
-# Initialize Firestore + VertexAI
-db = firestore.Client(project=PROJECT_ID)
-model = GenerativeModel("gemini-2.5-flash")
 
+def _parse_json(text_output: str):
+    try:
+        return json.loads(text_output)
+    except json.JSONDecodeError:
+        cleaned = text_output.strip().strip("```json").strip("```")
+        return json.loads(cleaned)
 
-def summarize_and_store_conversation(user_id: str, user_message: str, ai_response: str):
+
+def summarize_turns(turns: list) -> list:
     """
-    Summarizes a conversation turn (user + AI), stores summary + metadata in Firestore,
-    generates embedding, and stores it in PostgreSQL for top-k retrieval.
-    Returns the summary_id.
+    Summarizes one or more conversation turns of the same user with a single Gemini call.
+    turns: list of dicts with user_message and ai_response, oldest first.
+    Returns one {"summary", "metadata"} dict per turn, in the same order.
     """
 
     # ---------------- PROMPT FOR SUMMARIZATION ----------------
-    prompt = f"""
+    if len(turns) == 1:
+        prompt = f"""
 You are summarizing a single conversation turn between a user and AI therapist.
 Combine user message and AI response into a concise summary (max 50 words).
 Return a JSON object with:
@@ -35,62 +38,252 @@ Return a JSON object with:
         "stress_level": "low, medium, high"
     }}
 }}
-User: "{user_message}"
-AI: "{ai_response}"
+User: "{turns[0]["user_message"]}"
+AI: "{turns[0]["ai_response"]}"
 """
+    else:
+        numbered = "\n".join(
+            f'Turn {i}:\nUser: "{turn["user_message"]}"\nAI: "{turn["ai_response"]}"\n'
+            for i, turn in enumerate(turns, start=1)
+        )
+        prompt = f"""
+You are summarizing {len(turns)} consecutive conversation turns between a user and AI therapist.
+Summarize EACH turn separately: combine its user message and AI response into a concise summary (max 50 words).
+Return a JSON array with exactly {len(turns)} objects, in turn order, each:
+{{
+    "summary": "...",
+    "metadata": {{
+        "mood": "overall emotional tone",
+        "topics": ["max 3 main topics"],
+        "emotions": ["max 3 main emotions"],
+        "stress_level": "low, medium, high"
+    }}
+}}
+{numbered}"""
 
     # Call Gemini
-    response = model.generate_content(prompt)
+    with metrics.span("gemini", "summarize_turns"):
+        response = clients.gemini().generate_content(prompt)
     text_output = response.candidates[0].content.parts[0].text
 
     # ---------------- PARSE SUMMARY ----------------
-    try:
-        result = json.loads(text_output)
-    except json.JSONDecodeError:
-        cleaned = text_output.strip().strip("```json").strip("```")
-        result = json.loads(cleaned)
-
-    # ---------------- STORE SUMMARY IN FIRESTORE ----------------
-    summary_id = str(uuid.uuid4())
-    db.collection("users").document(user_id)\
-      .collection("conversation_summary").document(summary_id).set({
-        "summary_text": result["summary"],
-        "metadata": result["metadata"],
-        "user_message": user_message,
-        "ai_response": ai_response,
-        "created_at": datetime.utcnow()
-    })
-
-    # ---------------- CREATE EMBEDDING AND STORE IN POSTGRES ----------------
-    embedding_vector = get_embedding(result["summary"])
-    store_embedding(
-        user_id=user_id,
-        summary_id=summary_id,
-        embedding=embedding_vector,
+    result = _parse_json(text_output)
+    results = [result] if isinstance(result, dict) else result
+    if not isinstance(results, list) or len(results) != len(turns) \
+            or not all(isinstance(r, dict) and "summary" in r for r in results):
+        raise ValueError(f"Expected {len(turns)} turn summaries from Gemini")
+    for r in results:
+        r.setdefault("metadata", {})
+    return results
+
+
+def store_conversation_summaries(user_id: str, turns: list):
+    """
+    Stores summarized turns in Firestore (one batched write) and their embeddings
+    in PostgreSQL (one batched embedding call, one insert).
+    turns: list of dicts with summary_id, user_message, ai_response, created_at, summary, metadata.
+    Ids are chosen by the caller, so retrying a batch overwrites instead of duplicating.
+    """
+    # ---------------- STORE SUMMARIES IN FIRESTORE ----------------
+    batch = clients.firestore().batch()
+    for turn in turns:
+        ref = clients.firestore().collection("users").document(user_id)\
+                .collection("conversation_summary").document(turn["summary_id"])
+        batch.set(ref, {
+            "summary_text": turn["summary"],
+            "metadata": turn["metadata"],
+            "user_message": turn["user_message"],
+            "ai_response": turn["ai_response"],
+            "created_at": turn["created_at"]
+        })
+    with metrics.span("firestore", "commit_conversation_summaries"):
+        batch.commit()
+
+    # ---------------- CREATE EMBEDDINGS AND STORE IN POSTGRES ----------------
+    embeddings = get_embeddings([turn["summary"] for turn in turns])
+    store_embeddings(
+        [
+            {
+                "user_id": user_id,
+                "summary_id": turn["summary_id"],
+                "embedding": embedding,
+                "summary": turn["summary"],
+                "metadata": turn["metadata"],
+                "created_at": turn["created_at"]
+            }
+            for turn, embedding in zip(turns, embeddings)
+        ],
         table="conversation_embeddings"
     )
 
-    return summary_id
+    # ---------------- WRITE-THROUGH TO THE CONTEXT CACHE ----------------
+    new_entries = utils.make_serializable([
+        {
+            "id": turn["summary_id"],
+            "summary_text": turn["summary"],
+            "metadata": turn["metadata"],
+            "created_at": turn["created_at"].replace(tzinfo=timezone.utc)
+            if turn["created_at"].tzinfo is None else turn["created_at"]
+        }
+        for turn in turns
+    ])
+
+    def merge(cached):
+        new_ids = {entry["id"] for entry in new_entries}
+        entries = new_entries + [entry for entry in cached if entry["id"] not in new_ids]
+        entries.sort(key=lambda entry: _sort_key(entry["created_at"]), reverse=True)
+        return entries[:config.CONTEXT_CACHE_SUMMARIES]
+
+    context_cache.update("summaries", user_id, merge)
+
+
+def summarize_and_store_conversation(user_id: str, user_message: str, ai_response: str, summary: dict = None):
+    """
+    Summarizes a conversation turn (user + AI), stores summary + metadata in Firestore,
+    generates embedding, and stores it in PostgreSQL for top-k retrieval.
+    A summary ({"summary", "metadata"}) generated together with the reply is stored as is.
+    Returns the summary_id.
+    (/therapist queues turns with services.summary_queue instead of waiting on this.)
+    """
+    turn = {
+        "summary_id": str(uuid.uuid4()),
+        "user_message": user_message,
+        "ai_response": ai_response,
+        "created_at": datetime.utcnow(),
+    }
+    turn.update(summary or summarize_turns([turn])[0])
+    store_conversation_summaries(user_id, [turn])
+    return turn["summary_id"]
+
+
+def record_turn(user_id: str, user_message: str, ai_response: str, summary: dict = None) -> str:
+    """
+    Records a /therapist turn: queued for the background summary workers, or summarized and
+    stored before returning when SUMMARY_WRITE_BEHIND is off. Returns the summary_id.
+    summary: {"summary", "metadata"} from the combined reply call (prompt_service.call_gemini_turn);
+    the turn is then only embedded and stored, without another Gemini call.
+    """
+    if config.SUMMARY_WRITE_BEHIND:
+        return summary_queue.enqueue(user_id, user_message, ai_response, summary=summary)
+    return summarize_and_store_conversation(user_id, user_message, ai_response, summary=summary)
+
+
+def _summaries_query(client, user_id: str, n: int):
+    return client.collection("users").document(user_id)\
+                 .collection("conversation_summary")\
+                 .order_by("created_at", direction="DESCENDING")\
+                 .limit(n)
+
+
+def _stored_entry(doc) -> dict:
+    data = doc.to_dict()
+    return {
+        "id": doc.id,
+        "summary_text": data.get("summary_text"),
+        "metadata": data.get("metadata"),
+        "created_at": data.get("created_at")
+    }
+
+
+def _load_latest_stored(user_id: str, n: int) -> list:
+    """Latest n stored summaries from Firestore, newest first (the context cache's loader)."""
+    summaries_ref = _summaries_query(clients.firestore(), user_id, n).stream()
+
+    # stream() is lazy: the read happens while iterating
+    with metrics.span("firestore", "latest_conversation_summaries"):
+        stored = [_stored_entry(doc) for doc in summaries_ref]
+
+    return utils.make_serializable(stored)
+
+
+async def _load_latest_stored_async(user_id: str, n: int) -> list:
+    with metrics.span("firestore", "latest_conversation_summaries"):
+        stored = [_stored_entry(doc) async for doc in _summaries_query(clients.firestore_async(), user_id, n).stream()]
+    return utils.make_serializable(stored)
 
 
 def get_latest_n_summaries(user_id: str, n: int = 3):
     """
     Fetch the latest N conversation summaries for a user.
     Returns a list of dictionaries with summary and metadata.
+    The stored summaries come from the per-user context cache when n <= CONTEXT_CACHE_SUMMARIES.
+    Turns still waiting in the write-behind queue are merged in (newest first),
+    with a provisional summary and "pending": True.
     """
-    summaries_ref = db.collection("users").document(user_id)\
-                      .collection("conversation_summary")\
-                      .order_by("created_at", direction="DESCENDING")\
-                      .limit(n).stream()
+    # Read the queue first: a turn finishing in between is then found in Firestore
+    # as well and deduplicated by id, instead of being missed by both reads
+    pending = summary_queue.pending_turns(user_id, n)
+
+    if n <= config.CONTEXT_CACHE_SUMMARIES:
+        stored = context_cache.get_or_load(
+            "summaries", user_id, lambda uid: _load_latest_stored(uid, config.CONTEXT_CACHE_SUMMARIES)
+        )[:n]
+    else:
+        stored = _load_latest_stored(user_id, n)
+
+    return _merge_pending(stored, pending, n)
+
+
+async def get_latest_n_summaries_async(user_id: str, n: int = 3):
+    """get_latest_n_summaries for the async serving mode (Firestore AsyncClient on a miss)."""
+    # the queue is a local SQLite file shared with the summary workers
+    pending = await asyncio.to_thread(summary_queue.pending_turns, user_id, n)
+
+    if n <= config.CONTEXT_CACHE_SUMMARIES:
+        stored = (await context_cache.get_or_load_async(
+            "summaries", user_id, lambda uid: _load_latest_stored_async(uid, config.CONTEXT_CACHE_SUMMARIES)
+        ))[:n]
+    else:
+        stored = await _load_latest_stored_async(user_id, n)
+
+    return _merge_pending(stored, pending, n)
+
+
+def _merge_pending(stored: list, pending: list, n: int) -> list:
+    stored_ids = {entry["id"] for entry in stored}
+    merged = stored + [
+        {
+            "id": turn["summary_id"],
+            "summary_text": turn.get("summary") or summary_queue.provisional_summary(turn),
+            "metadata": turn.get("metadata") or {},
+            "created_at": turn["created_at"],
+            "pending": True
+        }
+        for turn in pending if turn["summary_id"] not in stored_ids
+    ]
+    merged.sort(key=lambda entry: _sort_key(entry["created_at"]), reverse=True)
 
     result = []
-    for doc in summaries_ref:
-        data = doc.to_dict()
-        
-        result.append({
-            "summary_text": data.get("summary_text"),
-            "metadata": data.get("metadata")
-        })
+    for entry in merged[:n]:
+        item = {"summary_text": entry["summary_text"], "metadata": entry["metadata"]}
+        if entry.get("pending"):
+            item["pending"] = True
+        result.append(item)
 
     return utils.make_serializable(result)
 
+
+def _sort_key(created_at) -> float:
+    """Stored summaries carry ISO strings (aware UTC), queued turns naive UTC datetimes."""
+    if created_at is None:
+        return 0.0
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+LIST_CONVERSATION_FIELDS = ["summary_text", "metadata"]
+
+
+def list_conversations(user_id: str, limit: int = None, cursor: str = None, start_date: str = None,
+                       end_date: str = None, moods: list = None) -> dict:
+    """
+    One page of the user's stored conversation summaries, newest first (summary_text, metadata,
+    created_at; the full turn texts stay in Firestore). Turns still queued for summarization
+    appear once stored. Raises ValueError on bad parameters.
+    """
+    page = timeline.list_page(user_id, "conversation_summary", LIST_CONVERSATION_FIELDS, limit=limit,
+                              cursor=cursor, start=start_date, end=end_date, moods=moods)
+    return timeline.serialize(page, "id", LIST_CONVERSATION_FIELDS)
@@ -1,18 +1,107 @@
-import vertexai
-from vertexai.language_models import TextEmbeddingModel
-from config import PROJECT_ID, REGION, EMBEDDING_MODEL
+import asyncio
+
+import config
+from services import clients, embedding_cache, metrics
+from services.embedding_batcher import EmbeddingBatcher
+
+
+def _embed_batch(texts: list) -> list:
+    """Single Vertex call for a list of texts."""
+    with metrics.span("vertex_embedding", "get_embeddings"):
+        return [e.values for e in clients.embedding_model().get_embeddings(texts)]
+
+
+batcher = EmbeddingBatcher(
+    _embed_batch,
+    max_batch_size=config.EMBEDDING_BATCH_SIZE,
+    linger_ms=config.EMBEDDING_BATCH_LINGER_MS,
+    max_in_flight=config.EMBEDDING_BATCH_MAX_IN_FLIGHT
+)
 
-vertexai.init(project=PROJECT_ID, location=REGION)
-embedding_model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL)
 
 def get_embedding(text: str):
     """
     Converts any text (journal summary or query) into a vector embedding.
+    Served from the embedding cache when the same text was embedded before;
+    otherwise merged with concurrent requests into one batched Vertex call.
     """
+    cached = embedding_cache.get(text)
+    if cached is not None:
+        return cached
+
     try:
-        embedding = embedding_model.get_embeddings([text])[0].values
-        print("Embedding length:", len(embedding))
-        return embedding
+        embedding = batcher.embed(text)
     except Exception as e:
         # Use the original exception message, don't reference `embedding` which may not exist
-        raise Exception("Embedding generation failed: " + str(e))
\ No newline at end of file
+        raise Exception("Embedding generation failed: " + str(e))
+
+    embedding_cache.put(text, embedding)
+    return embedding
+
+
+def get_embeddings(texts: list) -> list:
+    """
+    Embeds several texts; cached ones are served locally and the rest go out in batches.
+    Returns one vector per text, in the same order.
+    """
+    results = [embedding_cache.get(text) for text in texts]
+    missing = [text for text, vector in zip(texts, results) if vector is None]
+
+    if missing:
+        try:
+            vectors = batcher.embed_many(missing)
+        except Exception as e:
+            raise Exception("Embedding generation failed: " + str(e))
+        computed = dict(zip(missing, vectors))
+        for text, vector in computed.items():
+            embedding_cache.put(text, vector)
+        results = [vector if vector is not None else computed[text] for text, vector in zip(texts, results)]
+
+    return results
+
+
+# ---------------- ASYNC (asgi.py) ----------------
+async def _embed_batch_async(texts: list) -> list:
+    with metrics.span("vertex_embedding", "get_embeddings"):
+        return [e.values for e in await clients.embedding_model().get_embeddings_async(texts)]
+
+
+async def _cache_get_many(texts: list) -> list:
+    if config.EMBEDDING_CACHE_PERSIST:
+        # the persistent tier reads Postgres through the sync pool
+        return await asyncio.to_thread(lambda: [embedding_cache.get(text) for text in texts])
+    return [embedding_cache.get(text) for text in texts]
+
+
+async def _cache_put_many(items: dict):
+    if config.EMBEDDING_CACHE_PERSIST:
+        await asyncio.to_thread(lambda: [embedding_cache.put(text, vector) for text, vector in items.items()])
+    else:
+        for text, vector in items.items():
+            embedding_cache.put(text, vector)
+
+
+async def get_embeddings_async(texts: list) -> list:
+    """
+    get_embeddings without blocking the event loop: cached texts are served locally and
+    the rest are embedded with concurrent get_embeddings_async calls of up to
+    EMBEDDING_BATCH_SIZE texts each.
+    """
+    results = await _cache_get_many(texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+
+    if missing:
+        chunks = [missing[i:i + config.EMBEDDING_BATCH_SIZE] for i in range(0, len(missing), config.EMBEDDING_BATCH_SIZE)]
+        try:
+            vectors = [v for chunk in await asyncio.gather(*map(_embed_batch_async, chunks)) for v in chunk]
+        except Exception as e:
+            raise Exception("Embedding generation failed: " + str(e))
+        computed = dict(zip(missing, vectors))
+        await _cache_put_many(computed)
+        results = [vector if vector is not None else computed[text] for text, vector in zip(texts, results)]
+
+    return results
+
+
+async def get_embedding_async(text: str):
+    return (await get_embeddings_async([text]))[0]
@@ -1,24 +1,337 @@
-from psycopg2 import pool, OperationalError
+"""
+Thread-safe PostgreSQL connection pool shared by gunicorn's threaded worker.
+
+- checkout waits up to PG_POOL_TIMEOUT seconds for a free connection instead of
+  failing immediately with "pool exhausted"
+- idle connections are liveness-checked before reuse and recycled after
+  PG_POOL_MAX_LIFETIME (e.g. after a Cloud SQL failover)
+- per-connection setup runs once: pgvector registration and server-side
+  prepared statements registered with register_prepared_statement()
+- stats() exposes in-use/idle counts, wait time and checkout latency
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import OperationalError, DatabaseError, extensions
+from pgvector.psycopg2 import register_vector
+
 import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(ConnectionError):
+    """No connection became available within the checkout timeout."""
+
+
+# name -> "name (arg types) AS sql" for server-side prepared statements created on every connection
+_prepared_statements = {}
+
+
+def register_prepared_statement(name: str, sql: str, arg_types: tuple = ()):
+    """
+    Registers a statement to be PREPAREd once on each pooled connection.
+    Use $1, $2, ... placeholders; run it with EXECUTE name (...) when is_prepared() is true.
+    """
+    signature = f" ({', '.join(arg_types)})" if arg_types else ""
+    _prepared_statements[name] = f"{name}{signature} AS {sql}"
+
+
+class ConnectionPool:
+    def __init__(self, minconn: int, maxconn: int, timeout: float, max_lifetime: float,
+                 max_idle: float, check_after: float, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()    # connections ready for checkout (most recently used on the right)
+        self._info = {}         # conn -> {"created", "last_used", "prepared", "checked_out"}
+        self._size = 0          # open connections, including ones being opened
+        self._waiting = 0       # callers blocked in checkout
+
+        # metrics
+        self.checkouts = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.failed_checks = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self._checkout_latencies = deque(maxlen=1024)
+
+    # ---------------- CHECKOUT / RETURN ----------------
+    def getconn(self, timeout: float = None):
+        start = time.monotonic()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = start + timeout
+
+        while True:
+            conn, open_new = self._reserve(deadline, timeout)
+            if open_new:
+                conn = self._open()
+            # Whatever goes wrong while readying a connection, its slot is freed
+            try:
+                if open_new or self._usable(conn):
+                    self._prepare(conn)
+                    break
+            except Exception as e:
+                logger.warning("Discarding connection that failed checkout: %s", e)
+                if open_new:
+                    self._discard(conn)
+                    raise
+            self._discard(conn)
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._info[conn]["checked_out"] = time.monotonic()
+            self.checkouts += 1
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
+            self._checkout_latencies.append(elapsed)
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        info = self._info.get(conn)
+        if info is None:
+            return
+
+        if not discard and not conn.closed:
+            # Never hand the next caller an open or failed transaction
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except (OperationalError, DatabaseError):
+                    discard = True
+
+        if discard or conn.closed or time.monotonic() - info["created"] > self.max_lifetime:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            info["last_used"] = time.monotonic()
+            info["checked_out"] = None
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager: checks out a connection and always returns it (rolled back on error)."""
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except (OperationalError, DatabaseError):
+                    discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def is_prepared(self, conn, name: str) -> bool:
+        info = self._info.get(conn)
+        return bool(info) and name in info["prepared"]
+
+    def closeall(self):
+        with self._cond:
+            conns = list(self._info)
+            self._idle.clear()
+            self._info.clear()
+            self._size = 0
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # ---------------- METRICS ----------------
+    def stats(self) -> dict:
+        with self._cond:
+            latencies = sorted(self._checkout_latencies)
+            in_use = sum(1 for info in self._info.values() if info["checked_out"] is not None)
+            waiting = self._waiting
+            checkouts = self.checkouts
+            return {
+                "size": self._size,
+                "max_size": self.maxconn,
+                "in_use": in_use,
+                "idle": len(self._idle),
+                "waiting": waiting,
+                "checkouts": checkouts,
+                "timeouts": self.timeouts,
+                "recycled": self.recycled,
+                "failed_liveness_checks": self.failed_checks,
+                "wait_time_avg_ms": round(self.wait_time_total / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+                "checkout_p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+                "checkout_p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+            }
+
+    # ---------------- INTERNAL ----------------
+    def _reserve(self, deadline: float, timeout: float):
+        """Returns (idle_conn, False) or (None, True) when a new connection may be opened."""
+        with self._cond:
+            while True:
+                self._reap_idle()
+                if self._idle:
+                    return self._idle.pop(), False
+                if self._size < self.maxconn:
+                    self._size += 1
+                    return None, True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {timeout}s "
+                        f"({self.maxconn} connections in use)"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _reap_idle(self):
+        """Closes connections idle longer than max_idle while keeping minconn around (lock held)."""
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn:
+            oldest = self._idle[0]
+            if now - self._info[oldest]["last_used"] <= self.max_idle:
+                break
+            self._idle.popleft()
+            self._info.pop(oldest, None)
+            self._size -= 1
+            try:
+                oldest.close()
+            except Exception:
+                pass
+
+    def _open(self):
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+            register_vector(conn)
+            conn.commit()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        now = time.monotonic()
+        with self._cond:
+            self._info[conn] = {"created": now, "last_used": now, "prepared": set(),
+                                "prepare_failed": set(), "checked_out": None}
+        return conn
+
+    def _usable(self, conn) -> bool:
+        info = self._info[conn]
+        now = time.monotonic()
+        if conn.closed or now - info["created"] > self.max_lifetime:
+            return False
+        if now - info["last_used"] > self.check_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                # includes InterfaceError (connection already closed)
+                self.failed_checks += 1
+                return False
+        return True
+
+    def _discard(self, conn):
+        """Closes a dead, broken or expired connection and frees its slot."""
+        with self._cond:
+            self._info.pop(conn, None)
+            self.recycled += 1
+            self._size -= 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _prepare(self, conn):
+        """PREPAREs any registered statements this connection does not have yet."""
+        info = self._info[conn]
+        missing = [name for name in _prepared_statements
+                   if name not in info["prepared"] and name not in info["prepare_failed"]]
+        for name in missing:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"PREPARE {_prepared_statements[name]}")
+                conn.commit()
+                info["prepared"].add(name)
+            except (OperationalError, DatabaseError) as e:
+                conn.rollback()  # a broken connection raises here; getconn discards it
+                logger.warning("Could not prepare statement %s: %s", name, e)
+                # don't retry on every checkout; callers fall back to plain SQL
+                info["prepare_failed"].add(name)
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Initialize connection pool once (connections are opened on first use)
+conn_pool = ConnectionPool(
+    minconn=config.PG_POOL_MIN,
+    maxconn=config.PG_POOL_MAX,
+    timeout=config.PG_POOL_TIMEOUT,
+    max_lifetime=config.PG_POOL_MAX_LIFETIME,
+    max_idle=config.PG_POOL_MAX_IDLE,
+    check_after=config.PG_POOL_CHECK_AFTER,
+    host=config.PG_HOST,
+    dbname=config.PG_DB,
+    user=config.PG_USER,
+    password=config.PG_PASSWORD,
+    port=config.PG_PORT
+)
+
+
+metrics.register_gauge(
+    "reflect_db_pool_connections", "Pooled Postgres connections by state (waiting = blocked callers).",
+    lambda: {(state,): value for state, value in conn_pool.stats().items() if state in ("in_use", "idle", "waiting")},
+    labels=("state",)
+)
 
-# Initialize connection pool once
-try:
-    conn_pool = pool.SimpleConnectionPool(
-        minconn=1,
-        maxconn=10,
-        host=config.PG_HOST,
-        dbname=config.PG_DB,
-        user=config.PG_USER,
-        password=config.PG_PASSWORD,
-        port=config.PG_PORT
-    )
-except OperationalError as e:
-    raise ConnectionError(f"Unable to create connection pool: {e}")
 
 def get_connection():
-    """Fetch a connection from the pool"""
+    """Fetch a connection from the pool (waits up to PG_POOL_TIMEOUT, then raises PoolTimeout)"""
     return conn_pool.getconn()
 
+
 def release_connection(conn):
     """Return connection back to the pool"""
     conn_pool.putconn(conn)
+
+
+def connection():
+    """Context manager for a pooled connection: `with connection() as conn: ...`"""
+    return conn_pool.connection()
+
+
+def is_prepared(conn, name: str) -> bool:
+    """True if the registered prepared statement `name` exists on this connection"""
+    return conn_pool.is_prepared(conn, name)
+
+
+def pool_stats() -> dict:
+    return conn_pool.stats()
@@ -0,0 +1,103 @@
+# services/embedding_batcher.py
+"""
+Micro-batching dispatcher for embedding requests.
+Concurrent callers submit single texts; a collector thread waits up to
+linger_ms (or until max_batch_size texts are queued), sends one batched call
+to the embedding model and hands each caller its own vector.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_fn, max_batch_size: int = 32, linger_ms: float = 5, max_in_flight: int = 4):
+        """
+        Parameters:
+        - embed_fn: callable(list[str]) -> list[list[float]], one vector per text, same order
+        - max_batch_size: int - most texts sent in a single call
+        - linger_ms: float - how long the first text in a batch waits for company
+        - max_in_flight: int - batched calls allowed to run at the same time
+        """
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.linger = max(0.0, linger_ms) / 1000.0
+
+        self._queue = queue.Queue()
+        self._dispatch_pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-batch")
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.batches = 0
+        self.texts = 0
+
+    def submit(self, text: str) -> Future:
+        """Queue a text; the returned future resolves to its embedding."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> list:
+        return self.submit(text).result()
+
+    def embed_many(self, texts: list) -> list:
+        """Queue several texts at once (they are batched together) and wait for all of them."""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    # -- internal --
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name="embed-collector", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._dispatch_pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list):
+        # Identical texts in one batch are only sent once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.texts += len(unique_texts)
+        try:
+            vectors = self.embed_fn(unique_texts)
+            if len(vectors) != len(unique_texts):
+                raise RuntimeError(f"Expected {len(unique_texts)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            logger.warning("Batched embedding call for %d texts failed: %s", len(unique_texts), e)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        by_text = dict(zip(unique_texts, vectors))
+        for text, future in batch:
+            future.set_result(by_text[text])
@@ -0,0 +1,124 @@
+# services/embedding_cache.py
+"""
+Content-addressed cache for text embeddings.
+Keys are the embedding model name plus a SHA-256 of the normalized text, so a
+change to config.EMBEDDING_MODEL never serves vectors from the old model.
+Vectors are stored as float32 byte buffers in an in-process LRU tier (bounded by
+size) and, optionally, in a persistent Postgres table (embedding_cache).
+"""
+
+import hashlib
+import logging
+import threading
+import unicodedata
+
+import numpy as np
+from psycopg2 import DatabaseError, OperationalError
+
+import config
+from services import metrics
+from services.cache import LRUCache
+from services.db_connection import connection, PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+_memory = LRUCache(max_bytes=config.EMBEDDING_CACHE_MAX_BYTES, sizeof=len)
+
+_lock = threading.Lock()
+_persistent_hits = 0
+_persistent_misses = 0
+_persistent_errors = 0
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC + collapsed whitespace; case is kept since it can change the embedding."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text: str, model: str = None) -> str:
+    model = model or config.EMBEDDING_MODEL
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _encode(embedding) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def _decode(buf: bytes) -> list:
+    return np.frombuffer(buf, dtype=np.float32).tolist()
+
+
+# ---------------- PERSISTENT TIER (Postgres) ----------------
+def _load_persistent(key: str):
+    global _persistent_hits, _persistent_misses, _persistent_errors
+    try:
+        with metrics.span("postgres", "embedding_cache_read"), connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT embedding FROM embedding_cache WHERE cache_key = %s", (key,))
+                row = cur.fetchone()
+            conn.commit()
+    except (OperationalError, DatabaseError, PoolTimeout) as e:
+        with _lock:
+            _persistent_errors += 1
+        logger.warning("Embedding cache read failed: %s", e)
+        return None
+
+    with _lock:
+        if row:
+            _persistent_hits += 1
+        else:
+            _persistent_misses += 1
+    return bytes(row[0]) if row else None
+
+
+def _store_persistent(key: str, buf: bytes):
+    global _persistent_errors
+    try:
+        with metrics.span("postgres", "embedding_cache_write"), connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO embedding_cache (cache_key, model, embedding)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (cache_key) DO NOTHING
+                    """,
+                    (key, key.split(":", 1)[0], buf)
+                )
+            conn.commit()
+    except (OperationalError, DatabaseError, PoolTimeout) as e:
+        with _lock:
+            _persistent_errors += 1
+        logger.warning("Embedding cache write failed: %s", e)
+
+
+# ---------------- PUBLIC API ----------------
+def get(text: str, model: str = None):
+    """Returns the cached embedding (list of floats) or None."""
+    key = cache_key(text, model)
+    buf = _memory.get(key)
+    if buf is None and config.EMBEDDING_CACHE_PERSIST:
+        buf = _load_persistent(key)
+        if buf is not None:
+            _memory.put(key, buf)
+    return _decode(buf) if buf is not None else None
+
+
+def put(text: str, embedding, model: str = None):
+    """Caches an embedding in every enabled tier."""
+    key = cache_key(text, model)
+    buf = _encode(embedding)
+    _memory.put(key, buf)
+    if config.EMBEDDING_CACHE_PERSIST:
+        _store_persistent(key, buf)
+
+
+def stats() -> dict:
+    with _lock:
+        persistent = {
+            "enabled": config.EMBEDDING_CACHE_PERSIST,
+            "hits": _persistent_hits,
+            "misses": _persistent_misses,
+            "errors": _persistent_errors,
+        }
+    return {"memory": _memory.stats(), "persistent": persistent}
@@ -1,43 +1,177 @@
-from services.db_connection import get_connection, release_connection
+from services.db_connection import connection
 from psycopg2 import DatabaseError, OperationalError
-from pgvector.psycopg2 import register_vector
+from psycopg2.extras import execute_values
+import numpy as np
+import io
+import json
+import struct
+from datetime import datetime, timezone
 import config
+from services import metrics, user_vector_index
 
-def store_embedding(user_id: str, summary_id: str, embedding: list, table: str = "journal_embeddings"):
+# Binary COPY header: signature, flags, header-extension length
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+
+
+def _id_column(table: str) -> str:
+    return "journal_id" if table == "journal_embeddings" else "summary_id"
+
+
+def _validate_embedding(embedding):
+    if isinstance(embedding, np.ndarray):
+        if embedding.ndim != 1 or embedding.size == 0:
+            raise ValueError("Embedding must be a non-empty 1-D array of floats")
+    elif not embedding or not isinstance(embedding, list):
+        raise ValueError("Embedding must be a non-empty list of floats")
+
+
+def _vector_binary(embedding) -> bytes:
+    """pgvector binary wire format: int16 dim, int16 unused, dim x big-endian float4."""
+    vec = np.asarray(embedding, dtype=">f4")
+    return struct.pack("!hh", vec.shape[0], 0) + vec.tobytes()
+
+
+# Postgres binary timestamps count microseconds from 2000-01-01
+_PG_EPOCH = datetime(2000, 1, 1)
+
+
+def _timestamp_binary(value: datetime) -> bytes:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - _PG_EPOCH
+    return struct.pack("!q", (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def _copy_payload(rows: list) -> io.BytesIO:
+    """
+    Builds a binary COPY stream for staging rows:
+    (item_id text, user_id text, embedding vector, summary text, metadata jsonb, created_at timestamp)
+    """
+    buf = io.BytesIO()
+    buf.write(_PGCOPY_HEADER)
+    for row in rows:
+        metadata = row.get("metadata")
+        fields = (
+            row["summary_id"].encode("utf-8"),
+            row["user_id"].encode("utf-8"),
+            _vector_binary(row["embedding"]),
+            row["summary"].encode("utf-8") if row.get("summary") is not None else None,
+            b"\x01" + json.dumps(metadata).encode("utf-8") if metadata is not None else None,
+            _timestamp_binary(row["created_at"]) if row.get("created_at") else None,
+        )
+        buf.write(struct.pack("!h", len(fields)))
+        for field in fields:
+            if field is None:
+                buf.write(struct.pack("!i", -1))
+                continue
+            buf.write(struct.pack("!i", len(field)))
+            buf.write(field)
+    buf.write(_PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def store_embedding(user_id: str, summary_id: str, embedding: list, table: str = "journal_embeddings",
+                    summary: str = None, metadata: dict = None, created_at: datetime = None):
     """
     Store a single embedding (journal or conversation) in PostgreSQL using connection pool.
+    Re-storing the same id overwrites the previous vector.
     
     Parameters:
     - user_id: str
     - summary_id: str (journal_id or conversation summary_id)
-    - embedding: list of floats
+    - embedding: list of floats or 1-D numpy array
     - table: str - table name ('journal_embeddings' or 'conversation_embeddings')
+    - summary, metadata, created_at: optional content stored next to the vector so
+      retrieval can return it without a Firestore round trip
     """
-    if not embedding or not isinstance(embedding, list):
-        raise ValueError("Embedding must be a non-empty list of floats")
-    
-    # Determine column name based on table
-    column_id = "journal_id" if table == "journal_embeddings" else "summary_id"
+    store_embeddings([{
+        "user_id": user_id,
+        "summary_id": summary_id,
+        "embedding": embedding,
+        "summary": summary,
+        "metadata": metadata,
+        "created_at": created_at
+    }], table)
 
-    insert_query = f"""
-        INSERT INTO {table} ({column_id}, user_id, embedding)
-        VALUES (%s, %s, %s)
+
+def store_embeddings(rows: list, table: str = "journal_embeddings"):
     """
-    
-    conn = None
-    try:
-        conn = get_connection()
+    Store many embeddings in one transaction, upserting on the table's unique id column
+    so retries never fail on duplicate keys.
+    Small batches use a multi-row INSERT; batches of EMBEDDING_COPY_THRESHOLD rows or more
+    are streamed with binary COPY into a staging table and upserted from there.
 
-        # Register pgvector on this connection
-        register_vector(conn)
+    Parameters:
+    - rows: list of dicts with user_id, summary_id (journal_id or conversation summary_id)
+      and embedding (list of floats or float32 numpy array); optionally summary, metadata
+      (dict) and created_at (datetime, defaults to NOW())
+    - table: str - table name ('journal_embeddings' or 'conversation_embeddings')
+    """
+    if not rows:
+        return
+    for row in rows:
+        _validate_embedding(row.get("embedding"))
 
-        with conn.cursor() as cur:
-            cur.execute(insert_query, (summary_id, user_id, embedding))
-            conn.commit()
+    # ON CONFLICT cannot touch the same row twice in one statement; last write wins
+    rows = list({row["summary_id"]: row for row in rows}.values())
+
+    column_id = _id_column(table)
+    columns = f"{column_id}, user_id, embedding, summary, metadata, created_at"
+    # Content is only overwritten when the new row carries it; created_at keeps the first write.
+    # Identical re-writes (retried journal writes) leave the row alone: no new tuple version,
+    # no ANN / GIN index maintenance.
+    upsert = f"""
+        ON CONFLICT ({column_id}) DO UPDATE
+        SET user_id = EXCLUDED.user_id,
+            embedding = EXCLUDED.embedding,
+            summary = COALESCE(EXCLUDED.summary, {table}.summary),
+            metadata = COALESCE(EXCLUDED.metadata, {table}.metadata)
+        WHERE ({table}.user_id, {table}.embedding, {table}.summary, {table}.metadata)
+              IS DISTINCT FROM (EXCLUDED.user_id, EXCLUDED.embedding,
+                                COALESCE(EXCLUDED.summary, {table}.summary),
+                                COALESCE(EXCLUDED.metadata, {table}.metadata))
+    """
+
+    try:
+        with metrics.span("postgres", f"store_{table}"), connection() as conn:
+            with conn.cursor() as cur:
+                if len(rows) >= config.EMBEDDING_COPY_THRESHOLD:
+                    cur.execute("""
+                        CREATE TEMP TABLE embedding_staging (
+                            item_id TEXT, user_id TEXT, embedding vector,
+                            summary TEXT, metadata JSONB, created_at TIMESTAMP
+                        ) ON COMMIT DROP
+                    """)
+                    cur.copy_expert(
+                        "COPY embedding_staging FROM STDIN WITH (FORMAT BINARY)",
+                        _copy_payload(rows)
+                    )
+                    cur.execute(f"""
+                        INSERT INTO {table} ({columns})
+                        SELECT item_id, user_id, embedding, summary, metadata, COALESCE(created_at, NOW())
+                        FROM embedding_staging
+                        {upsert}
+                    """)
+                else:
+                    execute_values(
+                        cur,
+                        f"INSERT INTO {table} ({columns}) VALUES %s {upsert}",
+                        [
+                            (
+                                row["summary_id"], row["user_id"], row["embedding"], row.get("summary"),
+                                json.dumps(row["metadata"]) if row.get("metadata") is not None else None,
+                                row.get("created_at")
+                            )
+                            for row in rows
+                        ],
+                        template="(%s, %s, %s, %s, %s::jsonb, COALESCE(%s::timestamp, NOW()))",
+                        page_size=len(rows)
+                    )
+                conn.commit()
     except (OperationalError, DatabaseError) as e:
-        if conn:
-            conn.rollback()
-        raise RuntimeError(f"Error storing embedding: {e}")
-    finally:
-        if conn:
-            release_connection(conn)
+        raise RuntimeError(f"Error storing embeddings: {e}")
+
+    if table == "journal_embeddings":
+        user_vector_index.apply_writes(rows)
@@ -1,17 +1,37 @@
 # search/hybrid_search.py
 """
-Hybrid search (vector + metadata) using PostgreSQL (pgvector) and Firestore.
-This version fixes the operator mismatch error by casting the embedding string to vector.
+Hybrid search (vector + metadata) in a single PostgreSQL statement, for one query
+or a batch of queries (search_journals_batch; search_journals is a batch of one).
+Vector candidates come from pgvector, metadata candidates from jsonb containment
+filters on the same table (GIN-indexed), and both lists are fused in SQL with
+reciprocal-rank fusion or score-weighted fusion (config.HYBRID_FUSION).
+Journal summaries/metadata are stored next to the vectors, so results carry their content.
+With config.VECTOR_INDEX_ENABLED the same search runs in-process over the user's cached
+vectors (services/user_vector_index.py) and Postgres is only read to load them.
+The *_async variants serve asgi.py with the same SQL over asyncpg (services/async_db.py).
+Given the query text, results are cached per user (services/search_cache.py).
 """
 
 from typing import List, Dict, Any
-from services.db_connection import get_connection, release_connection
-from google.cloud import firestore
+from datetime import date, datetime, time, timedelta
+import asyncio
+import json
 import logging
 
-db = firestore.Client()
+import numpy as np
+
+import config
+from services.db_connection import connection, is_prepared, register_prepared_statement
+from services import async_db, journal_service, metrics, search_cache, user_vector_index, utils
+from services.ann_index import user_search_settings_sql, user_search_settings_sql_async
+
 logger = logging.getLogger(__name__)
 
+# Filters matched when ANY of the listed values is present in the journal's metadata array
+ANY_OF_FILTERS = ("people", "emotions", "tags")
+# Filters matched by equality on a metadata field
+EXACT_FILTERS = ("mood", "stress_level", "date")
+
 
 def _format_embedding_for_pg(embedding: List[float]) -> str:
     """Convert a Python list of floats into Postgres vector literal string"""
@@ -19,63 +39,514 @@ def _format_embedding_for_pg(embedding: List[float]) -> str:
     return f"[{elems}]"
 
 
-def vector_search(user_id: str, query_embedding: List[float], top_k: int = 5) -> List[str]:
-    """Vector similarity search"""
-    conn = None
-    try:
-        emb_literal = _format_embedding_for_pg(query_embedding)
-        conn = get_connection()
+VECTOR_SEARCH_SQL = """
+    SELECT journal_id, 1 - (embedding <=> {embedding}) AS similarity, summary, metadata, created_at
+    FROM journal_embeddings
+    WHERE user_id = {user_id}
+    ORDER BY embedding <=> {embedding}
+    LIMIT {top_k}
+"""
+
+# Prepared once per pooled connection; plain SQL is the fallback
+register_prepared_statement(
+    "journal_vector_search",
+    VECTOR_SEARCH_SQL.format(embedding="$1", user_id="$2", top_k="$3"),
+    arg_types=("vector", "text", "integer")
+)
+
+# Any number of queries for one user in one statement: each query row gets its own
+# LATERAL nearest-neighbour scan and, when it has filters, its own filtered scan.
+# Per-query filters are NULL when unused; list filters are jsonb arrays of containment docs.
+BATCH_SEARCH_SQL = """
+    WITH queries AS (
+        SELECT *
+        FROM unnest(
+            %(embeddings)s::vector[], %(f_people)s::jsonb[], %(f_emotions)s::jsonb[], %(f_tags)s::jsonb[],
+            %(f_exact)s::jsonb[], %(f_date_from)s::date[], %(f_date_to)s::date[]
+        ) WITH ORDINALITY AS q(embedding, people, emotions, tags, exact, date_from, date_to, query_index)
+    ),
+    vector_hits AS (
+        SELECT q.query_index, hit.journal_id,
+               row_number() OVER (PARTITION BY q.query_index ORDER BY hit.distance) AS rank
+        FROM queries q
+        CROSS JOIN LATERAL (
+            SELECT journal_id, embedding <=> q.embedding AS distance
+            FROM journal_embeddings
+            WHERE user_id = %(user_id)s
+            ORDER BY distance
+            LIMIT %(candidates)s
+        ) hit
+    ),
+    metadata_hits AS (
+        SELECT q.query_index, hit.journal_id,
+               row_number() OVER (PARTITION BY q.query_index ORDER BY hit.distance) AS rank
+        FROM queries q
+        CROSS JOIN LATERAL (
+            SELECT journal_id, embedding <=> q.embedding AS distance
+            FROM journal_embeddings
+            WHERE user_id = %(user_id)s
+              AND (q.people IS NULL OR metadata @> ANY(ARRAY(SELECT jsonb_array_elements(q.people))))
+              AND (q.emotions IS NULL OR metadata @> ANY(ARRAY(SELECT jsonb_array_elements(q.emotions))))
+              AND (q.tags IS NULL OR metadata @> ANY(ARRAY(SELECT jsonb_array_elements(q.tags))))
+              AND (q.exact IS NULL OR metadata @> q.exact)
+              AND (q.date_from IS NULL OR created_at >= q.date_from)
+              AND (q.date_to IS NULL OR created_at < q.date_to + 1)
+            ORDER BY distance
+            LIMIT %(candidates)s
+        ) hit
+        WHERE num_nonnulls(q.people, q.emotions, q.tags, q.exact, q.date_from, q.date_to) > 0
+    ),
+    candidates AS (
+        SELECT COALESCE(v.query_index, m.query_index) AS query_index,
+               COALESCE(v.journal_id, m.journal_id) AS journal_id,
+               v.rank AS vector_rank, m.rank AS metadata_rank
+        FROM vector_hits v
+        FULL OUTER JOIN metadata_hits m ON m.query_index = v.query_index AND m.journal_id = v.journal_id
+    ),
+    scored AS (
+        SELECT c.query_index, c.journal_id, c.vector_rank, c.metadata_rank,
+               1 - (je.embedding <=> q.embedding) AS similarity,
+               je.summary, je.metadata, je.created_at
+        FROM candidates c
+        JOIN queries q ON q.query_index = c.query_index
+        JOIN journal_embeddings je ON je.journal_id = c.journal_id
+    ),
+    ranked AS (
+        SELECT scored.*, {score} AS score
+        FROM scored
+    ),
+    positioned AS (
+        SELECT ranked.*, row_number() OVER (PARTITION BY query_index ORDER BY score DESC, similarity DESC) AS position
+        FROM ranked
+    )
+    SELECT query_index, journal_id, score, similarity, summary, metadata, created_at
+    FROM positioned
+    WHERE position <= %(top_k)s
+    ORDER BY query_index, position
+"""
+
+RRF_SCORE = """(
+    COALESCE(%(vector_weight)s / (%(rrf_k)s + vector_rank), 0)
+    + COALESCE(%(metadata_weight)s / (%(rrf_k)s + metadata_rank), 0)
+)"""
+
+WEIGHTED_SCORE = """(
+    %(vector_weight)s * similarity
+    + CASE WHEN metadata_rank IS NOT NULL THEN %(metadata_weight)s ELSE 0 END
+)"""
+
+
+def _filter_params(metadata_filters: Dict[str, Any]) -> dict:
+    """
+    One query's metadata filters as BATCH_SEARCH_SQL parameters (None = not filtered).
+    Different filters are ANDed, values within one list filter are ORed (jsonb containment).
+    _metadata_predicate applies the same filters in process.
+    """
+    params = {}
+    for key in ANY_OF_FILTERS:
+        values = [v for v in (metadata_filters.get(key) or []) if v]
+        params[f"f_{key}"] = json.dumps([{key: [v]} for v in values]) if values else None
+
+    exact = {key: metadata_filters[key] for key in EXACT_FILTERS if metadata_filters.get(key)}
+    params["f_exact"] = json.dumps(exact) if exact else None
+
+    params["f_date_from"] = date.fromisoformat(metadata_filters["date_from"]) \
+        if metadata_filters.get("date_from") else None
+    params["f_date_to"] = date.fromisoformat(metadata_filters["date_to"]) \
+        if metadata_filters.get("date_to") else None
+    return params
+
+
+def _has_filters(params: dict) -> bool:
+    return any(value is not None for value in params.values())
+
+
+def _fusion_params() -> dict:
+    return {
+        "rrf_k": config.HYBRID_RRF_K,
+        "vector_weight": config.HYBRID_VECTOR_WEIGHT,
+        "metadata_weight": config.HYBRID_METADATA_WEIGHT,
+    }
+
+
+def _fused_score(vector_rank: int, metadata_rank: int, similarity: float) -> float:
+    """Same formulas as RRF_SCORE / WEIGHTED_SCORE; a rank is None when the row is not in that list."""
+    if config.HYBRID_FUSION == "weighted":
+        bonus = config.HYBRID_METADATA_WEIGHT if metadata_rank is not None else 0
+        return config.HYBRID_VECTOR_WEIGHT * similarity + bonus
+    score = 0.0
+    if vector_rank is not None:
+        score += config.HYBRID_VECTOR_WEIGHT / (config.HYBRID_RRF_K + vector_rank)
+    if metadata_rank is not None:
+        score += config.HYBRID_METADATA_WEIGHT / (config.HYBRID_RRF_K + metadata_rank)
+    return score
+
+
+def _vector_only_score(rank: int, similarity: float) -> float:
+    """Score for results that have no metadata match."""
+    return _fused_score(rank, None, similarity)
+
+
+def _metadata_predicate(metadata_filters: Dict[str, Any]):
+    """
+    In-process equivalent of the metadata_hits filters in BATCH_SEARCH_SQL (parameters from
+    _filter_params); keep the two in sync. Returns fn(metadata, created_at) -> bool, or None
+    if there is nothing to filter on.
+    """
+    any_of = {key: [v for v in (metadata_filters.get(key) or []) if v] for key in ANY_OF_FILTERS}
+    any_of = {key: values for key, values in any_of.items() if values}
+    exact = {key: metadata_filters[key] for key in EXACT_FILTERS if metadata_filters.get(key)}
+    date_from = date_to = None
+    if metadata_filters.get("date_from"):
+        date_from = datetime.combine(date.fromisoformat(metadata_filters["date_from"]), time.min)
+    if metadata_filters.get("date_to"):
+        date_to = datetime.combine(date.fromisoformat(metadata_filters["date_to"]) + timedelta(days=1), time.min)
+
+    if not (any_of or exact or date_from or date_to):
+        return None
+
+    def _contains(field, value) -> bool:
+        # jsonb containment: equal, or an array holding the value
+        return field == value or (isinstance(field, list) and value in field)
+
+    def predicate(metadata, created_at) -> bool:
+        if any_of or exact:
+            if not isinstance(metadata, dict):
+                return False
+            for key, values in any_of.items():
+                field = metadata.get(key)
+                if not isinstance(field, list) or not any(v in field for v in values):
+                    return False
+            for key, value in exact.items():
+                if not _contains(metadata.get(key), value):
+                    return False
+        if date_from and (created_at is None or created_at < date_from):
+            return False
+        if date_to and (created_at is None or created_at >= date_to):
+            return False
+        return True
+
+    return predicate
+
+
+def _search_local(vectors, query_embedding: List[float], metadata_filters: Dict[str, Any],
+                  top_k: int) -> List[Dict[str, Any]]:
+    """BATCH_SEARCH_SQL over a user's in-memory vectors: same candidate lists, same fusion."""
+    if not len(vectors):
+        return []
+    similarities = vectors.similarities(query_embedding)
+    candidates = top_k * config.HYBRID_CANDIDATE_MULTIPLIER
+
+    predicate = _metadata_predicate(metadata_filters)
+    if predicate is None:
+        nearest = user_vector_index.top_k(similarities, top_k)
+        return [
+            dict(vectors.row(i, similarities[i]), score=_vector_only_score(rank, float(similarities[i])))
+            for rank, i in enumerate(nearest, start=1)
+        ]
+
+    vector_ranks = {
+        int(i): rank for rank, i in enumerate(user_vector_index.top_k(similarities, candidates), start=1)
+    }
+    mask = np.fromiter(
+        (predicate(m, c) for m, c in zip(vectors.metadata, vectors.created_at)),
+        dtype=bool, count=len(vectors)
+    )
+    matched = np.flatnonzero(mask)
+    metadata_ranks = {
+        int(matched[j]): rank
+        for rank, j in enumerate(user_vector_index.top_k(similarities[matched], candidates), start=1)
+    }
+
+    results = [
+        dict(
+            vectors.row(i, similarities[i]),
+            score=_fused_score(vector_ranks.get(i), metadata_ranks.get(i), float(similarities[i]))
+        )
+        for i in set(vector_ranks) | set(metadata_ranks)
+    ]
+    results.sort(key=lambda r: (-r["score"], -r["similarity"]))
+    return results[:top_k]
+
+
+def vector_search_rows(user_id: str, query_embedding: List[float], top_k: int = 5,
+                       ef_search: int = None, probes: int = None) -> List[Dict[str, Any]]:
+    """
+    Vector similarity search returning ranked rows with their stored content.
+    ef_search / probes tune the ANN index for this query only (defaults from config).
+    """
+    local = user_vector_index.get(user_id)
+    if local is not None:
+        return [
+            {key: row[key] for key in ("journal_id", "similarity", "summary", "metadata", "created_at")}
+            for row in _search_local(local, query_embedding, {}, top_k)
+        ]
+
+    emb_literal = _format_embedding_for_pg(query_embedding)
+    settings = user_search_settings_sql(user_id, ef_search, probes)
+    with metrics.span("postgres", "vector_search"), connection() as conn:
         with conn.cursor() as cur:
-            sql = """
-                SELECT journal_id, 1 - (embedding <=> %s::vector) AS similarity
-                FROM journal_embeddings
-                WHERE user_id = %s
-                ORDER BY similarity DESC
-                LIMIT %s
-            """
-            cur.execute(sql, (emb_literal, user_id, top_k))
+            if is_prepared(conn, "journal_vector_search"):
+                cur.execute(settings + "EXECUTE journal_vector_search (%s, %s, %s)", (emb_literal, user_id, top_k))
+            else:
+                sql = settings + VECTOR_SEARCH_SQL.format(
+                    embedding="%(embedding)s::vector", user_id="%(user_id)s", top_k="%(top_k)s"
+                )
+                cur.execute(sql, {"embedding": emb_literal, "user_id": user_id, "top_k": top_k})
             rows = cur.fetchall()
-        return [row[0] for row in rows]
-    finally:
-        if conn:
-            release_connection(conn)
+    return _vector_rows(rows)
+
+
+def vector_search(user_id: str, query_embedding: List[float], top_k: int = 5) -> List[str]:
+    """Vector similarity search"""
+    return [row["journal_id"] for row in vector_search_rows(user_id, query_embedding, top_k)]
+
 
+def _batch_statement(user_id: str, query_embeddings: List[List[float]], filter_params: List[dict],
+                     top_k: int) -> tuple:
+    """BATCH_SEARCH_SQL with the configured fusion score and its parameters: (sql, params)."""
+    score_sql = RRF_SCORE if config.HYBRID_FUSION == "rrf" else WEIGHTED_SCORE
+    params = {
+        "user_id": user_id,
+        "embeddings": [_format_embedding_for_pg(embedding) for embedding in query_embeddings],
+        "candidates": top_k * config.HYBRID_CANDIDATE_MULTIPLIER,
+        "top_k": top_k,
+        **_fusion_params(),
+    }
+    for key in filter_params[0]:
+        params[key] = [p[key] for p in filter_params]
+    return BATCH_SEARCH_SQL.format(score=score_sql), params
 
-def metadata_search(user_id: str, metadata_filters: Dict[str, Any], top_k: int = 5) -> List[str]:
-    """Metadata filtering via Firestore"""
-    if not metadata_filters:
+
+def _batch_rows(rows, n_queries: int) -> List[List[Dict[str, Any]]]:
+    batches = [[] for _ in range(n_queries)]
+    for r in rows:
+        batches[r[0] - 1].append({
+            "journal_id": r[1],
+            "score": float(r[2]),
+            "similarity": float(r[3]),
+            "summary": r[4],
+            "metadata": r[5],
+            "created_at": r[6],
+        })
+    return batches
+
+
+def _vector_rows(rows) -> List[Dict[str, Any]]:
+    results = [
+        {"journal_id": r[0], "similarity": float(r[1]), "summary": r[2], "metadata": r[3], "created_at": r[4]}
+        for r in rows
+    ]
+    # relaxed_order iterative scans may return rows slightly out of distance order
+    results.sort(key=lambda r: r["similarity"], reverse=True)
+    return results
+
+
+def _prepare_filters(query_embeddings: list, metadata_filters: list) -> tuple:
+    """One filter dict per query (None/missing = vector only) and their SQL parameters."""
+    metadata_filters = list(metadata_filters or [])
+    metadata_filters += [None] * (len(query_embeddings) - len(metadata_filters))
+    return metadata_filters, [_filter_params(filters or {}) for filters in metadata_filters]
+
+
+def _search_local_batch(local, query_embeddings: list, metadata_filters: list, top_k: int) -> list:
+    return [
+        _search_local(local, embedding, filters or {}, top_k)
+        for embedding, filters in zip(query_embeddings, metadata_filters)
+    ]
+
+
+def _rank_vector_only(rows: list) -> list:
+    """Plain vector search rows, scored the same way as the fused query."""
+    return [dict(row, score=_vector_only_score(rank, row["similarity"])) for rank, row in enumerate(rows, start=1)]
+
+
+def _missing_content(batches: list) -> list:
+    """Rows written before the content columns existed (not yet backfilled) come from Firestore."""
+    return list({r["journal_id"] for results in batches for r in results if r["summary"] is None})
+
+
+def _finish(user_id: str, batches: list) -> list:
+    missing = _missing_content(batches)
+    if missing:
+        fetched = {r["journal_id"]: r for r in journal_service.fetch_summaries_and_metadata(user_id, missing)}
+        for results in batches:
+            for r in results:
+                if r["summary"] is None and "summary" in fetched.get(r["journal_id"], {}):
+                    r["summary"] = fetched[r["journal_id"]]["summary"]
+                    r["metadata"] = fetched[r["journal_id"]]["metadata"]
+
+    for results in batches:
+        for r in results:
+            r["score"] = round(r["score"], 6)
+            r["similarity"] = round(r["similarity"], 6)
+    return utils.make_serializable(batches)
+
+
+def _cached_results(user_id: str, queries: list, query_embeddings: list, metadata_filters: list,
+                    top_k: int, ef_search: int, probes: int) -> tuple:
+    """
+    (per-query cached results or None, cache version). Only searches given their query texts
+    and the default ANN settings use the result cache (services/search_cache.py).
+    """
+    if not queries or ef_search is not None or probes is not None:
+        return [None] * len(query_embeddings), None
+    cache_version = search_cache.version(user_id)
+    return [
+        search_cache.get(user_id, query, embedding, filters, top_k)
+        for query, embedding, filters in zip(queries, query_embeddings, metadata_filters)
+    ], cache_version
+
+
+def _store_results(user_id: str, queries: list, query_embeddings: list, metadata_filters: list, top_k: int,
+                   cached: list, todo: list, batches: list, cache_version: int) -> list:
+    for i, results in zip(todo, batches):
+        cached[i] = results
+        if cache_version is not None:
+            search_cache.put(user_id, queries[i], query_embeddings[i], metadata_filters[i], top_k, results,
+                             cache_version)
+    return cached
+
+
+def search_journals_batch(user_id: str, query_embeddings: List[List[float]],
+                          metadata_filters: List[Dict[str, Any]] = None, top_k: int = 5,
+                          ef_search: int = None, probes: int = None,
+                          queries: List[str] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Hybrid search for several queries of one user in a single SQL round trip.
+    metadata_filters holds one filter dict per query (None/missing = vector only).
+    With the query texts, results are served from / stored in the per-user result cache
+    and only the uncached queries are searched.
+    Returns one ranked list per query of dicts: journal_id, score, similarity,
+    summary, metadata, created_at.
+    """
+    if not query_embeddings:
+        return []
+    metadata_filters, filter_params = _prepare_filters(query_embeddings, metadata_filters)
+    cached, cache_version = _cached_results(user_id, queries, query_embeddings, metadata_filters,
+                                            top_k, ef_search, probes)
+    todo = [i for i, results in enumerate(cached) if results is None]
+    if not todo:
+        return cached
+
+    batches = _search_batch(
+        user_id, [query_embeddings[i] for i in todo], [metadata_filters[i] for i in todo],
+        [filter_params[i] for i in todo], top_k, ef_search, probes
+    )
+    return _store_results(user_id, queries, query_embeddings, metadata_filters, top_k,
+                          cached, todo, batches, cache_version)
+
+
+def _search_batch(user_id: str, query_embeddings: list, metadata_filters: list, filter_params: list,
+                  top_k: int, ef_search: int, probes: int) -> list:
+    local = user_vector_index.get(user_id)
+
+    if local is not None:
+        batches = _search_local_batch(local, query_embeddings, metadata_filters, top_k)
+    elif len(query_embeddings) == 1 and not _has_filters(filter_params[0]):
+        # Single unfiltered query: plain (prepared) vector search
+        rows = vector_search_rows(user_id, query_embeddings[0], top_k=top_k, ef_search=ef_search, probes=probes)
+        batches = [_rank_vector_only(rows)]
+    else:
+        sql, params = _batch_statement(user_id, query_embeddings, filter_params, top_k)
+        settings = user_search_settings_sql(user_id, ef_search, probes)
+        with metrics.span("postgres", "hybrid_search"), connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(settings + sql, params)
+                rows = cur.fetchall()
+        batches = _batch_rows(rows, len(query_embeddings))
+
+    return _finish(user_id, batches)
+
+
+async def search_journals_batch_async(user_id: str, query_embeddings: List[List[float]],
+                                      metadata_filters: List[Dict[str, Any]] = None, top_k: int = 5,
+                                      ef_search: int = None, probes: int = None,
+                                      queries: List[str] = None) -> List[List[Dict[str, Any]]]:
+    """
+    search_journals_batch for the async serving mode: the same statements over asyncpg
+    (services/async_db.py). The in-process vector index and the Firestore fallback for
+    rows without content are shared with the sync path and run in a worker thread.
+    """
+    if not query_embeddings:
         return []
+    metadata_filters, filter_params = _prepare_filters(query_embeddings, metadata_filters)
+    cached, cache_version = _cached_results(user_id, queries, query_embeddings, metadata_filters,
+                                            top_k, ef_search, probes)
+    todo = [i for i, results in enumerate(cached) if results is None]
+    if not todo:
+        return cached
+
+    batches = await _search_batch_async(
+        user_id, [query_embeddings[i] for i in todo], [metadata_filters[i] for i in todo],
+        [filter_params[i] for i in todo], top_k, ef_search, probes
+    )
+    return _store_results(user_id, queries, query_embeddings, metadata_filters, top_k,
+                          cached, todo, batches, cache_version)
+
+
+async def _search_batch_async(user_id: str, query_embeddings: list, metadata_filters: list, filter_params: list,
+                              top_k: int, ef_search: int, probes: int) -> list:
+    local = await asyncio.to_thread(user_vector_index.get, user_id) if config.VECTOR_INDEX_ENABLED else None
+    settings = await user_search_settings_sql_async(user_id, ef_search, probes) if local is None else ""
+
+    if local is not None:
+        batches = await asyncio.to_thread(_search_local_batch, local, query_embeddings, metadata_filters, top_k)
+    elif len(query_embeddings) == 1 and not _has_filters(filter_params[0]):
+        sql = VECTOR_SEARCH_SQL.format(
+            embedding="%(embedding)s::vector", user_id="%(user_id)s", top_k="%(top_k)s"
+        )
+        params = {"embedding": _format_embedding_for_pg(query_embeddings[0]), "user_id": user_id, "top_k": top_k}
+        rows = await async_db.fetch(sql, params, settings=settings, operation="vector_search")
+        batches = [_rank_vector_only(_vector_rows(rows))]
+    else:
+        sql, params = _batch_statement(user_id, query_embeddings, filter_params, top_k)
+        rows = await async_db.fetch(sql, params, settings=settings, operation="hybrid_search")
+        batches = _batch_rows(rows, len(query_embeddings))
+
+    if _missing_content(batches):
+        return await asyncio.to_thread(_finish, user_id, batches)
+    return _finish(user_id, batches)
+
+
+def search_journals(user_id: str, query_embedding: List[float], metadata_filters: Dict[str, Any],
+                    top_k: int = 5, ef_search: int = None, probes: int = None,
+                    query: str = None) -> List[Dict[str, Any]]:
+    """
+    Hybrid search for one query (a batch of one); with the query text the result cache applies.
+    Returns ranked dicts: journal_id, score, similarity, summary, metadata, created_at.
+    """
+    return search_journals_batch(user_id, [query_embedding], [metadata_filters], top_k=top_k,
+                                 ef_search=ef_search, probes=probes, queries=[query] if query else None)[0]
+
+
+async def search_journals_async(user_id: str, query_embedding: List[float], metadata_filters: Dict[str, Any],
+                                top_k: int = 5, query: str = None) -> List[Dict[str, Any]]:
+    return (await search_journals_batch_async(user_id, [query_embedding], [metadata_filters], top_k=top_k,
+                                              queries=[query] if query else None))[0]
+
+
+def _content_only(results: list, include_content: bool) -> List[Any]:
+    if not include_content:
+        return [r["journal_id"] for r in results]
+    return [
+        {key: r[key] for key in ("journal_id", "summary", "metadata", "created_at")}
+        for r in results
+    ]
+
+
+def hybrid_search(user_id: str, query_embedding: List[float], metadata_filters: Dict[str, Any], top_k: int = 5,
+                  include_content: bool = False, query: str = None) -> List[Any]:
+    """
+    Combine vector + metadata search results.
+    Returns ranked journal_ids, or with include_content=True ranked dicts with
+    journal_id, summary, metadata and created_at read from the embeddings table.
+    """
+    results = search_journals(user_id, query_embedding, metadata_filters, top_k=top_k, query=query)
+    return _content_only(results, include_content)
+
 
-    coll = db.collection("users").document(user_id).collection("journals")
-    query = coll
-
-    if metadata_filters.get("people"):
-        query = query.where("metadata.people", "array_contains_any", metadata_filters["people"])
-    if metadata_filters.get("emotions"):
-        query = query.where("metadata.emotions", "array_contains_any", metadata_filters["emotions"])
-    if metadata_filters.get("tags"):
-        query = query.where("metadata.tags", "array_contains_any", metadata_filters["tags"])
-    if metadata_filters.get("date"):
-        query = query.where("metadata.date", "==", metadata_filters["date"])
-    if metadata_filters.get("mood"):
-        query = query.where("metadata.mood", "==", metadata_filters["mood"])
-    if metadata_filters.get("stress_level"):
-        query = query.where("metadata.stress_level", "==", metadata_filters["stress_level"])
-
-    docs = query.limit(top_k).stream()
-    return [doc.id for doc in docs]
-
-
-def hybrid_search(user_id: str, query_embedding: List[float], metadata_filters: Dict[str, Any], top_k: int = 5) -> List[str]:
-    """Combine vector + metadata search results"""
-    vector_results = vector_search(user_id, query_embedding, top_k=top_k * 2)
-    metadata_results = metadata_search(user_id, metadata_filters, top_k=top_k * 2)
-
-    combined_scores = {}
-    for jid in vector_results:
-        combined_scores[jid] = combined_scores.get(jid, 0) + 1
-    for jid in metadata_results:
-        combined_scores[jid] = combined_scores.get(jid, 0) + 2
-
-    ranked = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
-    return [jid for jid, _ in ranked]
+async def hybrid_search_async(user_id: str, query_embedding: List[float], metadata_filters: Dict[str, Any],
+                              top_k: int = 5, include_content: bool = False, query: str = None) -> List[Any]:
+    results = await search_journals_async(user_id, query_embedding, metadata_filters, top_k=top_k, query=query)
+    return _content_only(results, include_content)
@@ -1,35 +1,71 @@
-import vertexai
-from vertexai.generative_models import GenerativeModel
 from services.create_embedding import get_embedding
 from services.embedding_store import store_embedding
-import json, uuid
-from google.cloud import firestore
-from datetime import datetime
-from services import utils
-from config import PROJECT_ID, REGION  # Config file for project settings
+from services.query_metadata import invalidate_user_vocabulary
+import hashlib, json, logging, threading, unicodedata, uuid
+from datetime import date, datetime
+import config
+from services import clients, metrics, search_cache, timeline, utils
 
-# Initialize VertexAI + Firestore
-vertexai.init(project=PROJECT_ID, location=REGION)
-model = GenerativeModel("gemini-2.5-flash")
-db = firestore.Client(project=PROJECT_ID)
+logger = logging.getLogger(__name__)
 
+# Firestore / Gemini clients are shared and created on first use (services/clients.py)
 
-def analyze_store_and_embed_journal(data):
+# Journal ids are uuid5 names in this namespace, derived from the user and an idempotency
+# key or the journal's content hash and UTC day, so a retried write lands on the same documents/rows
+JOURNAL_ID_NAMESPACE = uuid.UUID("6f1c3a52-8d0e-5b7a-9c41-2e5d7f8a9b10")
+
+_in_flight_lock = threading.Lock()
+_in_flight = {}  # journal_id -> Event set when the write holding it finishes
+
+
+def normalize_journal_text(journal_text: str) -> str:
+    """Unicode NFC, trimmed, runs of whitespace collapsed: retries differing only in spacing match."""
+    return " ".join(unicodedata.normalize("NFC", journal_text).split())
+
+
+def journal_id_for(user_id: str, journal_text: str, idempotency_key: str = None, day: date = None) -> str:
     """
-    Stores a user's journal entry along with summary and metadata in Firestore.
-    Raises exceptions on server errors.
-    Returns True if success.
+    Deterministic journal id: the client's idempotency key when given, otherwise the
+    SHA-256 of the normalized journal text together with its UTC day (today unless given;
+    bulk lines pass their created_at's). Without a key, identical text is therefore one
+    journal per day: retries that day are duplicates, the same entry written on another
+    day is a new journal.
     """
-    # Client-side validation
-    journal_text = data.get("journal_text")
-    user_id = data.get("user_id")
+    if idempotency_key:
+        name = f"{user_id}\nkey:{idempotency_key}"
+    else:
+        digest = hashlib.sha256(normalize_journal_text(journal_text).encode("utf-8")).hexdigest()
+        day = day or datetime.utcnow().date()
+        name = f"{user_id}\nsha256:{digest}\nday:{day.isoformat()}"
+    return str(uuid.uuid5(JOURNAL_ID_NAMESPACE, name))
 
-    if not journal_text or not user_id:
-        raise ValueError("user_id and journal_text are required")
 
-    try:
-        # ---------------- PROMPT ----------------
-        prompt = f"""
+def existing_journals(user_id: str, journal_ids: list) -> set:
+    """Ids among journal_ids that are already stored (document lookups by id, no query)."""
+    return set(_get_journal_fields(user_id, journal_ids, ["created_at"]))
+
+
+def _claim(journal_id: str):
+    """None when this thread now owns the write of journal_id, else the owner's Event to wait on."""
+    with _in_flight_lock:
+        event = _in_flight.get(journal_id)
+        if event is None:
+            _in_flight[journal_id] = threading.Event()
+        return event
+
+
+def _release(journal_id: str):
+    with _in_flight_lock:
+        _in_flight.pop(journal_id).set()
+
+
+def analyze_journal(journal_text: str) -> dict:
+    """
+    Runs the Gemini analysis for a journal entry.
+    Returns a dict with the summary and metadata.
+    """
+    # ---------------- PROMPT ----------------
+    prompt = f"""
 You are analyzing a personal journal entry.
 
 Journal Entry:
@@ -60,43 +96,115 @@ For the metadata fields (people, topics, emotions, activities):
 - Only include the most relevant and important ones.
 - Do not include minor or irrelevant items.
 """
-        # Call Gemini model
-        response = model.generate_content(prompt)
-        text_output = response.candidates[0].content.parts[0].text
+    # Call Gemini model
+    with metrics.span("gemini", "analyze_journal"):
+        response = clients.gemini().generate_content(prompt)
+    text_output = response.candidates[0].content.parts[0].text
+
+    try:
+        result = json.loads(text_output)
+    except json.JSONDecodeError:
+        cleaned = text_output.strip().strip("```json").strip("```")
+        result = json.loads(cleaned)
+
+    return result
+
+
+def analyze_store_and_embed_journal(data, idempotency_key: str = None):
+    """
+    Stores a user's journal entry along with summary and metadata in Firestore.
+    Idempotent: a retry with the same idempotency key (or, without one, the same text the same UTC day)
+    returns the stored journal without analyzing it again; concurrent retries on this
+    instance wait for the first one, up to JOURNAL_IN_FLIGHT_WAIT seconds.
+    Raises exceptions on server errors.
+    Returns ({"status", "journal_id", "duplicate"}, 200) on success.
+    """
+    # Client-side validation
+    journal_text = data.get("journal_text")
+    user_id = data.get("user_id")
+    idempotency_key = idempotency_key or data.get("idempotency_key")
+
+    if not journal_text or not user_id:
+        raise ValueError("user_id and journal_text are required")
+
+    journal_id = journal_id_for(user_id, journal_text, idempotency_key)
+    try:
+        owned = False
+        while True:
+            if existing_journals(user_id, [journal_id]):
+                metrics.JOURNAL_WRITES.inc(result="duplicate")
+                return {"status": "success", "journal_id": journal_id, "duplicate": True}, 200
+            owner = _claim(journal_id)
+            if owner is None:
+                owned = True
+                break
+            # Same write in flight here: wait for it, then re-check (it may have failed)
+            if not owner.wait(timeout=config.JOURNAL_IN_FLIGHT_WAIT):
+                # Still running: write as well, both writes upsert the same ids
+                logger.warning("Journal %s still being written after %ss; writing it again",
+                               journal_id, config.JOURNAL_IN_FLIGHT_WAIT)
+                break
 
         try:
-            result = json.loads(text_output)
-        except json.JSONDecodeError:
-            cleaned = text_output.strip().strip("```json").strip("```")
-            result = json.loads(cleaned)
+            _analyze_store_and_embed(user_id, journal_id, journal_text)
+        finally:
+            if owned:
+                _release(journal_id)
+
+        metrics.JOURNAL_WRITES.inc(result="stored")
+        return {"status": "success", "journal_id": journal_id, "duplicate": False}, 200
+        
+    except Exception as e:
+        # Any unexpected exception → raise for API route to handle
+        raise RuntimeError(f"Error storing journal: {str(e)}")
+
+
+def _analyze_store_and_embed(user_id: str, journal_id: str, journal_text: str):
+    # Call Gemini model
+    result = analyze_journal(journal_text)
+    created_at = datetime.utcnow()
+
+    #Embedding and Vector DB
+    try:
+        embedding = get_embedding(result["summary"])
+        if not isinstance(embedding, list) or not all(isinstance(x, float) for x in embedding):
+            raise ValueError(f"Invalid embedding returned: {embedding}")
+    except Exception as e:
+            raise RuntimeError(f"Embedding generation failed: {e}")
 
-        # Generate journal ID
-        journal_id = str(uuid.uuid4())
+    # Summary + metadata are stored next to the vector so search results carry their content.
+    # The vector goes first: the Firestore document marks the journal as stored, so a
+    # retry after a failure in between redoes (and upserts) both writes.
+    store_embedding(
+        user_id, journal_id, embedding, "journal_embeddings",
+        summary=result["summary"], metadata=result["metadata"], created_at=created_at
+    )
 
-        # Save to Firestore under users/{userId}/journals/{journalId}
-        db.collection("users").document(user_id).collection("journals").document(journal_id).set({
+    # Save to Firestore under users/{userId}/journals/{journalId}
+    with metrics.span("firestore", "set_journal"):
+        clients.firestore().collection("users").document(user_id).collection("journals").document(journal_id).set({
             "journal_text": journal_text,
             "summary": result["summary"],
             "metadata": result["metadata"],
-            "created_at": datetime.utcnow()
+            "created_at": created_at
         })
 
-        
-        #Embedding and Vector DB
-        try:
-            embedding = get_embedding(result["summary"])
-            if not isinstance(embedding, list) or not all(isinstance(x, float) for x in embedding):
-                raise ValueError(f"Invalid embedding returned: {embedding}")
-        except Exception as e:
-                raise RuntimeError(f"Embedding generation failed: {e}")
+    # New people/tags become searchable straight away
+    invalidate_user_vocabulary(user_id)
+    # Cached search results of the user no longer include every journal
+    search_cache.bump(user_id)
 
-        store_embedding(user_id, journal_id, embedding, "journal_embeddings")
 
-        return {"status": "success"}, 200
-        
-    except Exception as e:
-        # Any unexpected exception → raise for API route to handle
-        raise RuntimeError(f"Error storing journal: {str(e)}")
+def _get_journal_fields(user_id: str, journal_ids: list, fields: list) -> dict:
+    """
+    Reads several journal documents in one batched round trip, downloading only `fields`.
+    Returns {journal_id: data} for the documents that exist.
+    """
+    journals_ref = clients.firestore().collection("users").document(user_id).collection("journals")
+    refs = [journals_ref.document(jid) for jid in dict.fromkeys(journal_ids)]
+    with metrics.span("firestore", "get_journals"):
+        snapshots = clients.firestore().get_all(refs, field_paths=fields)
+        return {snap.id: snap.to_dict() or {} for snap in snapshots if snap.exists}
 
 
 def fetch_summaries_and_metadata(user_id: str, journal_ids: list[str]) -> list[dict]:
@@ -115,12 +223,11 @@ def fetch_summaries_and_metadata(user_id: str, journal_ids: list[str]) -> list[d
 
     try:
         results = []
-        journals_ref = db.collection("users").document(user_id).collection("journals")
+        docs = _get_journal_fields(user_id, journal_ids, ["summary", "metadata"])
 
         for jid in journal_ids:
-            doc = journals_ref.document(jid).get()
-            if doc.exists:
-                data = doc.to_dict()
+            data = docs.get(jid)
+            if data is not None:
                 results.append({
                     "journal_id": jid,
                     "summary": data.get("summary"),
@@ -135,7 +242,7 @@ def fetch_summaries_and_metadata(user_id: str, journal_ids: list[str]) -> list[d
         return utils.make_serializable(results)
 
     except Exception as e:
-        print(f"Error fetching summaries/metadata for user {user_id}: {str(e)}")
+        logger.error("Error fetching summaries/metadata for user %s: %s", user_id, e)
         raise RuntimeError("Failed to fetch summaries and metadata") from e
 
 def get_journals_summary_by_ids(user_id, journal_ids):
@@ -145,15 +252,14 @@ def get_journals_summary_by_ids(user_id, journal_ids):
     """
     try:
         journals_data = []
+
+        # One batched read; full journal_text is never downloaded
+        docs = _get_journal_fields(user_id, journal_ids, ["summary", "metadata", "created_at"])
         
         for journal_id in journal_ids:
-            # Get journal document from Firestore
-            journal_ref = db.collection("users").document(user_id).collection("journals").document(journal_id)
-            journal_doc = journal_ref.get()
+            doc_data = docs.get(journal_id)
             
-            if journal_doc.exists:
-                doc_data = journal_doc.to_dict()
-                # Return only summary and metadata (excluding full journal_text for efficiency)
+            if doc_data is not None:
                 journal_summary = {
                     "journal_id": journal_id,
                     "summary": doc_data.get("summary"),
@@ -172,3 +278,17 @@ def get_journals_summary_by_ids(user_id, journal_ids):
         
     except Exception as e:
         raise RuntimeError(f"Error retrieving journals: {str(e)}")
+
+
+LIST_JOURNAL_FIELDS = ["summary", "metadata"]
+
+
+def list_journals(user_id: str, limit: int = None, cursor: str = None, start_date: str = None,
+                  end_date: str = None, moods: list = None) -> dict:
+    """
+    One page of the user's journals, newest first (summary, metadata, created_at; no journal_text).
+    Returns {"items": [...], "next_cursor": str or None}. Raises ValueError on bad parameters.
+    """
+    page = timeline.list_page(user_id, "journals", LIST_JOURNAL_FIELDS, limit=limit, cursor=cursor,
+                              start=start_date, end=end_date, moods=moods)
+    return timeline.serialize(page, "journal_id", LIST_JOURNAL_FIELDS)
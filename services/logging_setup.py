@@ -0,0 +1,107 @@
+# services/logging_setup.py
+"""
+Process-wide logging that never blocks a request.
+
+configure() puts a QueueHandler on the root logger: the calling thread only formats the
+record and drops it on a bounded queue; a QueueListener thread writes it to stdout.
+- sampling: records below WARNING are kept with probability LOG_SAMPLE_RATE
+- redaction: e-mail addresses and phone-like numbers are masked and messages are cut at
+  LOG_MAX_CHARS (in the listener thread, off the request path)
+- backpressure: when the queue is full the record is dropped and counted, never waited on
+
+Log sizes and ids, not content: journal text, queries, prompts and replies stay out of logs.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+
+import config
+from services import metrics
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# Phone-like: 10+ digits with separators, not part of a longer token (ids, uuids)
+_PHONE = re.compile(r"(?<![\w-])\+?\d[\d\s().-]{8,}\d(?![\w-])")
+
+_lock = threading.Lock()
+_listener = None
+_dropped = 0
+
+
+def redact(text: str) -> str:
+    text = _EMAIL.sub("<email>", text)
+    text = _PHONE.sub(lambda m: "<number>" if sum(c.isdigit() for c in m.group()) >= 10 else m.group(), text)
+    if len(text) > config.LOG_MAX_CHARS:
+        text = text[:config.LOG_MAX_CHARS] + f"... [{len(text) - config.LOG_MAX_CHARS} chars cut]"
+    return text
+
+
+class RedactingFormatter(logging.Formatter):
+    """Redacts the message (and traceback), not the timestamp and logger name."""
+
+    def format(self, record) -> str:
+        if config.LOG_REDACT:
+            record.msg = redact(record.getMessage())
+            record.args = None
+        return super().format(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every WARNING and above; lower levels with probability `rate`."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking on a full queue."""
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _lock:
+                _dropped += 1
+
+
+def configure():
+    """Installs the queue handler on the root logger (once per process)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(RedactingFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(config.LOG_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(config.LOG_LEVEL)
+
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    metrics.register_gauge("reflect_log_records_dropped", "Log records dropped because the queue was full.",
+                           dropped)
+
+
+def dropped() -> int:
+    with _lock:
+        return _dropped
@@ -4,14 +4,12 @@ Metadata extraction using Gemini (Vertex AI Generative Model).
 Extracts summary + metadata JSON from a raw journal entry.
 """
 
-import vertexai
-from vertexai.generative_models import GenerativeModel
 import json
-from config import PROJECT_ID, REGION
+import logging
+from datetime import date
+from services import clients, metrics
 
-# Initialize once
-vertexai.init(project=PROJECT_ID, location=REGION)
-model = GenerativeModel("gemini-2.5-flash")
+logger = logging.getLogger(__name__)
 
 
 def extract_metadata(journal_text: str) -> dict:
@@ -42,7 +40,8 @@ Return JSON in this format:
 }}
 """
 
-    response = model.generate_content(prompt)
+    with metrics.span("gemini", "extract_metadata"):
+        response = clients.gemini().generate_content(prompt)
     raw_text = response.candidates[0].content.parts[0].text.strip()
 
     try:
@@ -51,3 +50,49 @@ Return JSON in this format:
         # Sometimes model wraps in ```json ... ```
         cleaned = raw_text.strip("```json").strip("```").strip()
         return json.loads(cleaned)
+
+
+def extract_query_filters_llm(query: str) -> dict:
+    """
+    Fallback for search queries the local extractor could not resolve.
+    Asks Gemini for search filters only (no summary) and returns a flat filter dict.
+    """
+    prompt = f"""
+Extract search filters from this query about a user's own journal entries.
+Only include a field if the query clearly refers to it.
+
+Query:
+{query}
+
+Return JSON in this format (omit fields that do not apply):
+{{
+  "date": "YYYY-MM-DD if a specific date is mentioned",
+  "people": ["names of people mentioned"],
+  "tags": ["topics, themes, or activities mentioned"],
+  "emotions": ["emotions mentioned"]
+}}
+"""
+
+    with metrics.span("gemini", "extract_query_filters"):
+        response = clients.gemini().generate_content(prompt)
+    raw_text = response.candidates[0].content.parts[0].text.strip()
+
+    try:
+        result = json.loads(raw_text)
+    except json.JSONDecodeError:
+        cleaned = raw_text.strip("```json").strip("```").strip()
+        result = json.loads(cleaned)
+
+    filters = {}
+    for key in ("people", "tags", "emotions"):
+        values = [v for v in (result.get(key) or []) if isinstance(v, str) and v.strip()]
+        if values:
+            filters[key] = values[:3]
+    if result.get("date"):
+        # Search parses these with date.fromisoformat; anything else ("June 3rd", "2024-06")
+        # would fail the whole request, so the date filter is dropped instead
+        try:
+            filters["date_from"] = filters["date_to"] = date.fromisoformat(str(result["date"]).strip()).isoformat()
+        except ValueError:
+            logger.info("Ignoring non-ISO date from query filter extraction: %r", result["date"])
+    return filters
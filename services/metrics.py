@@ -0,0 +1,179 @@
+# services/metrics.py
+"""
+In-process metrics, exported in the Prometheus text format (0.0.4) on /metrics.
+
+- span(service, operation): times one external call (Vertex embeddings, Gemini, Firestore,
+  Postgres) into reflect_external_call_seconds and counts failures in
+  reflect_external_call_errors_total
+- Histogram / Counter for everything else (HTTP requests, /therapist stages, Gemini tokens)
+- register_gauge(): values read from a callback at scrape time (pool, queue sizes)
+
+gunicorn runs a single worker, so the process-local values are the instance's values.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# seconds; external calls range from sub-millisecond cache hits to multi-second Gemini replies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_metrics = []
+_gauges = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        with _lock:
+            _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        with _lock:
+            _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(state[-2])}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {state[-1]}")
+        return lines
+
+
+def register_gauge(name: str, documentation: str, fn, labels: tuple = ()):
+    """
+    fn() returns a number, or {label values tuple: number} when labels are given.
+    It is called at scrape time; a failing callback is skipped for that scrape.
+    """
+    with _lock:
+        _gauges.append((name, documentation, fn, labels))
+
+
+# ---------------- METRICS ----------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "reflect_http_request_seconds", "Time to the response headers, per route.", ("method", "route", "status")
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "reflect_external_call_seconds", "Latency of calls to Vertex AI, Firestore and Postgres.", ("service", "operation")
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "reflect_external_call_errors_total", "External calls that raised.", ("service", "operation")
+)
+STAGE_SECONDS = Histogram(
+    "reflect_stage_seconds", "Per-stage wall time of composite requests (e.g. /therapist).", ("endpoint", "stage")
+)
+GEMINI_TOKENS = Counter(
+    "reflect_gemini_tokens_total", "Gemini tokens reported in usage metadata.", ("kind",)
+)
+SEARCH_CACHE_LOOKUPS = Counter(
+    "reflect_search_cache_lookups_total", "Search result cache lookups by result (exact, similar, stale, miss).",
+    ("result",)
+)
+JOURNAL_WRITES = Counter(
+    "reflect_journal_writes_total", "Journal writes by result (stored, duplicate: an idempotent retry).",
+    ("result",)
+)
+
+
+@contextmanager
+def span(service: str, operation: str):
+    """Times the enclosed external call; exceptions are counted and re-raised."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_CALL_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service=service, operation=operation)
+
+
+def observe_stages(endpoint: str, timings_ms: dict):
+    """Records a request's {stage: milliseconds} timings (as collected by context_service)."""
+    for stage, ms in timings_ms.items():
+        if isinstance(ms, (int, float)):
+            STAGE_SECONDS.observe(ms / 1000, endpoint=endpoint, stage=stage)
+
+
+def render() -> str:
+    with _lock:
+        metrics = list(_metrics)
+        gauges = list(_gauges)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+    for name, documentation, fn, labels in gauges:
+        try:
+            value = fn()
+        except Exception as e:
+            logger.warning("Gauge %s failed: %s", name, e)
+            continue
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        values = value.items() if labels else [((), value)]
+        for key, number in sorted(values):
+            lines.append(f"{name}{_label_text(labels, key)} {_number(number)}")
+    return "\n".join(lines) + "\n"
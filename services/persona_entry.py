@@ -1,11 +1,7 @@
 import json
-from google.cloud import firestore
-from datetime import datetime
-from services import utils
-from config import PROJECT_ID  # Config file for project settings
+from datetime import datetime, timezone
+from services import clients, context_cache, metrics, utils
 
-# Initialize Firestore
-db = firestore.Client(project=PROJECT_ID)
 
 
 def store_persona_entry(data):
@@ -23,11 +19,13 @@ def store_persona_entry(data):
         raise ValueError("user_id and persona are required")
 
     try:
-        # Prepare persona document with timestamp
+        # Prepare persona document with timestamp (aware UTC, the shape Firestore reads back,
+        # so a written-through cache entry matches a loaded one)
+        now = datetime.now(timezone.utc)
         persona_document = {
             "persona": persona_data,
-            "created_at": datetime.utcnow(),
-            "last_updated": datetime.utcnow()
+            "created_at": now,
+            "last_updated": now
         }
 
         # Add persona_metadata if it exists in the input
@@ -35,7 +33,11 @@ def store_persona_entry(data):
             persona_document["persona_metadata"] = data["persona_metadata"]
 
         # Save to Firestore as a single document under users/{userId}/profile/persona
-        db.collection("users").document(user_id).collection("profile").document("persona").set(persona_document)
+        with metrics.span("firestore", "set_persona"):
+            clients.firestore().collection("users").document(user_id).collection("profile").document("persona").set(persona_document)
+
+        # Write-through: the next /therapist turn and /get_persona see the new persona
+        context_cache.put("persona", user_id, utils.make_serializable(persona_document))
 
         return {"status": "success"}, 200
         
@@ -45,13 +47,18 @@ def store_persona_entry(data):
 
 def get_persona_by_user_id(user_id):
     """
-    Retrieves a user's persona from Firestore.
+    Retrieves a user's persona (per-user context cache, Firestore on a miss).
     Returns the persona data if found, None otherwise.
     """
+    return context_cache.get_or_load("persona", user_id, _load_persona)
+
+
+def _load_persona(user_id):
     try:
         # Get persona document from Firestore
-        persona_ref = db.collection("users").document(user_id).collection("profile").document("persona")
-        persona_doc = persona_ref.get()
+        persona_ref = clients.firestore().collection("users").document(user_id).collection("profile").document("persona")
+        with metrics.span("firestore", "get_persona"):
+            persona_doc = persona_ref.get()
         
         if persona_doc.exists:
             return utils.make_serializable(persona_doc.to_dict())
@@ -60,3 +67,23 @@ def get_persona_by_user_id(user_id):
             
     except Exception as e:
         raise RuntimeError(f"Error retrieving persona: {str(e)}")
+
+
+async def get_persona_by_user_id_async(user_id):
+    """get_persona_by_user_id for the async serving mode (Firestore AsyncClient on a miss)."""
+    return await context_cache.get_or_load_async("persona", user_id, _load_persona_async)
+
+
+async def _load_persona_async(user_id):
+    try:
+        persona_ref = clients.firestore_async().collection("users").document(user_id).collection("profile").document("persona")
+        with metrics.span("firestore", "get_persona"):
+            persona_doc = await persona_ref.get()
+
+        if persona_doc.exists:
+            return utils.make_serializable(persona_doc.to_dict())
+        else:
+            return None
+
+    except Exception as e:
+        raise RuntimeError(f"Error retrieving persona: {str(e)}")
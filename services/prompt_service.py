@@ -1,16 +1,20 @@
 # prompt_service.py
-import vertexai
-from vertexai.generative_models import GenerativeModel
 import os
+import asyncio
 import json
-from config import PROJECT_ID, REGION  # Config file for project settings
+import hashlib
+import logging
+import time
+from datetime import timedelta
+import config
+from services import clients, metrics
+from services.cache import LRUCache
 
+logger = logging.getLogger(__name__)
 
-# Initialize VertexAI + Firestore
-vertexai.init(project=PROJECT_ID, location=REGION)
 
-# Load Gemini 2.5 Flash
-MODEL = GenerativeModel("gemini-2.5-flash")
+# Gemini 2.5 Flash (shared handle, created on first use by services/clients.py)
+MODEL_NAME = clients.GEMINI_MODEL
 
 SYSTEM_INSTRUCTIONS = """
 You are an AI therapist. 
@@ -34,26 +38,7 @@ Guidelines:
  - End your reply with a gentle, open-ended follow-up question to encourage further conversation.
 """
 
-def construct_prompt(query: str, persona: dict, journal_summaries: list, conversation_summaries: list):
-    """
-    Constructs the full prompt for the LLM including system instructions, persona, journal summaries, latest N conversation summaries and user query.
-    """
-    prompt = f"""
-System Instructions:
-{SYSTEM_INSTRUCTIONS}
-
-User Persona:
-{json.dumps(persona, indent=2)}
-
-Relevant Journals:
-{json.dumps(journal_summaries, indent=2)}
-
-Recent Conversation Summaries:
-{json.dumps(conversation_summaries, indent=2)}
-
-User Query:
-{query}
-
+TASK_INSTRUCTIONS = """
 TASK:
 Provide a thoughtful, empathetic response that:
 - Acknowledges the user’s current emotions and situation.
@@ -63,11 +48,355 @@ Provide a thoughtful, empathetic response that:
 - You may reference relevant past conversations where appropriate.
 - Ends with a gentle, open-ended question that encourages further reflection.
 """
-    return prompt
 
-def call_gemini(prompt: str):
+# Combined mode (THERAPIST_COMBINED_SUMMARY): the reply and the turn's summary come from one
+# generation, as JSON constrained by THERAPIST_TURN_SCHEMA, so the turn is not sent to Gemini again
+COMBINED_TASK_INSTRUCTIONS = TASK_INSTRUCTIONS + """
+Then summarize this turn for future sessions: combine the user query and your reply into a concise
+summary (max 50 words) with its metadata.
+Return a JSON object with "reply" (your response to the user), "summary" and "metadata"
+(mood: overall emotional tone, topics: max 3 main topics, emotions: max 3 main emotions,
+stress_level: low, medium or high).
+"""
+
+THERAPIST_TURN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "reply": {"type": "STRING"},
+        "summary": {"type": "STRING"},
+        "metadata": {
+            "type": "OBJECT",
+            "properties": {
+                "mood": {"type": "STRING"},
+                "topics": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "emotions": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "stress_level": {"type": "STRING", "enum": ["low", "medium", "high"]},
+            },
+            "required": ["mood", "topics", "emotions", "stress_level"],
+        },
+    },
+    "required": ["reply", "summary", "metadata"],
+}
+# generate_content accepts the generation config as a dict
+TURN_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": THERAPIST_TURN_SCHEMA}
+
+# Metadata fields worth sending to the model; everything else is dropped from the prompt
+JOURNAL_METADATA_FIELDS = ("mood", "emotions", "people", "tags", "stress_level", "date")
+CONVERSATION_METADATA_FIELDS = ("mood", "topics", "emotions", "stress_level")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English); good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def _compact(value) -> str:
+    """Compact JSON: no indentation or spaces, keys sorted so the same input always gives the same text."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _prune(value):
+    """Drops None, empty strings and empty containers, recursively."""
+    if isinstance(value, dict):
+        pruned = {k: _prune(v) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [v for v in (_prune(v) for v in value) if v not in (None, "", [], {})]
+    return value
+
+
+def _journal_entry(journal: dict) -> dict:
+    metadata = journal.get("metadata") or {}
+    created_at = journal.get("created_at")
+    return _prune({
+        "date": str(created_at)[:10] if created_at else None,
+        "summary": journal.get("summary"),
+        **{key: metadata.get(key) for key in JOURNAL_METADATA_FIELDS if key != "date"},
+    })
+
+
+def _conversation_entry(conversation: dict) -> dict:
+    metadata = conversation.get("metadata") or {}
+    return _prune({
+        "summary": conversation.get("summary_text"),
+        **{key: metadata.get(key) for key in CONVERSATION_METADATA_FIELDS},
+    })
+
+
+def _lines(entries: list) -> str:
+    return "\n".join(_compact(entry) for entry in entries)
+
+
+def build_prompt(query: str, persona: dict, journal_summaries: list, conversation_summaries: list,
+                 token_budget: int = None, combined: bool = False) -> dict:
+    """
+    Builds the therapist prompt in two parts:
+    - prefix: system instructions + persona. Identical for every turn of a user, so it is
+      sent first (Gemini's implicit prefix caching) or as explicit cached content.
+    - context: journals, recent conversations, the user's query and the task.
+    Context is serialized as compact JSON lines. If the estimated total exceeds token_budget
+    (PROMPT_TOKEN_BUDGET), the lowest-ranked journals are dropped first, then the oldest
+    conversation summaries.
+    combined=True asks for the reply plus the turn summary as JSON (call_gemini_turn).
+    Returns {"prefix", "context", "text", "tokens": {section: estimate}, "journals_used", "journals_dropped"}.
+    """
+    token_budget = token_budget or config.PROMPT_TOKEN_BUDGET
+
+    system = f"System Instructions:\n{SYSTEM_INSTRUCTIONS.strip()}\n"
+    persona_text = f"\nUser Persona:\n{_compact(_prune(persona or {}))}\n"
+    query_text = f"\nUser Query:\n{query}\n"
+    task = COMBINED_TASK_INSTRUCTIONS if combined else TASK_INSTRUCTIONS
+
+    # journal_summaries arrive ranked best first, conversation summaries newest first
+    journals = [entry for entry in (_journal_entry(j) for j in journal_summaries or []) if entry]
+    conversations = [entry for entry in (_conversation_entry(c) for c in conversation_summaries or []) if entry]
+
+    fixed = estimate_tokens(system) + estimate_tokens(persona_text) + estimate_tokens(query_text) + estimate_tokens(task)
+    journal_tokens = [estimate_tokens(_compact(entry)) + 1 for entry in journals]
+    conversation_tokens = [estimate_tokens(_compact(entry)) + 1 for entry in conversations]
+
+    dropped = 0
+    while journals and fixed + sum(journal_tokens) + sum(conversation_tokens) > token_budget:
+        journals.pop()
+        journal_tokens.pop()
+        dropped += 1
+    while conversations and fixed + sum(journal_tokens) + sum(conversation_tokens) > token_budget:
+        conversations.pop()
+        conversation_tokens.pop()
+
+    journals_text = f"\nRelevant Journals (most relevant first):\n{_lines(journals)}\n"
+    conversations_text = f"\nRecent Conversation Summaries (newest first):\n{_lines(conversations)}\n"
+
+    prefix = system + persona_text
+    context = journals_text + conversations_text + query_text + task
+    tokens = {
+        "system": estimate_tokens(system),
+        "persona": estimate_tokens(persona_text),
+        "journals": estimate_tokens(journals_text),
+        "conversation_summaries": estimate_tokens(conversations_text),
+        "query": estimate_tokens(query_text),
+        "task": estimate_tokens(task),
+    }
+    tokens["total"] = sum(tokens.values())
+    tokens["cacheable_prefix"] = tokens["system"] + tokens["persona"]
+
+    return {
+        "prefix": prefix,
+        "context": context,
+        "text": prefix + context,
+        "tokens": tokens,
+        "journals_used": len(journals),
+        "journals_dropped": dropped,
+    }
+
+
+def construct_prompt(query: str, persona: dict, journal_summaries: list, conversation_summaries: list):
+    """
+    Constructs the full prompt for the LLM including system instructions, persona, journal summaries, latest N conversation summaries and user query.
+    """
+    return build_prompt(query, persona, journal_summaries, conversation_summaries)["text"]
+
+
+# ---------------- CONTEXT CACHING ----------------
+# prefix hash -> CachedContent resource name (explicit Vertex context caching)
+_prefix_cache = LRUCache(max_entries=1024, ttl=config.PROMPT_CACHE_TTL * 0.9)
+
+
+def _cached_model(prefix: str):
+    """
+    Returns a model bound to a Vertex cached content holding `prefix`, or None when explicit
+    caching is off, the prefix is below Vertex's minimum cache size, or creating the cache failed.
+    Smaller prefixes still benefit from Gemini's implicit caching, since they lead every prompt.
+    """
+    if not config.PROMPT_EXPLICIT_CACHE or estimate_tokens(prefix) < config.PROMPT_CACHE_MIN_TOKENS:
+        return None
+    key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+    name = _prefix_cache.get(key)
+    try:
+        clients.init_vertex()
+        from vertexai.generative_models import Content, Part
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import GenerativeModel as PreviewGenerativeModel
+        if name is None:
+            with metrics.span("gemini", "create_cached_content"):
+                cached = caching.CachedContent.create(
+                    model_name=MODEL_NAME,
+                    contents=[Content(role="user", parts=[Part.from_text(prefix)])],
+                    ttl=timedelta(seconds=config.PROMPT_CACHE_TTL),
+                )
+            name = cached.name
+            _prefix_cache.put(key, name)
+        return PreviewGenerativeModel.from_cached_content(cached_content=caching.CachedContent(name))
+    except Exception as e:
+        logger.warning("Context cache unavailable, sending the full prompt: %s", e)
+        _prefix_cache.pop(key)
+        return None
+
+
+def _log_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        cached = getattr(usage, "cached_content_token_count", 0) or 0
+        metrics.GEMINI_TOKENS.inc(usage.prompt_token_count or 0, kind="prompt")
+        metrics.GEMINI_TOKENS.inc(cached, kind="cached")
+        metrics.GEMINI_TOKENS.inc(usage.candidates_token_count or 0, kind="output")
+        logger.debug("gemini usage: prompt=%s cached=%s output=%s",
+                     usage.prompt_token_count, cached, usage.candidates_token_count)
+
+
+def call_gemini(prompt: str, prefix: str = None):
     """
     Calls Gemini 2.5 Flash model using Vertex AI SDK.
+    With a prefix (build_prompt()["prefix"]) the prefix is served from the context cache when possible.
+    """
+    cached_model = _cached_model(prefix) if prefix else None
+    with metrics.span("gemini", "therapist_reply"):
+        if cached_model is not None:
+            response = cached_model.generate_content(prompt)
+        else:
+            response = clients.gemini(MODEL_NAME).generate_content((prefix or "") + prompt)
+    _log_usage(response)
+    return response.candidates[0].content.parts[0].text
+
+
+def _parse_turn(text: str) -> tuple:
+    """
+    (reply, {"summary", "metadata"}) from a combined-mode response (```json fences allowed).
+    A usable reply without a summary gives (reply, None), so the turn is summarized separately.
+    Output that does not decode (e.g. truncated) or has no usable reply gives (None, None):
+    the raw text must never reach the user.
+    """
+    try:
+        turn = json.loads(text.strip().strip("```json").strip("```").strip())
+    except json.JSONDecodeError:
+        logger.warning("Combined therapist response was not valid JSON; asking for a plain reply")
+        return None, None
+    if not isinstance(turn, dict) or not isinstance(turn.get("reply"), str) or not turn["reply"].strip():
+        logger.warning("Combined therapist response had no reply; asking for a plain reply")
+        return None, None
+    if not isinstance(turn.get("summary"), str) or not turn["summary"].strip():
+        return turn["reply"], None
+    metadata = turn.get("metadata") if isinstance(turn.get("metadata"), dict) else {}
+    return turn["reply"], {"summary": turn["summary"], "metadata": metadata}
+
+
+def _reply_only(prompt: str) -> str:
+    """A combined-mode context with the plain reply task instead (see build_prompt)."""
+    if prompt.endswith(COMBINED_TASK_INSTRUCTIONS):
+        return prompt[:-len(COMBINED_TASK_INSTRUCTIONS)] + TASK_INSTRUCTIONS
+    return prompt
+
+
+def call_gemini_turn(prompt: str, prefix: str = None) -> tuple:
+    """
+    Combined mode: the therapist reply and the turn's summary/metadata from one generation
+    (prompt from build_prompt(..., combined=True)). Returns (reply, summary dict or None).
+    If the response has no usable reply, the reply comes from a plain call_gemini instead.
+    """
+    cached_model = _cached_model(prefix) if prefix else None
+    with metrics.span("gemini", "therapist_turn"):
+        if cached_model is not None:
+            response = cached_model.generate_content(prompt, generation_config=TURN_GENERATION_CONFIG)
+        else:
+            response = clients.gemini(MODEL_NAME).generate_content(
+                (prefix or "") + prompt, generation_config=TURN_GENERATION_CONFIG
+            )
+    _log_usage(response)
+    reply, summary = _parse_turn(response.candidates[0].content.parts[0].text)
+    if reply is None:
+        return call_gemini(_reply_only(prompt), prefix=prefix), None
+    return reply, summary
+
+
+def stream_gemini(prompt: str, prefix: str = None):
+    """
+    Streams the Gemini reply: yields text chunks as they are generated.
     """
-    response = MODEL.generate_content(prompt)
+    cached_model = _cached_model(prefix) if prefix else None
+    start = time.perf_counter()
+    last = None
+    # The span covers the whole stream; time to first token is recorded separately
+    with metrics.span("gemini", "therapist_stream"):
+        if cached_model is not None:
+            responses = cached_model.generate_content(prompt, stream=True)
+        else:
+            responses = clients.gemini(MODEL_NAME).generate_content((prefix or "") + prompt, stream=True)
+        for chunk in responses:
+            if last is None:
+                _observe_first_token(start)
+            last = chunk
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+    if last is not None:
+        # usage totals arrive with the final chunk
+        _log_usage(last)
+
+
+def _observe_first_token(start: float):
+    metrics.EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start, service="gemini",
+                                          operation="therapist_stream_first_token")
+
+
+def _chunk_text(chunk) -> str:
+    if not chunk.candidates or not chunk.candidates[0].content.parts:
+        return ""
+    return chunk.candidates[0].content.parts[0].text
+
+
+# ---------------- ASYNC (asgi.py) ----------------
+async def _cached_model_async(prefix: str):
+    if not prefix or not config.PROMPT_EXPLICIT_CACHE:
+        return None
+    # creating the cached content is a blocking SDK call (once per prefix and TTL)
+    return await asyncio.to_thread(_cached_model, prefix)
+
+
+async def call_gemini_async(prompt: str, prefix: str = None):
+    """call_gemini on the event loop (generate_content_async)."""
+    cached_model = await _cached_model_async(prefix)
+    with metrics.span("gemini", "therapist_reply"):
+        if cached_model is not None:
+            response = await cached_model.generate_content_async(prompt)
+        else:
+            response = await clients.gemini(MODEL_NAME).generate_content_async((prefix or "") + prompt)
+    _log_usage(response)
     return response.candidates[0].content.parts[0].text
+
+
+async def call_gemini_turn_async(prompt: str, prefix: str = None) -> tuple:
+    """call_gemini_turn on the event loop."""
+    cached_model = await _cached_model_async(prefix)
+    with metrics.span("gemini", "therapist_turn"):
+        if cached_model is not None:
+            response = await cached_model.generate_content_async(prompt, generation_config=TURN_GENERATION_CONFIG)
+        else:
+            response = await clients.gemini(MODEL_NAME).generate_content_async(
+                (prefix or "") + prompt, generation_config=TURN_GENERATION_CONFIG
+            )
+    _log_usage(response)
+    reply, summary = _parse_turn(response.candidates[0].content.parts[0].text)
+    if reply is None:
+        return await call_gemini_async(_reply_only(prompt), prefix=prefix), None
+    return reply, summary
+
+
+async def stream_gemini_async(prompt: str, prefix: str = None):
+    """stream_gemini on the event loop: an async generator of text chunks."""
+    cached_model = await _cached_model_async(prefix)
+    start = time.perf_counter()
+    last = None
+    with metrics.span("gemini", "therapist_stream"):
+        if cached_model is not None:
+            responses = await cached_model.generate_content_async(prompt, stream=True)
+        else:
+            responses = await clients.gemini(MODEL_NAME).generate_content_async((prefix or "") + prompt, stream=True)
+        async for chunk in responses:
+            if last is None:
+                _observe_first_token(start)
+            last = chunk
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+    if last is not None:
+        _log_usage(last)
@@ -0,0 +1,364 @@
+# services/query_metadata.py
+"""
+Fast, in-process metadata extraction for search queries.
+Resolves relative date phrases, people seen in the user's own journals and a
+mood/emotion/tag vocabulary without calling Gemini. Gemini is only used as a
+fallback when the query has cues the local parser cannot resolve.
+Results are cached per (user, normalized query, day).
+"""
+
+import calendar
+import logging
+import re
+from datetime import datetime, date, timedelta
+
+import config
+from services import clients, metrics
+from services.cache import LRUCache
+from services.metadata_extraction import extract_query_filters_llm
+
+logger = logging.getLogger(__name__)
+
+_query_cache = LRUCache(max_entries=config.QUERY_METADATA_CACHE_SIZE)
+_vocab_cache = LRUCache(max_entries=config.QUERY_VOCAB_CACHE_SIZE, ttl=config.QUERY_VOCAB_TTL)
+
+# Bumped whenever a user's vocabulary is invalidated, so cached query results go stale with it
+_vocab_generation = {}
+
+MAX_TERMS_PER_FILTER = 10
+
+# ---------------- VOCABULARY ----------------
+# canonical concept -> words that signal it in a query
+EMOTION_LEXICON = {
+    "anxious": ["anxious", "anxiety", "nervous", "nervousness", "worried", "worry", "worrying", "panic", "uneasy"],
+    "stressed": ["stressed", "stress", "stressful", "pressure", "overwhelmed", "overwhelm"],
+    "sad": ["sad", "sadness", "unhappy", "depressed", "depression", "miserable", "heartbroken"],
+    "happy": ["happy", "happiness", "joy", "joyful", "glad", "cheerful"],
+    "excited": ["excited", "excitement", "thrilled"],
+    "angry": ["angry", "anger", "mad", "furious", "annoyed", "annoyance", "irritated"],
+    "frustrated": ["frustrated", "frustration", "frustrating"],
+    "lonely": ["lonely", "loneliness", "isolated", "isolation"],
+    "tired": ["tired", "exhausted", "exhaustion", "drained", "burnout", "fatigue"],
+    "calm": ["calm", "relaxed", "peaceful", "relief", "relieved"],
+    "hopeful": ["hopeful", "hope", "optimistic", "optimism"],
+    "grateful": ["grateful", "gratitude", "thankful"],
+    "scared": ["scared", "afraid", "fear", "fearful", "terrified"],
+    "guilty": ["guilty", "guilt", "ashamed", "shame"],
+    "proud": ["proud", "pride", "accomplished"],
+    "grief": ["grief", "grieving", "mourning", "bereaved"],
+    "confused": ["confused", "confusion", "uncertain", "uncertainty"],
+}
+
+TAG_LEXICON = {
+    "work": ["work", "job", "office", "boss", "manager", "meeting", "deadline", "project", "presentation", "career"],
+    "exercise": ["exercise", "workout", "gym", "run", "running", "walk", "walking", "yoga", "hike", "hiking"],
+    "family": ["family", "mom", "mum", "dad", "mother", "father", "parents", "sister", "brother"],
+    "friends": ["friend", "friends", "friendship"],
+    "relationships": ["relationship", "partner", "boyfriend", "girlfriend", "husband", "wife", "dating"],
+    "sleep": ["sleep", "insomnia", "nap"],
+    "study": ["study", "studying", "exam", "exams", "class", "school", "college", "university", "homework"],
+    "health": ["health", "doctor", "sick", "illness", "therapy", "medication"],
+    "travel": ["travel", "trip", "vacation", "holiday", "flight"],
+}
+
+_WORD_TO_EMOTION = {w: concept for concept, words in EMOTION_LEXICON.items() for w in words}
+_WORD_TO_TAG = {w: concept for concept, words in TAG_LEXICON.items() for w in words}
+
+_SUFFIXES = ("nesses", "ness", "ation", "ities", "ity", "ious", "iety", "ing", "ful", "ous", "ied", "ies", "ed", "es", "s", "y")
+
+_NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "couple of": 2, "few": 3, "a few": 3,
+}
+_WEEKDAYS = {name.lower(): i for i, name in enumerate(calendar.day_name)}
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name and name.lower() != "may"})
+
+_NOT_NAMES = {"i", "i'm", "i've", "i'll", "i'd", "im", "ok", "okay"}
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping so 'stressed', 'stressful' and 'stress' compare equal."""
+    for suffix in _SUFFIXES:
+        # A final "ss" belongs to the stem (stress, class), it is not a plural
+        if suffix == "s" and word.endswith("ss"):
+            continue
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", query.strip().lower()).strip(" .!?")
+
+
+def _tokens(text: str) -> list:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+# ---------------- DATE PHRASES ----------------
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _month_range(year: int, month: int) -> tuple:
+    last = calendar.monthrange(year, month)[1]
+    return date(year, month, 1), date(year, month, last)
+
+
+def _parse_count(text: str) -> int:
+    text = text.strip()
+    if text.isdigit():
+        return int(text)
+    return _NUMBER_WORDS.get(text, 0)
+
+
+def parse_date_range(text: str, today: date) -> tuple:
+    """
+    Resolve the first date phrase in text into an inclusive (date_from, date_to) range.
+    Returns (None, None) if no date phrase is found.
+    """
+    text = normalize_query(text)
+
+    match = re.search(r"\b(\d{4})-(\d{2})-(\d{2})\b", text)
+    if match:
+        try:
+            day = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            return day, day
+        except ValueError:
+            pass
+
+    if re.search(r"\bday before yesterday\b", text):
+        day = today - timedelta(days=2)
+        return day, day
+    if re.search(r"\b(yesterday|last night)\b", text):
+        day = today - timedelta(days=1)
+        return day, day
+    if re.search(r"\b(today|tonight|this morning|this afternoon|this evening)\b", text):
+        return today, today
+
+    match = re.search(r"\b(\d+|an?|one|two|three|four|five|six|seven|eight|nine|ten|couple of|a few|few) (day|week|month)s? ago\b", text)
+    if match:
+        count = _parse_count(match.group(1))
+        unit = match.group(2)
+        if unit == "day":
+            day = today - timedelta(days=count)
+            return day, day
+        if unit == "week":
+            start = _week_start(today) - timedelta(weeks=count)
+            return start, start + timedelta(days=6)
+        year, month = today.year, today.month - count
+        while month < 1:
+            month += 12
+            year -= 1
+        return _month_range(year, month)
+
+    match = re.search(r"\b(?:past|last) (\d+|two|three|four|five|six|seven|ten|few|couple of) (day|week)s\b", text)
+    if match:
+        count = _parse_count(match.group(1))
+        days = count * (7 if match.group(2) == "week" else 1)
+        return today - timedelta(days=days - 1), today
+
+    if re.search(r"\bpast week\b", text):
+        return today - timedelta(days=6), today
+    if re.search(r"\blast week\b", text):
+        start = _week_start(today) - timedelta(weeks=1)
+        return start, start + timedelta(days=6)
+    if re.search(r"\bthis week\b", text):
+        return _week_start(today), today
+    match = re.search(r"\b(last|this|past) weekend\b", text)
+    if match:
+        # Most recent Saturday (today if it is Saturday)
+        saturday = today - timedelta(days=(today.weekday() - 5) % 7)
+        if match.group(1) == "last" and today.weekday() in (5, 6):
+            saturday -= timedelta(weeks=1)
+        return saturday, min(saturday + timedelta(days=1), today)
+    if re.search(r"\blast month\b", text):
+        year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+        return _month_range(year, month)
+    if re.search(r"\bthis month\b", text):
+        return today.replace(day=1), today
+    if re.search(r"\blast year\b", text):
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    if re.search(r"\bthis year\b", text):
+        return date(today.year, 1, 1), today
+
+    match = re.search(r"\b(?:on |last )?(" + "|".join(_WEEKDAYS) + r")\b", text)
+    if match:
+        weekday = _WEEKDAYS[match.group(1)]
+        delta = (today.weekday() - weekday) % 7
+        if delta == 0 and "last " + match.group(1) in text:
+            delta = 7
+        day = today - timedelta(days=delta)
+        return day, day
+
+    # Month names; "may" only counts after "in"/"last"/"of"/"since" or before a day number.
+    # "since <month>" runs from that month (or day) up to today.
+    month_names = "|".join(sorted(_MONTHS, key=len, reverse=True))
+    match = re.search(r"\b(?:(in|last|of|since) )?(" + month_names + r")\b(?: (\d{1,2})(?:st|nd|rd|th)?\b)?(?:,? (\d{4}))?", text)
+    if match and (match.group(2) != "may" or match.group(1) or match.group(3)):
+        month = _MONTHS[match.group(2)]
+        year = int(match.group(4)) if match.group(4) else today.year
+        if not match.group(4) and (year, month) > (today.year, today.month):
+            year -= 1
+        since = match.group(1) == "since"
+        if match.group(3):
+            try:
+                day = date(year, month, int(match.group(3)))
+                return (day, today) if since else (day, day)
+            except ValueError:
+                pass
+        first, last = _month_range(year, month)
+        return (first, today) if since else (first, last)
+
+    return None, None
+
+
+# ---------------- USER VOCABULARY ----------------
+def _load_user_vocabulary(user_id: str) -> dict:
+    """
+    Collects the people, tags and emotions that appear in the user's recent journal metadata.
+    Only the metadata fields are downloaded (field projection).
+    """
+    vocab = {"people": set(), "tags": set(), "emotions": set()}
+    try:
+        docs = clients.firestore().collection("users").document(user_id).collection("journals")\
+                 .select(["metadata.people", "metadata.tags", "metadata.emotions"])\
+                 .order_by("created_at", direction="DESCENDING")\
+                 .limit(config.QUERY_VOCAB_SAMPLE_SIZE).stream()
+        with metrics.span("firestore", "journal_vocabulary"):
+            for doc in docs:
+                metadata = (doc.to_dict() or {}).get("metadata") or {}
+                for key in vocab:
+                    for value in metadata.get(key) or []:
+                        if isinstance(value, str) and value.strip():
+                            vocab[key].add(value.strip())
+    except Exception as e:
+        logger.warning("Could not load journal vocabulary for user %s: %s", user_id, e)
+    return vocab
+
+
+def get_user_vocabulary(user_id: str) -> dict:
+    vocab = _vocab_cache.get(user_id)
+    if vocab is None:
+        vocab = _load_user_vocabulary(user_id)
+        _vocab_cache.put(user_id, vocab)
+    return vocab
+
+
+def invalidate_user_vocabulary(user_id: str):
+    """Drop the cached vocabulary so newly stored journals are picked up."""
+    _vocab_cache.pop(user_id)
+    _vocab_generation[user_id] = _vocab_generation.get(user_id, 0) + 1
+
+
+# ---------------- MATCHING ----------------
+def _match_people(text: str, people: set) -> list:
+    matched = []
+    for name in sorted(people, key=len, reverse=True):
+        if re.search(r"(?<![a-z0-9])" + re.escape(name.lower()) + r"(?![a-z0-9])", text):
+            matched.append(name)
+    return matched
+
+
+def _match_terms(tokens: list, lexicon_map: dict, user_terms: set) -> list:
+    """
+    Match query tokens against a static lexicon and the user's own metadata terms.
+    Returns the user's stored spellings (so Firestore equality matches) plus canonical terms.
+    """
+    stems = {_stem(t) for t in tokens}
+    concepts = {lexicon_map[t] for t in tokens if t in lexicon_map}
+    concepts |= {lexicon_map[w] for w in lexicon_map if _stem(w) in stems}
+
+    matched = []
+    for term in sorted(user_terms):
+        words = _tokens(term)
+        if not words:
+            continue
+        term_stems = {_stem(w) for w in words}
+        term_concepts = {lexicon_map.get(w) for w in words} | {lexicon_map.get(_stem(w)) for w in words}
+        if term_stems <= stems or (term_concepts & concepts):
+            matched.append(term)
+    for concept in sorted(concepts):
+        if concept not in matched:
+            matched.append(concept)
+    return matched[:MAX_TERMS_PER_FILTER]
+
+
+def _needs_llm_fallback(query: str, filters: dict, vocab: dict) -> bool:
+    """
+    True when nothing was resolved locally but the query has cues that suggest
+    filters: capitalised words that may be unknown names, or numbers that may be dates.
+    """
+    if filters:
+        return False
+    known = {name.lower() for name in vocab["people"]}
+    words = re.findall(r"[A-Za-z0-9']+", query)
+    for i, word in enumerate(words):
+        if word.isdigit():
+            return True
+        if i > 0 and word[0].isupper() and word.lower() not in _NOT_NAMES and word.lower() not in known:
+            return True
+    return False
+
+
+def extract_local(query: str, user_id: str = None, today: date = None) -> dict:
+    """
+    Rule-based extraction; returns a flat filter dict with any of
+    people, emotions, tags, date_from, date_to (ISO dates, inclusive).
+    """
+    today = today or datetime.utcnow().date()
+    text = normalize_query(query)
+    tokens = _tokens(text)
+    vocab = get_user_vocabulary(user_id) if user_id else {"people": set(), "tags": set(), "emotions": set()}
+
+    filters = {}
+    date_from, date_to = parse_date_range(text, today)
+    if date_from:
+        filters["date_from"] = date_from.isoformat()
+        filters["date_to"] = date_to.isoformat()
+
+    people = _match_people(text, vocab["people"])
+    if people:
+        filters["people"] = people[:MAX_TERMS_PER_FILTER]
+
+    emotions = _match_terms(tokens, _WORD_TO_EMOTION, vocab["emotions"])
+    if emotions:
+        filters["emotions"] = emotions
+
+    tags = _match_terms(tokens, _WORD_TO_TAG, vocab["tags"])
+    if tags:
+        filters["tags"] = tags
+
+    return filters
+
+
+def extract_query_metadata(query: str, user_id: str = None) -> dict:
+    """
+    Returns search filters for a query, for use with hybrid_search.
+    Local extraction first; Gemini only when the local pass finds nothing but the
+    query looks like it refers to specific people or dates. Cached per user/query/day.
+    """
+    today = datetime.utcnow().date()
+    key = (user_id, _vocab_generation.get(user_id, 0), normalize_query(query), today.isoformat())
+    cached = _query_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    filters = extract_local(query, user_id=user_id, today=today)
+
+    if config.QUERY_METADATA_LLM_FALLBACK:
+        vocab = get_user_vocabulary(user_id) if user_id else {"people": set()}
+        if _needs_llm_fallback(query, filters, vocab):
+            try:
+                filters = extract_query_filters_llm(query)
+            except Exception as e:
+                logger.warning("Gemini metadata fallback failed: %s", e)
+
+    _query_cache.put(key, filters)
+    return dict(filters)
+
+
+def cache_stats() -> dict:
+    return {"queries": _query_cache.stats(), "vocabulary": _vocab_cache.stats()}
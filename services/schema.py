@@ -0,0 +1,90 @@
+# services/schema.py
+"""
+Postgres schema migrations, applied in order by `python manage.py migrate`.
+Every statement is idempotent; applied migration names are recorded in schema_migrations.
+"""
+
+import logging
+
+from services.db_connection import connection
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    ("001_embedding_tables", """
+        CREATE EXTENSION IF NOT EXISTS vector;
+        CREATE TABLE IF NOT EXISTS journal_embeddings (
+            id SERIAL PRIMARY KEY,
+            journal_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            embedding vector(768),  -- matches text-embedding-005 model
+            created_at TIMESTAMP DEFAULT NOW(),
+            UNIQUE(journal_id)
+        );
+        CREATE TABLE IF NOT EXISTS conversation_embeddings (
+            id SERIAL PRIMARY KEY,
+            summary_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            embedding vector(768),  -- matches text-embedding-005 model
+            created_at TIMESTAMP DEFAULT NOW(),
+            UNIQUE(summary_id)
+        );
+    """),
+    ("002_embedding_cache", """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            embedding BYTEA NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+    """),
+    # Summary + metadata next to the vectors so retrieval is a single query
+    ("003_embedding_content", """
+        ALTER TABLE journal_embeddings
+            ADD COLUMN IF NOT EXISTS summary TEXT,
+            ADD COLUMN IF NOT EXISTS metadata JSONB;
+        ALTER TABLE conversation_embeddings
+            ADD COLUMN IF NOT EXISTS summary TEXT,
+            ADD COLUMN IF NOT EXISTS metadata JSONB;
+    """),
+    # Hybrid search filters: jsonb containment on metadata within one user's rows
+    ("004_journal_metadata_indexes", """
+        CREATE EXTENSION IF NOT EXISTS btree_gin;
+        CREATE INDEX IF NOT EXISTS journal_embeddings_user_metadata_gin
+            ON journal_embeddings USING GIN (user_id, metadata jsonb_path_ops);
+        CREATE INDEX IF NOT EXISTS journal_embeddings_user_created_idx
+            ON journal_embeddings (user_id, created_at DESC);
+    """),
+    # Exact per-user scans for light users; ANN indexes are managed with `manage.py ann-index`
+    ("005_conversation_user_index", """
+        CREATE INDEX IF NOT EXISTS conversation_embeddings_user_created_idx
+            ON conversation_embeddings (user_id, created_at DESC);
+    """),
+]
+
+
+def apply_migrations() -> list:
+    """Applies pending migrations; returns the names that were applied."""
+    applied = []
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name TEXT PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT NOW()
+                )
+            """)
+            cur.execute("SELECT name FROM schema_migrations")
+            done = {row[0] for row in cur.fetchall()}
+        conn.commit()
+
+        for name, sql in MIGRATIONS:
+            if name in done:
+                continue
+            logger.info("Applying migration %s", name)
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+            conn.commit()
+            applied.append(name)
+    return applied
@@ -0,0 +1,135 @@
+# services/search_cache.py
+"""
+Per-user cache of hybrid search results (services/hybrid_search.py), so a query repeated
+or slightly reworded within a session skips the search.
+
+- key: user, normalized query, top_k and the metadata filter set
+- near-duplicates: a query whose embedding has cosine similarity >= SEARCH_CACHE_SIMILARITY
+  with a cached query of the same user, top_k and filters gets that query's results
+- versions: entries carry the user's version from before the search; bump(user_id) after a
+  journal write makes every older entry of the user stale at once
+- memory: LRU bounded by SEARCH_CACHE_MAX_BYTES; SEARCH_CACHE_TTL bounds staleness from
+  journals written through other instances
+"""
+
+import json
+import threading
+
+import numpy as np
+
+import config
+from services import metrics
+from services.cache import LRUCache
+from services.query_metadata import normalize_query
+
+_lock = threading.Lock()
+_versions = {}  # user_id -> int, bumped on journal writes
+
+
+def _sizeof(entry: dict) -> int:
+    return entry["size"]
+
+
+_cache = LRUCache(max_bytes=config.SEARCH_CACHE_MAX_BYTES, ttl=config.SEARCH_CACHE_TTL, sizeof=_sizeof)
+# (user_id, top_k, filters) -> recent keys of that group, the candidates for near-duplicate matching
+_groups = LRUCache(max_entries=max(1, config.SEARCH_CACHE_MAX_BYTES // (64 * 1024)), ttl=config.SEARCH_CACHE_TTL)
+
+_stats = {"exact": 0, "similar": 0, "stale": 0, "miss": 0}
+
+
+def _count(result: str):
+    with _lock:
+        _stats[result] += 1
+    metrics.SEARCH_CACHE_LOOKUPS.inc(result=result)
+
+
+def _filters_key(metadata_filters: dict) -> str:
+    return json.dumps(metadata_filters or {}, sort_keys=True, default=str)
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def version(user_id: str) -> int:
+    """Read before searching and passed to put(), so results that raced with a write are not served."""
+    with _lock:
+        return _versions.get(user_id, 0)
+
+
+def bump(user_id: str):
+    """Called after a user's journals changed: every cached result of the user goes stale."""
+    with _lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def get(user_id: str, query: str, embedding, metadata_filters: dict, top_k: int):
+    """Returns cached results (a fresh list) or None."""
+    if not config.SEARCH_CACHE_ENABLED:
+        return None
+    current = version(user_id)
+    group = (user_id, top_k, _filters_key(metadata_filters))
+    key = group + (normalize_query(query),)
+
+    entry = _cache.get(key)
+    if entry is not None:
+        if entry["version"] == current:
+            _count("exact")
+            return [dict(r) for r in entry["results"]]
+        _cache.pop(key)
+        _count("stale")
+        return None
+
+    if config.SEARCH_CACHE_SIMILARITY > 0 and embedding is not None:
+        keys = list(_groups.peek(group) or ())
+        entries = [(k, _cache.peek(k)) for k in keys]
+        entries = [(k, e) for k, e in entries if e is not None and e["version"] == current]
+        if entries:
+            similarities = np.stack([e["embedding"] for _, e in entries]) @ _unit(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= config.SEARCH_CACHE_SIMILARITY:
+                _cache.get(entries[best][0])  # refresh its recency
+                _count("similar")
+                return [dict(r) for r in entries[best][1]["results"]]
+
+    _count("miss")
+    return None
+
+
+def put(user_id: str, query: str, embedding, metadata_filters: dict, top_k: int, results: list,
+        search_version: int):
+    if not config.SEARCH_CACHE_ENABLED:
+        return
+    group = (user_id, top_k, _filters_key(metadata_filters))
+    key = group + (normalize_query(query),)
+    unit = _unit(embedding)
+    size = len(json.dumps(results, default=str)) + unit.nbytes + len(key[2]) + len(key[3]) + 200
+    _cache.put(key, {"version": search_version, "results": [dict(r) for r in results], "embedding": unit,
+                     "size": size})
+
+    if config.SEARCH_CACHE_SIMILARITY > 0:
+        with _lock:
+            keys = [k for k in (_groups.peek(group) or ()) if k != key]
+            keys = (keys + [key])[-config.SEARCH_CACHE_SIMILAR_CANDIDATES:]
+            _groups.put(group, tuple(keys))
+
+
+def stats() -> dict:
+    with _lock:
+        counts = dict(_stats)
+    lookups = sum(counts.values())
+    hits = counts["exact"] + counts["similar"]
+    cache = _cache.stats()
+    return {
+        "enabled": config.SEARCH_CACHE_ENABLED,
+        "entries": cache["entries"],
+        "bytes": cache["bytes"],
+        "evictions": cache["evictions"],
+        "exact_hits": counts["exact"],
+        "similar_hits": counts["similar"],
+        "stale": counts["stale"],
+        "misses": counts["miss"],
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,319 @@
+# services/summary_queue.py
+"""
+Write-behind queue for conversation summaries.
+
+/therapist hands each finished turn to enqueue() and replies right away; the turn
+is persisted in a local SQLite file, so it survives worker restarts. A small pool of
+background workers claims the oldest turns of one user at a time (up to
+SUMMARY_QUEUE_BATCH_SIZE), summarizes them with one Gemini call, embeds them in one
+batch and stores them (conversation_service.summarize_turns / store_conversation_summaries).
+Turns queued with the summary generated alongside the reply (THERAPIST_COMBINED_SUMMARY)
+skip the Gemini call and are only embedded and stored.
+
+Ordering: a user is only ever claimed by one worker, always starting from their oldest
+turn, and a failed batch blocks that user's later turns until it is retried (with
+exponential backoff) or gives up after SUMMARY_QUEUE_MAX_ATTEMPTS. created_at is the
+time the turn was queued, so Firestore order matches conversation order regardless of
+when the summary is written. summary_id is fixed at enqueue time, which makes retries
+idempotent.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        summary_id TEXT NOT NULL UNIQUE,
+        user_id TEXT NOT NULL,
+        user_message TEXT NOT NULL,
+        ai_response TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',  -- pending | dead
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        claimed_at REAL,
+        last_error TEXT,
+        summary TEXT,    -- set when the summary came with the reply
+        metadata TEXT    -- JSON, with summary
+    );
+    CREATE INDEX IF NOT EXISTS turns_user_idx ON turns (user_id, status, id);
+"""
+
+# Columns added after the first release; queue files from older versions get them on open
+_ADDED_COLUMNS = (("summary", "TEXT"), ("metadata", "TEXT"))
+
+_init_lock = threading.Lock()
+_initialized = False
+_wakeup = threading.Event()
+_workers = []
+
+# metrics
+_stats_lock = threading.Lock()
+_processed = 0
+_batches = 0
+_failures = 0
+_dead = 0
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    conn = sqlite3.connect(config.SUMMARY_QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(turns)")}
+                for name, column_type in _ADDED_COLUMNS:
+                    if name not in existing:
+                        conn.execute(f"ALTER TABLE turns ADD COLUMN {name} {column_type}")
+                _initialized = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _turn(row) -> dict:
+    turn = {
+        "id": row["id"],
+        "summary_id": row["summary_id"],
+        "user_id": row["user_id"],
+        "user_message": row["user_message"],
+        "ai_response": row["ai_response"],
+        "created_at": datetime.fromisoformat(row["created_at"]),
+    }
+    if row["summary"]:
+        turn["summary"] = row["summary"]
+        turn["metadata"] = json.loads(row["metadata"]) if row["metadata"] else {}
+    return turn
+
+
+# ---------------- PRODUCER ----------------
+def enqueue(user_id: str, user_message: str, ai_response: str, summary: dict = None) -> str:
+    """
+    Persists a turn for background summarization and returns its summary_id.
+    summary: {"summary", "metadata"} when it was generated with the reply (no Gemini call needed).
+    """
+    summary_id = str(uuid.uuid4())
+    conn = _connect()
+    try:
+        conn.execute(
+            """
+            INSERT INTO turns (summary_id, user_id, user_message, ai_response, created_at, summary, metadata)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (summary_id, user_id, user_message, ai_response, datetime.utcnow().isoformat(),
+             summary["summary"] if summary else None,
+             json.dumps(summary.get("metadata") or {}) if summary else None)
+        )
+    finally:
+        conn.close()
+    start()
+    _wakeup.set()
+    return summary_id
+
+
+def pending_turns(user_id: str, n: int) -> list:
+    """The user's newest n turns that are not summarized yet (newest first)."""
+    try:
+        conn = _connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM turns WHERE user_id = ? AND status = 'pending' ORDER BY id DESC LIMIT ?",
+                (user_id, n)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Summary queue unavailable: %s", e)
+        return []
+    return [_turn(row) for row in rows]
+
+
+def provisional_summary(turn: dict, max_chars: int = 200) -> str:
+    """Stand-in for a summary that has not been generated yet."""
+    def clip(text):
+        return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + "..."
+    return f'User said: "{clip(turn["user_message"])}" AI replied: "{clip(turn["ai_response"])}"'
+
+
+# ---------------- CONSUMER ----------------
+def _claim_batch():
+    """
+    Claims up to SUMMARY_QUEUE_BATCH_SIZE of the oldest turns of one user whose oldest
+    turn is due and who is not being processed by another worker. Returns a list of turns or [].
+    """
+    now = time.time()
+    stale = now - config.SUMMARY_QUEUE_CLAIM_TIMEOUT
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Each user's oldest pending turn decides whether the user is due
+            row = conn.execute(
+                """
+                SELECT t.user_id, t.attempts
+                FROM turns t
+                WHERE t.status = 'pending'
+                  AND t.id = (SELECT MIN(id) FROM turns WHERE user_id = t.user_id AND status = 'pending')
+                  AND t.next_attempt_at <= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM turns c
+                      WHERE c.user_id = t.user_id AND c.status = 'pending' AND c.claimed_at > ?
+                  )
+                ORDER BY t.id
+                LIMIT 1
+                """,
+                (now, stale)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return []
+            # A batch that failed before is retried turn by turn, so one bad turn cannot sink the rest
+            limit = 1 if row["attempts"] else config.SUMMARY_QUEUE_BATCH_SIZE
+            rows = conn.execute(
+                "SELECT * FROM turns WHERE user_id = ? AND status = 'pending' ORDER BY id LIMIT ?",
+                (row["user_id"], limit)
+            ).fetchall()
+            conn.executemany("UPDATE turns SET claimed_at = ? WHERE id = ?", [(now, r["id"]) for r in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return [_turn(r) for r in rows]
+
+
+def _complete(turns: list):
+    conn = _connect()
+    try:
+        conn.executemany("DELETE FROM turns WHERE id = ?", [(t["id"],) for t in turns])
+    finally:
+        conn.close()
+
+
+def _fail(turns: list, error: Exception):
+    """Releases the claim and schedules a retry with exponential backoff (or gives up)."""
+    global _dead
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for turn in turns:
+            attempts = conn.execute("SELECT attempts FROM turns WHERE id = ?", (turn["id"],)).fetchone()[0] + 1
+            if attempts >= config.SUMMARY_QUEUE_MAX_ATTEMPTS:
+                status = "dead"
+                with _stats_lock:
+                    _dead += 1
+                logger.error("Giving up on conversation turn %s for user %s after %s attempts: %s",
+                             turn["summary_id"], turn["user_id"], attempts, error)
+            else:
+                status = "pending"
+            delay = min(config.SUMMARY_QUEUE_RETRY_BASE * 2 ** (attempts - 1), config.SUMMARY_QUEUE_RETRY_MAX)
+            conn.execute(
+                """
+                UPDATE turns
+                SET attempts = ?, status = ?, next_attempt_at = ?, claimed_at = NULL, last_error = ?
+                WHERE id = ?
+                """,
+                (attempts, status, time.time() + delay, str(error)[:500], turn["id"])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _process(turns: list):
+    global _processed, _batches, _failures
+    from services import conversation_service
+
+    user_id = turns[0]["user_id"]
+    try:
+        unsummarized = [turn for turn in turns if "summary" not in turn]
+        if unsummarized:
+            summaries = conversation_service.summarize_turns(unsummarized)
+            for turn, result in zip(unsummarized, summaries):
+                turn["summary"] = result["summary"]
+                turn["metadata"] = result["metadata"]
+        conversation_service.store_conversation_summaries(user_id, turns)
+    except Exception as e:
+        logger.warning("Summarizing %s turn(s) for user %s failed: %s", len(turns), user_id, e)
+        with _stats_lock:
+            _failures += 1
+        _fail(turns, e)
+        return
+
+    _complete(turns)
+    with _stats_lock:
+        _processed += len(turns)
+        _batches += 1
+
+
+def _worker():
+    while True:
+        try:
+            turns = _claim_batch()
+        except sqlite3.Error as e:
+            logger.error("Summary queue claim failed: %s", e)
+            turns = []
+        if turns:
+            try:
+                _process(turns)
+            except Exception as e:
+                # claim expires after SUMMARY_QUEUE_CLAIM_TIMEOUT and the batch is retried
+                logger.error("Summary queue worker error: %s", e)
+            continue
+        # Nothing due: sleep until a new turn arrives or a retry may be due
+        _wakeup.wait(config.SUMMARY_QUEUE_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start():
+    """Starts the background workers once per process (also drains turns left by a previous run)."""
+    with _init_lock:
+        if _workers:
+            return
+        for i in range(config.SUMMARY_QUEUE_WORKERS):
+            thread = threading.Thread(target=_worker, name=f"summary-queue-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def _queue_sizes() -> dict:
+    counts = stats()
+    return {("pending",): counts["pending"], ("dead",): counts["dead"]}
+
+
+metrics.register_gauge("reflect_summary_queue_turns", "Conversation turns waiting in the write-behind queue.",
+                       _queue_sizes, labels=("status",))
+
+
+def stats() -> dict:
+    conn = _connect()
+    try:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM turns GROUP BY status").fetchall())
+    finally:
+        conn.close()
+    with _stats_lock:
+        return {
+            "pending": counts.get("pending", 0),
+            "dead": counts.get("dead", 0),
+            "processed": _processed,
+            "batches": _batches,
+            "failed_batches": _failures,
+            "given_up": _dead,
+        }
@@ -0,0 +1,112 @@
+# services/timeline.py
+"""
+Keyset pagination over a user's Firestore subcollections (journals, conversation_summary)
+for the timeline endpoints (/list_journals, /list_conversations).
+
+- order: created_at DESC, document id DESC (the tie-breaker for equal timestamps)
+- cursor: opaque token holding the last item's (created_at, id); the next page starts
+  strictly after it, so a page costs the same whatever its depth (no offsets)
+- filters: created_at range and metadata.mood (one value or several, "in");
+  mood + created_at needs the composite indexes in firestore.indexes.json
+- projection: only the listed fields are downloaded (never journal_text / full turns)
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+import config
+from services import clients, metrics, utils
+
+DOCUMENT_ID = "__name__"  # firestore.FieldPath.document_id()
+MAX_MOODS = 30  # Firestore's limit for "in" filters
+
+
+def encode_cursor(created_at: datetime, doc_id: str) -> str:
+    payload = json.dumps({"t": created_at.isoformat(), "id": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, doc_id) of the last item of the previous page; ValueError when malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def parse_range(start: str = None, end: str = None) -> tuple:
+    """
+    ISO date/datetime bounds -> (start, end, end_op). A date-only end includes that whole day;
+    "Z" or an offset is converted to naive UTC. Raises ValueError on malformed values.
+    """
+    try:
+        start_at = utils.parse_iso_datetime(start) if start else None
+        end_at = utils.parse_iso_datetime(end) if end else None
+    except ValueError as e:
+        raise ValueError("start_date and end_date must be ISO dates or datetimes") from e
+    if end_at is not None and len(end) == 10:
+        return start_at, end_at + timedelta(days=1), "<"
+    return start_at, end_at, "<="
+
+
+def page_size(limit) -> int:
+    try:
+        size = int(limit) if limit is not None else config.LIST_PAGE_SIZE
+    except (TypeError, ValueError) as e:
+        raise ValueError("limit must be an integer") from e
+    return max(1, min(size, config.LIST_PAGE_MAX))
+
+
+def list_page(user_id: str, collection: str, fields: list, limit: int = None, cursor: str = None,
+              start: str = None, end: str = None, moods: list = None) -> dict:
+    """
+    One page of users/{user_id}/{collection}, newest first.
+    Returns {"items": [(doc_id, data), ...], "next_cursor": str or None}; data holds only `fields`
+    (plus created_at) with timestamps left as stored.
+    """
+    size = page_size(limit)
+    start_at, end_at, end_op = parse_range(start, end)
+    moods = [m for m in (moods or []) if m]
+    if len(moods) > MAX_MOODS:
+        raise ValueError(f"At most {MAX_MOODS} moods per request")
+
+    query = clients.firestore().collection("users").document(user_id).collection(collection)\
+        .select(list(dict.fromkeys(list(fields) + ["created_at"])))
+    if len(moods) == 1:
+        query = query.where("metadata.mood", "==", moods[0])
+    elif moods:
+        query = query.where("metadata.mood", "in", moods)
+    if start_at is not None:
+        query = query.where("created_at", ">=", start_at)
+    if end_at is not None:
+        query = query.where("created_at", end_op, end_at)
+    query = query.order_by("created_at", direction="DESCENDING")\
+                 .order_by(DOCUMENT_ID, direction="DESCENDING")
+    if cursor:
+        last_created_at, last_id = decode_cursor(cursor)
+        query = query.start_after({"created_at": last_created_at, DOCUMENT_ID: last_id})
+
+    # One extra document tells whether another page exists
+    with metrics.span("firestore", f"list_{collection}"):
+        docs = [(doc.id, doc.to_dict() or {}) for doc in query.limit(size + 1).stream()]
+
+    next_cursor = None
+    if len(docs) > size:
+        docs = docs[:size]
+        last_id, last = docs[-1]
+        next_cursor = encode_cursor(last["created_at"], last_id)
+    return {"items": docs, "next_cursor": next_cursor}
+
+
+def serialize(page: dict, id_field: str, fields: list) -> dict:
+    """JSON-ready page: items as {id_field, *fields, created_at} dicts."""
+    return {
+        "items": utils.make_serializable([
+            dict({id_field: doc_id}, **{field: data.get(field) for field in list(fields) + ["created_at"]})
+            for doc_id, data in page["items"]
+        ]),
+        "next_cursor": page["next_cursor"],
+    }
@@ -0,0 +1,243 @@
+# services/user_vector_index.py
+"""
+Optional in-process tier for journal similarity search (config.VECTOR_INDEX_ENABLED).
+
+Each active user's journal vectors are held as one contiguous, L2-normalized float32
+matrix, so a search is a single matrix-vector product plus argpartition instead of a
+Postgres round trip (and no 768-float text literal to format and parse).
+Users are loaded lazily from journal_embeddings, evicted LRU under VECTOR_INDEX_MAX_BYTES
+and expire after VECTOR_INDEX_TTL (bounds staleness from writes on other instances).
+Writes through store_embeddings() update the loaded copy; Postgres stays the source of truth.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from psycopg2 import DatabaseError, OperationalError
+
+import config
+from services import metrics
+from services.cache import LRUCache
+from services.db_connection import connection, PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class UserVectors:
+    """Immutable snapshot of one user's journal vectors and their stored content."""
+
+    def __init__(self, ids: list, matrix: np.ndarray, summaries: list, metadata: list, created_at: list):
+        self.ids = ids
+        self.matrix = matrix
+        self.summaries = summaries
+        self.metadata = metadata
+        self.created_at = created_at
+        self.positions = {journal_id: i for i, journal_id in enumerate(ids)}
+        self.nbytes = matrix.nbytes + sum(len(s or "") for s in summaries) + 256 * len(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similarities(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of the query against every row."""
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        return self.matrix @ query
+
+    def row(self, i: int, similarity: float) -> dict:
+        return {
+            "journal_id": self.ids[i],
+            "similarity": float(similarity),
+            "summary": self.summaries[i],
+            "metadata": self.metadata[i],
+            "created_at": self.created_at[i],
+        }
+
+    def with_rows(self, rows: list) -> "UserVectors":
+        """Copy with rows upserted, following store_embeddings' semantics."""
+        ids = list(self.ids)
+        summaries = list(self.summaries)
+        metadata = list(self.metadata)
+        created_at = list(self.created_at)
+        replaced = {}
+        appended = []
+        for row in rows:
+            vector = _normalize(np.asarray(row["embedding"], dtype=np.float32))
+            i = self.positions.get(row["summary_id"])
+            if i is None:
+                ids.append(row["summary_id"])
+                summaries.append(row.get("summary"))
+                metadata.append(row.get("metadata"))
+                created_at.append(_naive_utc(row.get("created_at")))
+                appended.append(vector)
+            else:
+                replaced[i] = vector
+                # content is only overwritten when the write carries it; created_at keeps the first write
+                if row.get("summary") is not None:
+                    summaries[i] = row["summary"]
+                if row.get("metadata") is not None:
+                    metadata[i] = row["metadata"]
+
+        existing = [self.matrix] if len(self.ids) else []
+        matrix = np.vstack(existing + appended) if appended else self.matrix.copy()
+        for i, vector in replaced.items():
+            matrix[i] = vector
+        return UserVectors(ids, np.ascontiguousarray(matrix), summaries, metadata, created_at)
+
+
+def _naive_utc(value):
+    """Matches what the TIMESTAMP column stores: naive UTC, NOW() when missing."""
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first (argpartition, then sort only those k)."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+_cache = LRUCache(max_bytes=config.VECTOR_INDEX_MAX_BYTES, ttl=config.VECTOR_INDEX_TTL,
+                  sizeof=lambda vectors: vectors.nbytes)
+
+# Users over VECTOR_INDEX_MAX_ROWS, so they are not re-read on every search
+_too_large_users = LRUCache(max_entries=10000, ttl=config.VECTOR_INDEX_TTL)
+
+_lock = threading.Lock()
+_load_locks = {}
+# Bumped on every write for a user; a load that raced with a write is not cached
+_generation = {}
+_too_large = 0
+_load_errors = 0
+
+
+def _load(user_id: str):
+    with metrics.span("postgres", "load_user_vectors"), connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT journal_id, embedding, summary, metadata, created_at
+                FROM journal_embeddings
+                WHERE user_id = %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (user_id, config.VECTOR_INDEX_MAX_ROWS + 1)
+            )
+            rows = cur.fetchall()
+
+    if len(rows) > config.VECTOR_INDEX_MAX_ROWS:
+        return None
+    if rows:
+        matrix = _normalize(np.vstack([np.asarray(r[1], dtype=np.float32) for r in rows]))
+    else:
+        matrix = np.empty((0, 0), dtype=np.float32)
+    return UserVectors(
+        ids=[r[0] for r in rows],
+        matrix=np.ascontiguousarray(matrix),
+        summaries=[r[2] for r in rows],
+        metadata=[r[3] for r in rows],
+        created_at=[r[4] for r in rows],
+    )
+
+
+def get(user_id: str):
+    """
+    Returns the user's UserVectors, loading them on first use, or None when the tier
+    is disabled, the user has more than VECTOR_INDEX_MAX_ROWS journals, or loading failed
+    (callers then search Postgres).
+    """
+    global _too_large, _load_errors
+    if not config.VECTOR_INDEX_ENABLED:
+        return None
+    vectors = _cache.get(user_id)
+    if vectors is not None or _too_large_users.get(user_id):
+        return vectors
+
+    with _lock:
+        load_lock = _load_locks.setdefault(user_id, threading.Lock())
+    with load_lock:
+        # Another thread may have loaded the user while we waited
+        vectors = _cache.get(user_id)
+        if vectors is not None:
+            return vectors
+        with _lock:
+            generation = _generation.get(user_id, 0)
+        try:
+            vectors = _load(user_id)
+        except (OperationalError, DatabaseError, PoolTimeout) as e:
+            logger.warning("Could not load journal vectors for user %s: %s", user_id, e)
+            with _lock:
+                _load_errors += 1
+            return None
+        finally:
+            with _lock:
+                _load_locks.pop(user_id, None)
+
+        if vectors is None:
+            _too_large_users.put(user_id, True)
+            with _lock:
+                _too_large += 1
+            return None
+        with _lock:
+            if _generation.get(user_id, 0) == generation:
+                _cache.put(user_id, vectors)
+        return vectors
+
+
+def apply_writes(rows: list):
+    """
+    Called after journal embeddings are committed: updates loaded users in place
+    (copy-on-write, so concurrent searches keep a consistent snapshot).
+    """
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(row)
+
+    with _lock:
+        for user_id, user_rows in by_user.items():
+            _generation[user_id] = _generation.get(user_id, 0) + 1
+            vectors = _cache.pop(user_id)
+            if vectors is None:
+                continue
+            try:
+                _cache.put(user_id, vectors.with_rows(user_rows))
+            except ValueError as e:
+                # e.g. a dimension mismatch; the next search reloads from Postgres
+                logger.warning("Dropping cached journal vectors for user %s: %s", user_id, e)
+
+
+def invalidate(user_id: str = None):
+    """Drops one user's vectors (or everything); the next search reloads from Postgres."""
+    with _lock:
+        if user_id is None:
+            for key in list(_cache.keys()):
+                _generation[key] = _generation.get(key, 0) + 1
+            _cache.clear()
+        else:
+            _generation[user_id] = _generation.get(user_id, 0) + 1
+            _cache.pop(user_id)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "enabled": config.VECTOR_INDEX_ENABLED,
+            **_cache.stats(),
+            "users_too_large": _too_large,
+            "load_errors": _load_errors,
+        }
@@ -1,4 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timezone
+
+
+def parse_iso_datetime(value: str) -> datetime:
+    """
+    datetime.fromisoformat that also accepts a trailing "Z" (rejected before Python 3.11).
+    Aware values are converted to naive UTC, like datetime.utcnow(). Raises ValueError.
+    """
+    if isinstance(value, str) and value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
 
 def make_serializable(obj):
     """
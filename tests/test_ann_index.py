@@ -0,0 +1,100 @@
+import numpy as np
+import psycopg2
+import pytest
+
+import config
+from services import ann_index
+from services.ann_index import search_settings_sql, user_search_settings_sql
+from services.hybrid_search import VECTOR_SEARCH_SQL
+
+
+@pytest.mark.parametrize("version, mode", [
+    ("0.8.0", "relaxed_order"), ("0.10.1", "relaxed_order"), ("0.7.4", "off"), ("0.5.1", "off"), ("", "off"),
+])
+def test_auto_scan_mode_from_pgvector_version(version, mode):
+    assert ann_index._scan_mode_for(version) == mode
+
+
+def test_settings_sql():
+    assert search_settings_sql(iterative_scan="off") == ""
+    relaxed = search_settings_sql(ef_search=40, iterative_scan="relaxed_order")
+    assert "'hnsw.ef_search', '40'" in relaxed and "'hnsw.iterative_scan', 'relaxed_order'" in relaxed
+    assert "enable_indexscan" not in relaxed
+    assert "'enable_indexscan', 'off'" in search_settings_sql(iterative_scan="off", exact=True)
+
+
+@pytest.fixture
+def auto_mode(monkeypatch):
+    monkeypatch.setattr(config, "ANN_ITERATIVE_SCAN", "auto")
+    monkeypatch.setattr(config, "ANN_EXACT_SCAN_MAX_ROWS", 1000)
+    monkeypatch.setattr(ann_index, "_user_rows", ann_index.LRUCache(max_entries=10))
+
+    def use(version: str, rows: dict):
+        monkeypatch.setattr(ann_index, "_detected_scan_mode", ann_index._scan_mode_for(version))
+        for user_id, count in rows.items():
+            ann_index._user_rows.put(user_id, count)
+    return use
+
+
+def test_iterative_scan_on_pgvector_08(auto_mode):
+    auto_mode("0.8.0", {"light": 5})
+    settings = user_search_settings_sql("light")
+    assert "relaxed_order" in settings and "enable_indexscan" not in settings
+
+
+def test_light_users_scan_exactly_on_older_pgvector(auto_mode):
+    auto_mode("0.7.4", {"light": 5, "heavy": 50000})
+    assert "'enable_indexscan', 'off'" in user_search_settings_sql("light")
+    assert "iterative_scan" not in user_search_settings_sql("light")
+    assert user_search_settings_sql("heavy") == ""
+
+
+# ---------------- AGAINST POSTGRES (skipped without one) ----------------
+@pytest.fixture
+def pg():
+    try:
+        conn = psycopg2.connect(host=config.PG_HOST, dbname=config.PG_DB, user=config.PG_USER,
+                                password=config.PG_PASSWORD, port=config.PG_PORT, connect_timeout=2)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no Postgres: {e}")
+    with conn.cursor() as cur:
+        cur.execute(ann_index.PGVECTOR_VERSION_SQL)
+        row = cur.fetchone()
+    if not row:
+        conn.close()
+        pytest.skip("pgvector is not installed")
+    yield conn, row[0]
+    conn.rollback()
+    conn.close()
+
+
+def test_filtered_search_returns_top_k_for_a_light_user(pg):
+    conn, version = pg
+    rng = np.random.default_rng(7)
+    dims, k = 16, 5
+
+    def literal(vector) -> str:
+        return "[" + ",".join(repr(float(x)) for x in vector) + "]"
+
+    with conn.cursor() as cur:
+        # Shadows the real table for this session only
+        cur.execute(f"""
+            CREATE TEMP TABLE journal_embeddings (
+                journal_id TEXT PRIMARY KEY, user_id TEXT, embedding vector({dims}),
+                summary TEXT, metadata JSONB, created_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+        rows = [(f"heavy-{i}", "heavy", literal(v)) for i, v in enumerate(rng.normal(size=(5000, dims)))]
+        rows += [(f"light-{i}", "light", literal(v)) for i, v in enumerate(rng.normal(size=(8, dims)))]
+        cur.executemany("INSERT INTO journal_embeddings (journal_id, user_id, embedding) VALUES (%s, %s, %s)", rows)
+        cur.execute("CREATE INDEX ON journal_embeddings (user_id)")
+        cur.execute("CREATE INDEX ON journal_embeddings USING hnsw (embedding vector_cosine_ops)")
+        cur.execute("ANALYZE journal_embeddings")
+
+        mode = ann_index._scan_mode_for(version)
+        settings = search_settings_sql(ef_search=10, iterative_scan=mode, exact=ann_index._needs_exact_scan(8))
+        query = literal(rng.normal(size=dims))
+        cur.execute(settings + VECTOR_SEARCH_SQL.format(
+            embedding="%(embedding)s::vector", user_id="%(user_id)s", top_k="%(top_k)s"
+        ), {"embedding": query, "user_id": "light", "top_k": k})
+        assert len(cur.fetchall()) == k
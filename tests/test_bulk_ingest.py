@@ -0,0 +1,81 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from benchmarks.fakes import FakeFirestore
+from services import bulk_ingest, clients, search_cache
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    """Runs ingest_journals offline; journal texts listed in `failing` fail analysis."""
+    firestore = FakeFirestore()
+    failing = set()
+    stored = []
+
+    def analyze(text):
+        if text in failing:
+            raise RuntimeError("Gemini unavailable")
+        return {"summary": f"summary of {text}", "metadata": {}}
+
+    monkeypatch.setattr(clients, "firestore", lambda: firestore)
+    monkeypatch.setattr(bulk_ingest, "analyze_journal", analyze)
+    monkeypatch.setattr(bulk_ingest, "existing_journals", lambda user_id, ids: set())
+    monkeypatch.setattr(bulk_ingest, "get_embeddings", lambda texts: [[0.0] for _ in texts])
+    monkeypatch.setattr(bulk_ingest, "store_embeddings", lambda rows, table: stored.extend(rows))
+    monkeypatch.setattr(bulk_ingest, "invalidate_user_vocabulary", lambda user_id: None)
+    monkeypatch.setattr(search_cache, "bump", lambda user_id: None)
+
+    def run(texts, chunk_size=10):
+        # Each entry is a journal text or a dict of line fields
+        lines = [json.dumps(dict({"user_id": "u1"}, **(text if isinstance(text, dict) else {"journal_text": text})))
+                 for text in texts]
+        *statuses, summary = bulk_ingest.ingest_journals(lines, chunk_size=chunk_size)
+        return statuses, summary, stored
+
+    run.failing = failing
+    return run
+
+
+@pytest.mark.parametrize("chunk_size", [10, 1])
+def test_repeated_line_is_stored_once(ingest, chunk_size):
+    statuses, summary, stored = ingest(["a", "b", "a"], chunk_size=chunk_size)
+    assert [(s["status"], s.get("duplicate")) for s in statuses] == \
+        [("success", False), ("success", False), ("success", True)]
+    assert statuses[0]["journal_id"] == statuses[2]["journal_id"]
+    assert len(stored) == 2
+    assert summary == {"status": "done", "total": 3, "succeeded": 3, "failed": 0}
+
+
+@pytest.mark.parametrize("chunk_size", [10, 1])
+def test_repeat_of_a_failed_line_is_an_error(ingest, chunk_size):
+    ingest.failing.add("a")
+    statuses, summary, stored = ingest(["a", "b", "a"], chunk_size=chunk_size)
+    assert [s["status"] for s in statuses] == ["error", "success", "error"]
+    assert statuses[2]["message"].startswith("Duplicate of line 1, which failed: Analysis failed")
+    assert [row["summary"] for row in stored] == ["summary of b"]
+    assert summary == {"status": "done", "total": 3, "succeeded": 1, "failed": 2}
+
+
+@pytest.mark.parametrize("created_at, expected", [
+    ("2024-06-01T09:30:00Z", datetime(2024, 6, 1, 9, 30)),
+    ("2024-06-01T09:30:00.250Z", datetime(2024, 6, 1, 9, 30, 0, 250000)),
+    ("2024-06-01T11:30:00+02:00", datetime(2024, 6, 1, 9, 30)),
+    ("2024-06-01T09:30:00", datetime(2024, 6, 1, 9, 30)),
+])
+def test_created_at_is_stored_as_naive_utc(ingest, created_at, expected):
+    statuses, summary, stored = ingest([{"journal_text": "a", "created_at": created_at}])
+    assert statuses[0]["status"] == "success"
+    assert stored[0]["created_at"] == expected
+
+
+def test_same_text_on_different_days_is_stored_per_day(ingest):
+    statuses, summary, stored = ingest([
+        {"journal_text": "Felt tired today.", "created_at": "2024-06-03T08:00:00Z"},
+        {"journal_text": "Felt tired today.", "created_at": "2024-06-04T08:00:00Z"},
+        {"journal_text": "Felt tired today.", "created_at": "2024-06-04T21:00:00Z"},
+    ])
+    assert [(s["status"], s.get("duplicate")) for s in statuses] == \
+        [("success", False), ("success", False), ("success", True)]
+    assert len(stored) == 2
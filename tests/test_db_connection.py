@@ -0,0 +1,75 @@
+import psycopg2
+import pytest
+
+from benchmarks.fakes import FakePgConnection, fake_postgres_driver
+from services import db_connection
+from services.db_connection import ConnectionPool, PoolTimeout
+
+
+def _pool(maxconn: int = 2) -> ConnectionPool:
+    # check_after=0: every reused connection is liveness-checked
+    return ConnectionPool(minconn=0, maxconn=maxconn, timeout=0.2, max_lifetime=3600, max_idle=3600,
+                          check_after=0)
+
+
+def _break(conn: FakePgConnection, error: Exception):
+    """Every statement and rollback on conn raises error, like a connection the server dropped."""
+    def fail(*args, **kwargs):
+        raise error
+    cursor = conn.cursor()
+    cursor.execute = fail
+    conn.cursor = lambda: cursor
+    conn.rollback = fail
+
+
+@pytest.mark.parametrize("error", [psycopg2.InterfaceError("connection already closed"), RuntimeError("boom")])
+def test_failed_liveness_check_frees_the_slot(error):
+    with fake_postgres_driver():
+        pool = _pool(maxconn=1)
+        for _ in range(5):
+            conn = pool.getconn()
+            pool.putconn(conn)
+            _break(conn, error)
+        conn = pool.getconn()
+        assert pool.stats()["size"] == 1
+        pool.putconn(conn)
+
+
+def test_failed_prepare_on_a_new_connection_frees_the_slot(monkeypatch):
+    monkeypatch.setitem(db_connection._prepared_statements, "bench_stmt", "bench_stmt AS SELECT 1")
+    opened = []
+
+    class _Driver:
+        @staticmethod
+        def connect(**kwargs):
+            conn = FakePgConnection()
+            if not opened:
+                _break(conn, psycopg2.InterfaceError("connection already closed"))
+            opened.append(conn)
+            return conn
+
+    with fake_postgres_driver():
+        monkeypatch.setattr(db_connection, "psycopg2", _Driver)
+        pool = _pool(maxconn=1)
+        with pytest.raises(psycopg2.InterfaceError):
+            pool.getconn()
+        assert pool.stats()["size"] == 0
+
+        conn = pool.getconn()  # the slot is available again
+        assert pool.is_prepared(conn, "bench_stmt")
+        pool.putconn(conn)
+
+
+def test_pool_does_not_shrink_to_zero_after_repeated_failures():
+    with fake_postgres_driver():
+        pool = _pool(maxconn=2)
+        for _ in range(10):
+            conns = [pool.getconn(), pool.getconn()]
+            for conn in conns:
+                pool.putconn(conn)
+                _break(conn, psycopg2.InterfaceError("connection already closed"))
+        conns = [pool.getconn(), pool.getconn()]
+        with pytest.raises(PoolTimeout):
+            pool.getconn(timeout=0.05)
+        for conn in conns:
+            pool.putconn(conn)
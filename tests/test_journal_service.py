@@ -0,0 +1,54 @@
+from datetime import date, datetime, timedelta
+
+import config
+from services import journal_service
+from services.journal_service import analyze_store_and_embed_journal, journal_id_for
+
+DATA = {"user_id": "u1", "journal_text": "Slept badly again."}
+
+
+def _offline(monkeypatch, stored: set, written: list):
+    monkeypatch.setattr(journal_service, "existing_journals", lambda user_id, ids: stored & set(ids))
+    monkeypatch.setattr(journal_service, "_analyze_store_and_embed",
+                        lambda user_id, journal_id, text: written.append(journal_id))
+
+
+def test_stored_journal_is_a_duplicate(monkeypatch):
+    written = []
+    _offline(monkeypatch, {journal_id_for("u1", DATA["journal_text"])}, written)
+    body, status = analyze_store_and_embed_journal(DATA)
+    assert (status, body["duplicate"], written) == (200, True, [])
+
+
+def test_retry_writes_after_waiting_for_a_stuck_write(monkeypatch):
+    journal_id = journal_id_for("u1", DATA["journal_text"])
+    written = []
+    _offline(monkeypatch, set(), written)
+    monkeypatch.setattr(config, "JOURNAL_IN_FLIGHT_WAIT", 0.01)
+
+    assert journal_service._claim(journal_id) is None  # a first request still writing
+    try:
+        body, status = analyze_store_and_embed_journal(DATA)
+        assert (status, body["duplicate"], written) == (200, False, [journal_id])
+        # The retry leaves the first request's claim alone
+        assert journal_service._claim(journal_id) is not None
+    finally:
+        journal_service._release(journal_id)
+
+
+def test_content_id_is_per_utc_day():
+    text = "Felt tired today."
+    monday, tuesday = date(2024, 6, 3), date(2024, 6, 4)
+    assert journal_id_for("u1", text, day=monday) == journal_id_for("u1", "  Felt tired\ttoday. ", day=monday)
+    assert journal_id_for("u1", text, day=monday) != journal_id_for("u1", text, day=tuesday)
+    assert journal_id_for("u1", text) == journal_id_for("u1", text, day=datetime.utcnow().date())
+    # A client idempotency key names the journal on its own
+    assert journal_id_for("u1", text, "k1", day=monday) == journal_id_for("u1", text, "k1", day=tuesday)
+
+
+def test_same_text_on_a_later_day_is_stored(monkeypatch):
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    written = []
+    _offline(monkeypatch, {journal_id_for("u1", DATA["journal_text"], day=yesterday)}, written)
+    body, status = analyze_store_and_embed_journal(DATA)
+    assert (status, body["duplicate"], written) == (200, False, [body["journal_id"]])
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeResponse
+from services import clients
+from services.metadata_extraction import extract_query_filters_llm
+
+
+class _StubGemini:
+    def __init__(self, reply: dict):
+        self.reply = reply
+
+    def generate_content(self, prompt):
+        return FakeResponse(json.dumps(self.reply))
+
+
+def _extract(monkeypatch, reply: dict) -> dict:
+    monkeypatch.setattr(clients, "gemini", lambda *args, **kwargs: _StubGemini(reply))
+    return extract_query_filters_llm("what did I write then?")
+
+
+def test_iso_date_becomes_single_day_range(monkeypatch):
+    filters = _extract(monkeypatch, {"date": "2024-06-03", "people": ["Sam"]})
+    assert filters == {"people": ["Sam"], "date_from": "2024-06-03", "date_to": "2024-06-03"}
+
+
+@pytest.mark.parametrize("value", ["June 3rd", "2024-06", "yesterday", "2024-13-01", ""])
+def test_non_iso_date_is_dropped(monkeypatch, value):
+    filters = _extract(monkeypatch, {"date": value, "tags": ["work"]})
+    assert filters == {"tags": ["work"]}
@@ -0,0 +1,15 @@
+from datetime import datetime
+
+from benchmarks.fakes import FakeFirestore
+from services import clients, context_cache, persona_entry
+
+
+def test_written_through_persona_has_aware_utc_timestamps(monkeypatch):
+    monkeypatch.setattr(clients, "firestore", lambda: FakeFirestore())
+    persona_entry.store_persona_entry({"user_id": "persona-u1", "persona": {"name": "Sam"}})
+    try:
+        cached = persona_entry.get_persona_by_user_id("persona-u1")
+        for field in ("created_at", "last_updated"):
+            assert datetime.fromisoformat(cached[field]).utcoffset().total_seconds() == 0
+    finally:
+        context_cache.invalidate("persona-u1", "persona")
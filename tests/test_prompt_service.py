@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeResponse
+from services import clients, prompt_service
+from services.prompt_service import COMBINED_TASK_INSTRUCTIONS, TASK_INSTRUCTIONS
+
+CONTEXT = "Journals:\n- Long week at work.\n\nUser: I can't switch off in the evenings.\n"
+
+
+class _StubGemini:
+    """Answers each generate_content call with the next scripted text, recording the prompts."""
+
+    def __init__(self, *texts):
+        self.texts = list(texts)
+        self.prompts = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return FakeResponse(self.texts.pop(0))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return self.generate_content(prompt, **kwargs)
+
+
+def _stub(monkeypatch, *texts) -> _StubGemini:
+    stub = _StubGemini(*texts)
+    monkeypatch.setattr(clients, "gemini", lambda *args, **kwargs: stub)
+    return stub
+
+
+def test_combined_turn_returns_reply_and_summary(monkeypatch):
+    turn = {"reply": "That sounds draining.", "summary": "Work stress.", "metadata": {"mood": "tired"}}
+    stub = _stub(monkeypatch, json.dumps(turn))
+    reply, summary = prompt_service.call_gemini_turn(CONTEXT + COMBINED_TASK_INSTRUCTIONS)
+    assert reply == "That sounds draining."
+    assert summary == {"summary": "Work stress.", "metadata": {"mood": "tired"}}
+    assert len(stub.prompts) == 1
+
+
+def test_fenced_json_is_parsed(monkeypatch):
+    turn = {"reply": "That sounds draining.", "summary": "Work stress.", "metadata": {}}
+    stub = _stub(monkeypatch, "```json\n" + json.dumps(turn) + "\n```")
+    reply, summary = prompt_service.call_gemini_turn(CONTEXT + COMBINED_TASK_INSTRUCTIONS)
+    assert (reply, summary) == ("That sounds draining.", {"summary": "Work stress.", "metadata": {}})
+    assert len(stub.prompts) == 1
+
+
+@pytest.mark.parametrize("text", [
+    '{"reply": "That sounds draining. What helps you',
+    '```json\n{"reply": "That sounds draining.", "summary": "Work',
+    "That sounds draining.",
+])
+def test_undecodable_response_falls_back_to_a_plain_call(monkeypatch, text):
+    stub = _stub(monkeypatch, text, "What helps you unwind?")
+    reply, summary = prompt_service.call_gemini_turn(CONTEXT + COMBINED_TASK_INSTRUCTIONS)
+    assert (reply, summary) == ("What helps you unwind?", None)
+    assert stub.prompts[1] == CONTEXT + TASK_INSTRUCTIONS
+
+
+def test_json_without_reply_falls_back_to_a_plain_call(monkeypatch):
+    stub = _stub(monkeypatch, json.dumps({"summary": "Work stress."}), "That sounds draining.")
+    reply, summary = prompt_service.call_gemini_turn(CONTEXT + COMBINED_TASK_INSTRUCTIONS)
+    assert (reply, summary) == ("That sounds draining.", None)
+    assert stub.prompts[1] == CONTEXT + TASK_INSTRUCTIONS
+
+
+def test_json_without_reply_falls_back_async(monkeypatch):
+    stub = _stub(monkeypatch, json.dumps({"reply": "  "}), "That sounds draining.")
+    reply, summary = asyncio.run(prompt_service.call_gemini_turn_async(CONTEXT + COMBINED_TASK_INSTRUCTIONS))
+    assert (reply, summary) == ("That sounds draining.", None)
+    assert stub.prompts[1] == CONTEXT + TASK_INSTRUCTIONS
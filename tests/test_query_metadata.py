@@ -0,0 +1,89 @@
+from datetime import date
+
+import pytest
+
+from services.query_metadata import _stem, extract_local, parse_date_range
+
+TODAY = date(2024, 6, 12)  # a Wednesday
+
+
+# ---------------- STEMMING ----------------
+
+
+@pytest.mark.parametrize("word", ["stress", "stressed", "stressful", "stresses", "stressing"])
+def test_stress_forms_share_a_stem(word):
+    assert _stem(word) == _stem("stress")
+
+
+def test_double_s_is_not_stripped_as_plural():
+    assert _stem("class") == _stem("classes") == "class"
+
+
+# ---------------- DATE PHRASES ----------------
+@pytest.mark.parametrize("text, expected", [
+    ("how was I in March", (date(2024, 3, 1), date(2024, 3, 31))),
+    ("march 5th", (date(2024, 3, 5), date(2024, 3, 5))),
+    ("in december", (date(2023, 12, 1), date(2023, 12, 31))),  # a future month means last year's
+    ("feb 2023", (date(2023, 2, 1), date(2023, 2, 28))),
+    ("what happened in may", (date(2024, 5, 1), date(2024, 5, 31))),
+    ("may I ask something", (None, None)),
+])
+def test_month_names(text, expected):
+    assert parse_date_range(text, TODAY) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("since March", (date(2024, 3, 1), TODAY)),
+    ("anything since march 5th", (date(2024, 3, 5), TODAY)),
+    ("since may", (date(2024, 5, 1), TODAY)),
+    ("since december", (date(2023, 12, 1), TODAY)),
+])
+def test_since_month_runs_to_today(text, expected):
+    assert parse_date_range(text, TODAY) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("yesterday", (date(2024, 6, 11), date(2024, 6, 11))),
+    ("day before yesterday", (date(2024, 6, 10), date(2024, 6, 10))),
+    ("today", (TODAY, TODAY)),
+    ("3 days ago", (date(2024, 6, 9), date(2024, 6, 9))),
+    ("two weeks ago", (date(2024, 5, 27), date(2024, 6, 2))),
+    ("a month ago", (date(2024, 5, 1), date(2024, 5, 31))),
+    ("past 3 days", (date(2024, 6, 10), TODAY)),
+    ("past week", (date(2024, 6, 6), TODAY)),
+    ("last week", (date(2024, 6, 3), date(2024, 6, 9))),
+    ("this week", (date(2024, 6, 10), TODAY)),
+    ("last month", (date(2024, 5, 1), date(2024, 5, 31))),
+    ("this month", (date(2024, 6, 1), TODAY)),
+    ("last year", (date(2023, 1, 1), date(2023, 12, 31))),
+    ("on monday", (date(2024, 6, 10), date(2024, 6, 10))),
+    ("last wednesday", (date(2024, 6, 5), date(2024, 6, 5))),
+    ("2024-02-29", (date(2024, 2, 29), date(2024, 2, 29))),
+    ("how do I feel", (None, None)),
+])
+def test_relative_dates(text, expected):
+    assert parse_date_range(text, TODAY) == expected
+
+
+# ---------------- LEXICON ----------------
+@pytest.mark.parametrize("query, key, expected", [
+    ("when was I anxious", "emotions", ["anxious"]),
+    ("times I felt stressed", "emotions", ["stressed"]),
+    ("what stresses me out", "emotions", ["stressed"]),
+    ("feeling overwhelmed", "emotions", ["stressed"]),
+    ("I was so happy", "emotions", ["happy"]),
+    ("journals about my boss", "tags", ["work"]),
+    ("going to the gym", "tags", ["exercise"]),
+    ("could not sleep", "tags", ["sleep"]),
+])
+def test_lexicon_matches(query, key, expected):
+    assert extract_local(query, today=TODAY).get(key) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "the content of my journal",
+    "the rest of the day",
+])
+def test_lexicon_false_positives(query):
+    filters = extract_local(query, today=TODAY)
+    assert "emotions" not in filters and "tags" not in filters
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from benchmarks.fakes import FakeFirestore
+from services import clients, timeline
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    ("2024-06-01", "2024-06-30", (datetime(2024, 6, 1), datetime(2024, 7, 1), "<")),
+    ("2024-06-01T00:00:00Z", "2024-06-30T23:59:59Z",
+     (datetime(2024, 6, 1), datetime(2024, 6, 30, 23, 59, 59), "<=")),
+    ("2024-06-01T02:00:00+02:00", None, (datetime(2024, 6, 1), None, "<=")),
+])
+def test_parse_range(start, end, expected):
+    assert timeline.parse_range(start, end) == expected
+
+
+def test_parse_range_rejects_malformed_values():
+    with pytest.raises(ValueError):
+        timeline.parse_range("June 1st")
+
+
+def test_list_page_with_utc_bounds(monkeypatch):
+    firestore = FakeFirestore()
+    monkeypatch.setattr(clients, "firestore", lambda: firestore)
+    journals = firestore.collection("users").document("u1").collection("journals")
+    for day in (30, 31):
+        journals.document(f"may-{day}").set({"summary": "s", "created_at": datetime(2024, 5, day, 12)})
+    for day in (1, 2):
+        journals.document(f"june-{day}").set({"summary": "s", "created_at": datetime(2024, 6, day, 12)})
+
+    page = timeline.list_page("u1", "journals", ["summary"], start="2024-05-31T00:00:00Z",
+                              end="2024-06-01T23:59:59Z")
+    assert [doc_id for doc_id, _ in page["items"]] == ["june-1", "may-31"]